@@ -0,0 +1,326 @@
+# benchmark.py
+
+''' Code contains the benchmark suite of the DataHandler -> PCAMachine ->
+ConfusionMachine pipeline on synthetic Kubo Toyabe data. Every case records
+the wall time and the peak memory allocated, and the results are saved as
+JSON baselines that later runs are compared against.
+
+Run from the repository folder, e.g.:
+    python -m pca_exp.benchmark --sizes small medium --save base.json
+    python -m pca_exp.benchmark --sizes small medium --compare base.json
+'''
+
+# libraries
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import datetime
+import tracemalloc
+import subprocess
+
+import numpy as np
+
+# internal modules
+
+from pca_exp.data_handler import DataHandler
+from pca_exp.pca_machine import PCAMachine
+from pca_exp.confusion_machine import ConfusionMachine
+from pca_exp.generate_samples.kubo_toyabe import generateKT
+from pca_exp.utils.instrument import quiet
+
+# Sizes of the synthetic data: number of time bins of each measurement,
+# number of measurements of each batch, number of batches and number of
+# files written for load_batch.
+SIZES = {
+    'small': {'time_bins': 300, 'measurements': 100, 'batches': 1,
+              'files': 100},
+    'medium': {'time_bins': 1000, 'measurements': 1000, 'batches': 2,
+               'files': 500},
+    'large': {'time_bins': 2000, 'measurements': 5000, 'batches': 4,
+              'files': 2000},
+}
+
+
+class Workload:
+    r''' Class which holds the synthetic data of one size: batches generated
+    by generateKT with fixed seeds and text files of the first batch written
+    to a temporary folder.
+
+    Params:
+        size: dictionary of SIZES.
+
+        loc: string, folder of the files.
+    '''
+
+    def __init__(self, size, loc):
+        self.size = size
+        self.loc = loc
+        self.t = np.linspace(0, 12, size['time_bins'])
+        self.er = 0.002 * (np.exp(0.2 * self.t) + 0.001)
+
+        self.batches = []
+        self.sig = []
+        for b in range(size['batches']):
+            np.random.seed(b)
+            batch, sig, _ = generateKT(self.t, 0.26, 0, (0.1, 0.5),
+                                       (0.1, 0.5), self.er,
+                                       size['measurements'],
+                                       ranges='minmax')
+            self.batches.append(batch)
+            self.sig.append(sig)
+
+        os.makedirs(loc, exist_ok=True)
+        for j in range(size['files']):
+            np.savetxt(os.path.join(loc, 'kt' + str(j) + '.dat'),
+                       self.batches[0][:,j % size['measurements'],:],
+                       fmt='%.8e')
+
+    def handler(self):
+        r''' Function returns a DataHandler holding copies of the batches.
+        '''
+        dh = DataHandler()
+        for batch in self.batches:
+            dh.load_batch_from_array(batch.copy())
+        return dh
+
+    def prepared(self):
+        r''' Function returns a DataHandler with the prepared data of all
+        batches.
+        '''
+        dh = self.handler()
+        dh.prepare_XYE_PCA(batch_ind=list(range(len(self.batches))))
+        return dh
+
+
+def _setup_pca(w):
+    machine = PCAMachine(w.prepared())
+    machine.perform_pca(n_components=5)
+    return machine
+
+def _confusion_scan(w, machine):
+    param = np.concatenate(w.sig)
+    cm = ConfusionMachine([5], [None], seed=0)
+    cm.perform_confusion_scan(machine.pc_scores[0], param,
+                              np.linspace(0.15, 0.45, 7), epochs=20)
+
+# Cases as name: (setup, run). setup(workload) returns the state passed to
+# run(workload, state), so that only run is measured.
+CASES = {
+    'generateKT': (
+        lambda w: None,
+        lambda w, s: generateKT(w.t, 0.26, 0, (0.1, 0.5), (0.1, 0.5), w.er,
+                                w.size['measurements'], ranges='minmax')),
+    'load_batch': (
+        lambda w: DataHandler(),
+        lambda w, dh: dh.load_batch((0, w.size['files'] - 1), 'kt', '.dat',
+                                    w.loc + os.sep)),
+    'slice_batch': (
+        lambda w: w.handler(),
+        lambda w, dh: [dh.slice_batch(b, x_vals=(0.5, 10))
+                       for b in range(len(w.batches))]),
+    'bin_data': (
+        lambda w: w.handler(),
+        lambda w, dh: dh.bin_data(np.linspace(0.1, 11.9,
+                                              w.size['time_bins'] // 2),
+                                  batch_ind=list(range(len(w.batches))))),
+    'filter_data': (
+        lambda w: w.handler(),
+        lambda w, dh: dh.filter_data(batch_ind=list(range(len(w.batches))))),
+    'prepare_XYE_PCA': (
+        lambda w: w.handler(),
+        lambda w, dh: dh.prepare_XYE_PCA(
+            batch_ind=list(range(len(w.batches))))),
+    'perform_pca': (
+        lambda w: PCAMachine(w.prepared()),
+        lambda w, machine: machine.perform_pca()),
+    'confusion_scan': (
+        _setup_pca,
+        _confusion_scan),
+}
+
+def measure(workload, setup, run, repeat=3):
+    r''' Function returns the wall times of repeat runs of a case and the
+    peak memory allocated by one more run traced with tracemalloc. The state
+    is set up again before every run and progress messages are silenced.
+    '''
+    times = []
+    for _ in range(repeat + 1):
+        with quiet():
+            state = setup(workload)
+            if len(times) < repeat:
+                start = time.perf_counter()
+                run(workload, state)
+                times.append(time.perf_counter() - start)
+            else:
+                tracemalloc.start()
+                run(workload, state)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+    return {'time': min(times), 'time_median': float(np.median(times)),
+            'times': times, 'peak_bytes': peak}
+
+def _commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                             capture_output=True, text=True, timeout=10,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run_suite(sizes=('small',), cases=None, repeat=3, verbose=True):
+    r''' Function runs the benchmark cases for the given sizes.
+
+    Args:
+        sizes: list of names of SIZES.
+
+        cases: list of names of CASES. All cases are run if None.
+
+        repeat: integer number of timed runs of each case; the minimum is
+        reported as 'time'.
+
+        verbose: if True, every result is printed when it is measured.
+
+    Returns:
+        Dictionary with 'meta' (commit, date, versions) and 'results', a list
+        of dictionaries with the case, size, size parameters, times and peak
+        memory.
+    '''
+    cases = list(CASES) if cases is None else cases
+    for name in cases:
+        if name not in CASES:
+            raise ValueError('Case ' + name + ' is not one of '
+                             + str(list(CASES)) + '.')
+
+    out = {'meta': {'commit': _commit(),
+                    'date': datetime.datetime.now().isoformat(),
+                    'python': platform.python_version(),
+                    'numpy': np.__version__,
+                    'machine': platform.machine(),
+                    'cpus': os.cpu_count(),
+                    'repeat': repeat},
+           'results': []}
+
+    for size_name in sizes:
+        loc = tempfile.mkdtemp(prefix='pca_exp_bench_')
+        try:
+            workload = Workload(SIZES[size_name], loc)
+            for name in cases:
+                setup, run = CASES[name]
+                res = measure(workload, setup, run, repeat)
+                res.update({'case': name, 'size': size_name,
+                            'params': SIZES[size_name]})
+                out['results'].append(res)
+                if verbose:
+                    print(_format_row(res))
+        finally:
+            shutil.rmtree(loc, ignore_errors=True)
+
+    return out
+
+def _format_row(res, extra=''):
+    return '{:<16} {:<8} {:>10.4f} s {:>10.2f} MB{}'.format(
+        res['case'], res['size'], res['time'], res['peak_bytes'] / 2**20,
+        extra)
+
+def save_results(results, path):
+    r''' Function writes the results of run_suite to a JSON file.
+    '''
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1)
+
+def load_results(path):
+    r''' Function reads results written by save_results.
+    '''
+    with open(path) as f:
+        return json.load(f)
+
+def compare(results, baseline, tolerance=0.1, min_time=1e-3):
+    r''' Function compares results of run_suite with a baseline.
+
+    Args:
+        results, baseline: dictionaries returned by run_suite or
+        load_results.
+
+        tolerance: float relative change of time or peak memory above which
+        a case is flagged as a regression (or an improvement below).
+
+        min_time: float, changes of time smaller than min_time seconds are
+        not flagged, as they are dominated by timer noise.
+
+    Returns:
+        List of dictionaries with the case, size, ratios of time and peak
+        memory to the baseline and 'status': 'slower', 'faster' or 'same'
+        (for time), 'more memory' is appended if the peak memory grew. Cases
+        missing in the baseline are skipped.
+    '''
+    base = {(r['case'], r['size']): r for r in baseline['results']}
+    rows = []
+
+    for res in results['results']:
+        ref = base.get((res['case'], res['size']))
+        if ref is None:
+            continue
+
+        t_ratio = res['time'] / ref['time'] if ref['time'] else np.inf
+        m_ratio = (res['peak_bytes'] / ref['peak_bytes']
+                   if ref['peak_bytes'] else np.inf)
+
+        if abs(res['time'] - ref['time']) < min_time:
+            status = 'same'
+        elif t_ratio > 1 + tolerance:
+            status = 'slower'
+        elif t_ratio < 1 - tolerance:
+            status = 'faster'
+        else:
+            status = 'same'
+        if m_ratio > 1 + tolerance:
+            status += ', more memory'
+
+        rows.append({'case': res['case'], 'size': res['size'],
+                     'time_ratio': t_ratio, 'memory_ratio': m_ratio,
+                     'status': status})
+
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of pca_exp.')
+    parser.add_argument('--sizes', nargs='+', default=['small'],
+                        choices=list(SIZES))
+    parser.add_argument('--cases', nargs='+', default=None,
+                        choices=list(CASES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', help='JSON file the results are saved to.')
+    parser.add_argument('--compare', help='JSON baseline to compare to.')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('--min-time', type=float, default=1e-3)
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.sizes, args.cases, args.repeat)
+
+    if args.save:
+        save_results(results, args.save)
+
+    if args.compare:
+        print('\nCompared to ' + args.compare + ':')
+        regressions = 0
+        for row in compare(results, load_results(args.compare),
+                           args.tolerance, args.min_time):
+            print('{:<16} {:<8} time x{:.2f} memory x{:.2f} {}'.format(
+                row['case'], row['size'], row['time_ratio'],
+                row['memory_ratio'], row['status']))
+            if 'slower' in row['status'] or 'memory' in row['status']:
+                regressions += 1
+        return 1 if regressions else 0
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,33 +1,75 @@
 # confusion_machine.py
 
-import tensorflow as tf
 import numpy as np
 
+# internal modules
+
+from pca_exp.utils.mlp import StackedMLP
+from pca_exp.utils.scheduler import iter_threshold_scan
+from pca_exp.utils.instrument import stage, is_quiet
+
+BACKENDS = ('numpy', 'tensorflow')
+
 class ConfusionMachine:
+    r''' Class which performs the confusion scheme on PC scores: for every
+    threshold N_c of a parameter a small classifier is trained to separate
+    measurements with parameter below and above N_c.
+
+    Params:
+        neuron_vector: list of integers, number of input features followed
+        by the number of neurons of each hidden layer.
 
-    def __init__(self, neuron_vector, activation_vector):
+        activation_vector: list of names of the activations of each hidden
+        layer followed by the activation of the output layer.
+
+        backend: string, 'numpy' trains the classifiers with the pure numpy 
+        utils.mlp.StackedMLP, 'tensorflow' with keras. TensorFlow is only
+        imported with the 'tensorflow' backend.
+
+        seed: seed of the initial weights and batch shuffling of the 'numpy'
+        backend.
+    '''
+
+    def __init__(self, neuron_vector, activation_vector, backend='numpy',
+                 seed=None):
         
-        self.conf_model = tf.keras.models.Sequential()
-        self.conf_model.add(tf.keras.Input(shape=(neuron_vector[0],)))
+        if backend not in BACKENDS:
+            raise ValueError('backend should be one of ' + str(BACKENDS) 
+                             + '.')
+
+        self.neuron_vector = neuron_vector
+        self.activation_vector = activation_vector
+        self.backend = backend
+        self.seed = seed
+        self.stacked_models = {}
 
-        for i in range(1, len(neuron_vector)):
-            self.conf_model.add(tf.keras.layers.Dense(neuron_vector[i], 
-                                    activation=activation_vector[i-1]))
+        if backend == 'numpy':
+            self.conf_model = StackedMLP(neuron_vector, activation_vector,
+                                         seed=seed)
+            self.loss_conf = None
+            return
 
-        self.conf_model.add(tf.keras.layers.Dense(2, 
-                                  activation=activation_vector[-1]))
+        from pca_exp.utils import tf_backend
+
+        self.conf_model = tf_backend.build_model(neuron_vector, 
+                                                 activation_vector)
         
-        self.loss_conf = tf.keras.losses.SparseCategoricalCrossentropy(
-            from_logits=True)
+        self.loss_conf = tf_backend.loss()
 
-        self.conf_model.save_weights('weights.h5')
+        self.init_weights = self.conf_model.get_weights()
 
     def perform_confusion_on_pcs(self, pca_machine, param, 
                                     param_range, res_idx=0, up_to=5):
 
+        return self.perform_confusion_external(
+            pca_machine.pc_scores[res_idx], param, param_range, up_to=up_to)
+
+    @stage()
+    def perform_confusion_external(self, pcs, param, param_range, up_to=5):
+
         acc = []
-        
-        pc_scores = pca_machine.pc_scores[res_idx][:up_to,:].T
+
+        pc_scores = pcs[:up_to,:].T
         pc_size = pc_scores.shape[0]
 
         for N_c in param_range:
@@ -35,42 +77,206 @@ class ConfusionMachine:
             labels = np.zeros((pc_size,))
             labels[idx_less] = np.ones((idx_less.size,))
 
+            if self.backend == 'numpy':
+                self.conf_model.reset()
+                hist = self.conf_model.fit(pc_scores, 
+                                           labels[np.newaxis].T.astype(int))
+                acc.append(hist[-1])
+                continue
+
             self.conf_model.compile(optimizer='adam',
                                     loss=self.loss_conf,
                                     metrics=['accuracy'])
-            hist = self.conf_model.fit(pc_scores, labels, epochs=200)
+            hist = self.conf_model.fit(pc_scores, labels, epochs=200,
+                                       verbose=0 if is_quiet() else 'auto')
 
             acc.append(hist.history.get('accuracy')[-1]) 
 
-            self.conf_model.load_weights('weights.h5')
+            self.conf_model.set_weights(self.init_weights)
 
         return acc
 
-    def perform_confusion_external(self, pcs, param, param_range, up_to=5):
+    @stage()
+    def perform_confusion_scan(self, pcs, param, param_range, up_to=5,
+                               epochs=200, batch_size=32, patience=None,
+                               min_delta=1e-3, verbose=0):
+        r''' Function that performs the confusion scan over all thresholds of
+        param_range in a single training. One independent copy of the network
+        (same neuron_vector and activation_vector) is built for every
+        threshold, and all copies are stacked into one batched model trained
+        on the labels of all thresholds at once. The stacked model and its
+        initial weights are kept in memory and reset between scans. With the
+        'numpy' backend the networks are trained independently of each other,
+        exactly as in separate trainings.
 
-        acc = []
+        Args:
+            pcs: 2D numpy array of PC scores with indices [i, j], where i runs
+            through PC numbers and j runs through measurements, e.g.
+            pca_machine.pc_scores[res_idx].
+
+            param: 1D numpy array of the parameter of each measurement.
+
+            param_range: list or 1D numpy array of thresholds N_c.
+            Measurements with param < N_c are labelled 1.
+
+            up_to: integer number of PC scores used as features.
+
+            epochs: integer maximal number of training epochs.
+
+            batch_size: integer size of the training batches.
+
+            patience: integer. If given, the training stops when the mean
+            accuracy over thresholds did not improve by min_delta during
+            patience epochs.
+
+            min_delta: float, minimal improvement of the accuracy for early
+            stopping.
+
+            verbose: verbosity of keras fit ('tensorflow' backend only), 0
+            in quiet mode.
+
+        Returns:
+            List of the training accuracies of each threshold.
+        '''
 
         pc_scores = pcs[:up_to,:].T
-        pc_size = pc_scores.shape[0]
+        labels = confusion_labels(param, param_range)
 
-        for N_c in param_range:
-            idx_less = np.argwhere(param < N_c)[:,0]
-            labels = np.zeros((pc_size,))
-            labels[idx_less] = np.ones((idx_less.size,))
+        model = self.stacked_model(labels.shape[1])
 
-            self.conf_model.compile(optimizer='adam',
-                                    loss=self.loss_conf,
-                                    metrics=['accuracy'])
-            hist = self.conf_model.fit(pc_scores, labels, epochs=200)
+        if self.backend == 'numpy':
+            model.fit(pc_scores, labels, epochs=epochs, batch_size=batch_size,
+                      patience=patience, min_delta=min_delta)
+            return list(model.accuracy(pc_scores, labels))
 
-            acc.append(hist.history.get('accuracy')[-1]) 
+        from pca_exp.utils import tf_backend
 
-            self.conf_model.load_weights('weights.h5')
+        callbacks = []
+        if patience is not None:
+            callbacks.append(tf_backend.early_stopping(patience, min_delta))
 
-        return acc
+        model.compile(optimizer='adam', loss=self.loss_conf,
+                      metrics=['accuracy'])
+        model.fit(pc_scores, labels, epochs=epochs, batch_size=batch_size,
+                  callbacks=callbacks, verbose=0 if is_quiet() else verbose)
+
+        logits = model.predict(pc_scores, verbose=0)
+        acc = np.mean(np.argmax(logits, axis=2) == labels, axis=0)
+
+        return list(acc)
+
+    @stage()
+    def perform_confusion_parallel(self, pcs, param, param_range, up_to=5,
+                                   n_seeds=1, seed=None, workers=None,
+                                   blas=1, callback=None, epochs=200,
+                                   batch_size=32, patience=None,
+                                   min_delta=1e-3):
+        r''' Function that performs the confusion scan with the thresholds of
+        param_range spread over worker processes (utils.scheduler). Every
+        threshold is trained from its own seed spawned from seed, so the
+        results are reproducible for any number of workers. With n_seeds > 1
+        several networks with different initial weights are trained on each
+        threshold, giving the mean and spread of the accuracy curve. Only the
+        'numpy' backend can be used. Workers are started with 'spawn', so
+        scripts calling it need the if __name__ == '__main__' guard.
+
+        Args:
+            pcs: 2D numpy array of PC scores with indices [i, j], where i runs
+            through PC numbers and j runs through measurements.
+
+            param: 1D numpy array of the parameter of each measurement.
+
+            param_range: list or 1D numpy array of thresholds N_c.
+
+            up_to: integer number of PC scores used as features.
+
+            n_seeds: integer number of networks trained on each threshold.
+
+            seed: integer seed of the scan. self.seed is used if None.
+
+            workers: integer number of worker processes (1 runs in this
+            process, None uses the default of ProcessPoolExecutor).
+
+            blas: integer number of BLAS threads of each worker, or None to
+            keep the environment of this process.
+
+            callback: function called as callback(j, acc) as soon as the
+            threshold param_range[j] is finished, with the 1D numpy array acc
+            of the accuracies of its networks.
+
+            epochs, batch_size, patience, min_delta: training parameters as in
+            perform_confusion_scan.
+
+        Returns:
+            Dictionary with 2D numpy array 'acc' of accuracies with indices
+            [j, k], where j runs through thresholds and k through seeds, and
+            1D numpy arrays 'acc_mean' and 'acc_std' over seeds.
+        '''
+
+        if self.backend != 'numpy':
+            raise ValueError("Parallel scans need the 'numpy' backend.")
+
+        seed = self.seed if seed is None else seed
+        acc = np.empty((len(param_range), n_seeds))
+
+        scan = iter_threshold_scan(pcs[:up_to,:].T, param, param_range,
+                                   self.neuron_vector, self.activation_vector,
+                                   n_seeds=n_seeds, seed=seed,
+                                   workers=workers, blas=blas, epochs=epochs,
+                                   batch_size=batch_size, patience=patience,
+                                   min_delta=min_delta)
+
+        for j, acc_j in scan:
+            acc[j] = acc_j
+            if callback is not None:
+                callback(j, acc_j)
+
+        return {'acc': acc, 'acc_mean': np.mean(acc, axis=1),
+                'acc_std': np.std(acc, axis=1)}
+
+    def stacked_model(self, no_heads):
+        r''' Function returns the model of no_heads stacked networks with
+        weights reset to their initial values. Models are built once for
+        each number of heads and kept in self.stacked_models together with
+        their initial weights.
+
+        Args:
+            no_heads: integer number of stacked networks.
+        '''
+
+        if no_heads in self.stacked_models:
+            model, weights = self.stacked_models[no_heads]
+            if self.backend == 'numpy':
+                model.reset()
+            else:
+                model.set_weights(weights)
+            return model
+
+        if self.backend == 'numpy':
+            model = StackedMLP(self.neuron_vector, self.activation_vector,
+                               no_heads=no_heads, seed=self.seed)
+            self.stacked_models[no_heads] = (model, None)
+            return model
+
+        from pca_exp.utils import tf_backend
+
+        model = tf_backend.build_stacked_model(self.neuron_vector, 
+                                               self.activation_vector, 
+                                               no_heads)
+        self.stacked_models[no_heads] = (model, model.get_weights())
 
+        return model
 
 
+def confusion_labels(param, param_range):
+    r''' Function returns the labels of the confusion scan as a 2D numpy
+    array with indices [i, j], where i runs through measurements and j
+    through thresholds: 1 if param[i] < param_range[j] and 0 otherwise.
 
+    Args:
+        param: 1D numpy array of the parameter of each measurement.
 
-            
\ No newline at end of file
+        param_range: list or 1D numpy array of thresholds.
+    '''
+    param = np.asarray(param)
+    return (param[np.newaxis].T < np.asarray(param_range)).astype(int)
@@ -4,11 +4,31 @@
 
 # libraries
 
+import os
+import shutil
+import tempfile
+import weakref
+
 import numpy as np
 
 # internal modules
 
-from pca_exp.utils.utils import find_ind_val
+from pca_exp.utils.utils import (find_ind_val, filter_plan_from_row_errors,
+                                 average_rows, quadrature_rows,
+                                 centres_to_edges,
+                                 find_bin_index, apply_bin_index, iter_chunks,
+                                 CHUNK_BYTES)
+from pca_exp.utils.loaders import load_files
+from pca_exp.utils.instrument import stage
+
+def _handler_shapes(args, kwargs, result):
+    r''' Function returns the shapes of the batches and of the last prepared
+    data of the DataHandler args[0], recorded after instrumented stages.
+    '''
+    shapes = {'batch' + str(i): b.shape for i, b in enumerate(args[0].batches)}
+    if args[0].prepared_data:
+        shapes['prepared'] = args[0].prepared_data[-1].shape
+    return shapes
 
 class DataHandler:
     r''' Class which takes the experimental data and preprocess it if 
@@ -23,22 +43,75 @@ class DataHandler:
 
         prepared_data: list of preprocessed data that can be feed to 
         pca_machine module.
+
+        prepared_plans: list of bin plans used by filter_data for each entry
+        of prepared_data.
+
+        bin_index_cache: dictionary of source-to-bin indices used by bin_data,
+        keyed by the source x grid and the bin edges.
+
+        owners: list of objects kept alive with the handler, e.g. the
+        handlers of a Pipeline whose memory-mapped files hold its arrays.
+
+        cache: optional utils.batch_cache.BatchCache instance. If given, 
+        load_batch returns batches parsed before from the same files with the
+        same options from the cache (memory-mapped, read-only) instead of 
+        parsing them again.
+
+        storage: string, 'memory' keeps batches and prepared data as numpy
+        arrays, 'mmap' writes them to memory-mapped .npy files in storage_dir,
+        so that datasets larger than memory can be processed.
+
+        storage_dir: string, folder in which the handler creates its own
+        temporary folder of memory-mapped files (storage_path). The system
+        temporary folder is used if None. Files of batches replaced by
+        bin_data are deleted at once, and the whole folder by close() or when
+        the handler is garbage collected.
+
+        chunk_size: integer number of measurements processed at once by 
+        bin_data and filter_data. If None, whole batches are processed in
+        'memory' storage and chunks of about CHUNK_BYTES in 'mmap' storage.
     '''
 
-    def __init__(self):
+    def __init__(self, cache=None, storage='memory', storage_dir=None,
+                 chunk_size=None):
+        if storage not in ('memory', 'mmap'):
+            raise ValueError("storage should be 'memory' or 'mmap'.")
+
         self.batches = []
         self.batches_names = []
         self.prepared_data = []
+        self.prepared_plans = []
+        self.bin_index_cache = {}
+        self.owners = []
+        self.cache = cache
+        self.storage = storage
+        self.storage_dir = storage_dir
+        self.chunk_size = chunk_size
+        self.storage_path = None
+        self._no_files = 0
+        self._finalizer = None
+
+    def close(self):
+        r''' Function deletes the memory-mapped files of the handler and
+        their folder. Arrays already mapped stay readable on POSIX systems
+        until they are released. Nothing happens in 'memory' storage.
+        '''
+        if self._finalizer is not None:
+            self._finalizer()
 
+    @stage(shapes=_handler_shapes)
     def load_batch(self, stsp, prenum='', ext='', loc='./', excep=[], name='',
-                   indicators=[], delimiter=None, skiprows=0):
+                   indicators=[], delimiter=None, skiprows=0, workers=None,
+                   executor='auto'):
         r''' Function that adds a batch of data to the class from a set of 
         files in one folder. The batch is stored as 3-D numpy array where
         each batch[:,:,n] matrix is a n-th measurements with columns 
         representing x and y variables and optionally standard deviation of y.
         Expected file names are of the form 'prenum' + 'N' + '.ext' with
         prenum being a string, N an integer numbering data and extension at
-        the end.  
+        the end. Files are parsed concurrently and written straight into the
+        batch array (see utils.loaders.load_files).
 
         Args:
             stsp: Tuple of two ints (start, stop) which indicate starting and 
@@ -59,23 +132,45 @@ class DataHandler:
             name: String. User can name a given batch of file (e.g. specific 
             material) so that it can be extracted later more intuitively.
             indicators: List of lists of floats (TODO: make indicators work)
-        '''
 
-        no_meas = stsp[1] - stsp[0] - len(excep) + 1
-        batch = []
-    
-        enum = np.delete(range(stsp[0], stsp[1] + 1), excep)
+            delimiter: String separating the columns in the files. Whitespace
+            if None.
+
+            skiprows: Integer number of lines skipped at the top of each file.
 
-        for meas in enum:
-            path = loc + prenum + str(meas) + ext
-            temp_mat = np.loadtxt(path, delimiter=delimiter, skiprows=skiprows)
-            batch.append(temp_mat)
+            workers: Integer number of parallel workers. Files are read one
+            after another if 1.
 
-        batch = np.transpose(batch, (1, 0, 2))    
+            executor: String, 'auto', 'thread' or 'process' pool used for 
+            parsing (see utils.loaders.load_files).
 
-        self.batches.append(np.array(batch))
+        Raises:
+            utils.loaders.BatchLoadError listing all files that could not be
+            parsed.
+        '''
+
+        enum = [meas for meas in range(stsp[0], stsp[1] + 1) 
+                if meas not in excep]
+        paths = [loc + prenum + str(meas) + ext for meas in enum]
+
+        key = None
+        batch = None
+        if self.cache is not None:
+            key = self.cache.make_key(paths, delimiter=delimiter, 
+                                      skiprows=skiprows)
+            batch = self.cache.get(key)
+
+        if batch is None:
+            batch = load_files(paths, delimiter=delimiter, skiprows=skiprows,
+                               workers=workers, executor=executor,
+                               alloc=self._allocate)
+            if self.cache is not None:
+                self.cache.put(key, batch)
+
+        self.batches.append(batch)
         self.batches_names.append(name)
 
+    @stage(shapes=_handler_shapes)
     def load_batch_from_array(self, asymm, name=''):
         r''' Function that load batch from numpy array. The array should be of
         form (i, j, k), where i iterates over different x values, j
@@ -89,13 +184,22 @@ class DataHandler:
             name: name for the batch of data
         '''
 
+        if self.storage == 'mmap' and not isinstance(asymm, np.memmap):
+            batch = self._allocate(asymm.shape)
+            for sl in iter_chunks(asymm.shape[1], self._chunk(asymm)):
+                batch[:,sl,:] = asymm[:,sl,:]
+            asymm = batch
+
         self.batches.append(asymm)
         self.batches_names.append(name)
 
-    def prepare_XYE_PCA(self, batch_ind=[0], batch_names=[]):
+    @stage(shapes=_handler_shapes)
+    def prepare_XYE_PCA(self, batch_ind=[0], batch_names=[], plan=None):
         r''' Function that prepares the choosen data batches into matrix form,
         that is all of the y, x and error vectors are presented as matrices
-        Y, X and E. (TODO: make batch_names work)
+        Y, X and E, stored as prepared_data[-1][0], [1] and [2]. The errors
+        of each measurement are summed in quadrature over each bin. 
+        (TODO: make batch_names work)
 
         Args:
             batch_ind: list of integers that specify which batches are 
@@ -103,112 +207,197 @@ class DataHandler:
 
             batch_names: alternatively, names of batches that will be
             preprocessed together (not yet implemented)
+
+            plan: 1D numpy array of bin boundaries returned by filter_data 
+            with return_plan=True. Computed from the errors if None.
         '''
 
-        a, e, _, x = self.filter_data(batch_ind=batch_ind)
+        plan, row_err, yd = self._filter_plan(batch_ind, plan)
+
+        prepared = self._allocate((3, plan.size - 1, yd))
+        self._filter_fill(batch_ind, plan, prepared[0], prepared[1], 
+                          prepared[2])
 
-        self.prepared_data.append(np.array([a, x]))
+        self.prepared_data.append(prepared)
+        self.prepared_plans.append(plan)
 
-    def filter_data(self, batch_ind=[0]):
+    @stage(shapes=_handler_shapes)
+    def filter_data(self, batch_ind=[0], plan=None, return_plan=False):
         r''' Function that re-bin the data to equalise the error in each bin.
+        Bin boundaries are found in one pass over the cumulative error sums
+        and the data is reduced over all bins at once, in chunks of
+        self.chunk_size measurements.
 
         Args:
             batch_ind: list of integers that specify which batches are 
             preprocessed together.
-        '''
 
-        # TODO write better code (this was taken from previous version of the
-        # code).
+            plan: 1D numpy array of bin boundaries returned previously with
+            return_plan=True. If given, the bins are not recomputed, so the
+            same binning can be reapplied to later batches.
 
-        t = self.batches[batch_ind[0]][:,:,0]
-        A = self.batches[batch_ind[0]][:,:,1]
-        E = self.batches[batch_ind[0]][:,:,2]
+            return_plan: if True, the bin plan is returned as the last element
+            of the output.
 
-        for batch_i in batch_ind[1:]:
-            t = np.c_[t, self.batches[batch_ind[batch_i]][:,:,0]] 
-            A = np.c_[A, self.batches[batch_ind[batch_i]][:,:,1]] 
-            E = np.c_[E, self.batches[batch_ind[batch_i]][:,:,2]]
+        Returns:
+            Tuple (A1, E1, Len1, t1) of binned y values, errors of each bin,
+            number of x values in each bin and binned x values, followed by
+            the bin plan if return_plan is True.
+        '''
 
-        xd = A.shape[0]
-        yd = A.shape[1]
+        plan, row_err, yd = self._filter_plan(batch_ind, plan)
+        Len1 = np.diff(plan)
 
-        A1 = A[0,:][np.newaxis]
-        E1 = np.array([np.sqrt(np.sum(E[0,:] ** 2) / yd)])
-        Len1 = np.array([1])
-        t1 = t[0,:][np.newaxis]
+        A1 = self._allocate((Len1.size, yd))
+        t1 = self._allocate((Len1.size, yd))
+        self._filter_fill(batch_ind, plan, A1, t1)
 
-        a = np.sum(E[0,:] ** 2)
+        E1 = np.empty(0)
+        if Len1.size:
+            E1 = np.sqrt(np.add.reduceat(row_err[:plan[-1]], plan[:-1]) 
+                         / yd) / Len1
 
-        Etemp = np.array([])
-        Atemp = np.empty([0,yd])
-        ttemp = np.empty([0,yd])
+        if return_plan:
+            return A1, E1, Len1, t1, plan
 
-        for ii in range(1, xd):
-            Etemp = np.append(Etemp, np.sum(E[ii,:] ** 2 / a))
-            Atemp = np.append(Atemp, A[ii,:][np.newaxis],axis=0)
-            ttemp = np.append(ttemp, t[ii,:][np.newaxis],axis=0)
+        return A1, E1, Len1, t1 
 
-            
-            if np.sum(1 / Etemp) > 1 or ii == xd - 1:
-                A1 = np.append(A1,(np.sum(Atemp,axis=0) / Atemp.shape[0])
-                            [np.newaxis], axis=0)
-                E1 = np.append(E1,np.sqrt(np.sum( a * Etemp) / yd) /  len(Etemp))
-                t1 = np.append(t1,(np.sum(ttemp,axis=0) / ttemp.shape[0])
-                            [np.newaxis], axis=0)
-                Len1 = np.append(Len1,Atemp.shape[0])
+    def filter_plan(self, batch_ind=[0]):
+        r''' Function returns the bin plan filter_data finds for the chosen
+        batches, a 1D numpy array of bin boundaries, without binning them.
 
-                Etemp = np.array([])
-                Atemp = np.empty([0,yd])
-                ttemp = np.empty([0,yd])
+        Args:
+            batch_ind: list of integers that specify which batches are 
+            preprocessed together.
+        '''
 
-        A1 = A1[:-1]
-        E1 = E1[:-1]
-        t1 = t1[:-1]
-        Len1 = Len1[:-1]
+        return self._filter_plan(batch_ind)[0]
 
-        return A1, E1, Len1, t1 
+    def _filter_plan(self, batch_ind, plan=None):
+        r''' Function sums the squared errors of each row over the chosen
+        batches and finds the bin plan if it is not given. Returns the plan,
+        the sums and the total number of measurements.
+        '''
 
+        row_err = 0
+        yd = 0
+        for batch_i in batch_ind:
+            batch = self.batches[batch_i]
+            for sl in iter_chunks(batch.shape[1], self._chunk(batch)):
+                row_err = row_err + np.sum(batch[:,sl,2] ** 2, axis=1)
+            yd += batch.shape[1]
+
+        if plan is None:
+            plan = filter_plan_from_row_errors(row_err)
 
+        return plan, row_err, yd
+
+    def _filter_fill(self, batch_ind, plan, A1, t1, E1=None):
+        r''' Function writes the y and x values of the chosen batches, 
+        averaged in the bins of the plan, into A1 and t1, and optionally the
+        errors of the averages of each measurement into E1.
+        '''
 
-    def bin_data(self, x_0, batch_ind=[0], batch_names=[]):
+        col = 0
+        for batch_i in batch_ind:
+            batch = self.batches[batch_i]
+            for sl in iter_chunks(batch.shape[1], self._chunk(batch)):
+                out = slice(col + sl.start, col + sl.stop)
+                A1[:,out] = average_rows(plan, batch[:,sl,1])
+                t1[:,out] = average_rows(plan, batch[:,sl,0])
+                if E1 is not None:
+                    E1[:,out] = quadrature_rows(plan, batch[:,sl,2])
+            col += batch.shape[1]
+
+    @stage(shapes=_handler_shapes)
+    def bin_data(self, x_0, batch_ind=[0], batch_names=[], edges=None,
+                 empty='nan'):
         r''' Function that bin the data to common bins. Use it if your batches
-        have different x sizes.
+        have different x sizes. Each source point is mapped to its bin in one
+        step and the y values and errors are reduced over all bins at once.
+        The source-to-bin index is cached for every distinct x grid, so 
+        batches sharing a grid reuse it.
 
         Args:
+            x_0: 1D numpy array of bin centres. The grid does not need to be 
+            uniform. Can be None if edges are given, in which case the centres
+            are placed halfway between the edges.
+
             batch_ind: list of integers that specify which batches are 
             preprocessed together.
 
             batch_names: alternatively, names of batches that will be
             preprocessed together (not yet implemented)
+
+            edges: 1D numpy array of len(x_0) + 1 increasing bin edges. Bins
+            are half-open [edges[n], edges[n+1]). If None, edges are placed
+            halfway between the centres x_0.
+
+            empty: string specifying how bins without any data points are
+            handled. 'nan' fills them with nan, 'drop' removes bins that are
+            empty in any of the batches and 'raise' raises a ValueError.
         '''
 
-        # TODO: write better code
+        if edges is None:
+            edges = centres_to_edges(x_0)
+        else:
+            edges = np.asarray(edges, dtype=float)
+            if x_0 is None:
+                x_0 = (edges[1:] + edges[:-1]) / 2
+
+        x_0 = np.asarray(x_0, dtype=float)
+        if edges.size != x_0.size + 1:
+            raise ValueError('edges should have one element more than x_0.')
 
-        dx = x_0[1] - x_0[0]
+        if empty not in ('nan', 'drop', 'raise'):
+            raise ValueError("empty should be 'nan', 'drop' or 'raise'.")
 
-        for batch_i in batch_ind:
+        indices = [self.get_bin_index(self.batches[batch_i][:,0,0], edges)
+                   for batch_i in batch_ind]
 
-            x_1 = self.batches[batch_i][:,0,0]
+        keep = np.ones(x_0.size, dtype=bool)
+        for index in indices:
+            keep *= index[2] > 0
 
-            batch_ph = np.zeros((len(x_0), self.batches[batch_i].shape[1], 3))
+        if empty == 'raise' and not keep.all():
+            raise ValueError('Bins at x = ' + str(x_0[~keep]) + ' are empty.')
 
-            h = 0
-            for x_i in x_0:
-                idx = (x_1 >= x_i - dx / 2) * (x_1 < x_i + dx / 2)
-                no = self.batches[batch_i][idx,:,1].shape[0]
-                batch_ph[h,:,1] = np.sum(self.batches[batch_i][idx,:,1],
-                                            axis=0) / no
-                batch_ph[h,:,2] = np.sqrt(np.sum(self.batches[batch_i][idx,:,2]
-                             ** 2, axis=0)) / no
-                h += 1
+        x_out = x_0[keep] if empty == 'drop' else x_0
 
-            batch_ph[:,:,0] = np.repeat(x_0[np.newaxis].T, 
-                                        self.batches[batch_i].shape[1],
-                                        axis = 1)
+        for batch_i, index in zip(batch_ind, indices):
+
+            batch = self.batches[batch_i]
+            batch_ph = self._allocate((x_out.size, batch.shape[1], 3))
+
+            for sl in iter_chunks(batch.shape[1], self._chunk(batch)):
+                y1, e1 = apply_bin_index(index, batch[:,sl,1], batch[:,sl,2])
+                if empty == 'drop':
+                    y1, e1 = y1[keep], e1[keep]
+                batch_ph[:,sl,1] = y1
+                batch_ph[:,sl,2] = e1
+                batch_ph[:,sl,0] = x_out[np.newaxis].T
 
             self.batches[batch_i] = batch_ph
-                        
+            self._release(batch)
 
+    def get_bin_index(self, x, edges):
+        r''' Function returns the index mapping points of x to bins defined
+        by edges (see utils.find_bin_index). Indices are cached in 
+        self.bin_index_cache for every distinct pair of grids.
+
+        Args:
+            x: 1D numpy array of source x values.
+
+            edges: 1D numpy array of increasing bin edges.
+        '''
+
+        key = (x.tobytes(), edges.tobytes())
+        if key not in self.bin_index_cache:
+            self.bin_index_cache[key] = find_bin_index(x, edges)
+
+        return self.bin_index_cache[key]
+                        
+    @stage(shapes=_handler_shapes)
     def slice_batch(self, batch_ind, x_inds=None, x_vals=None):
         r''' Function that cuts off the data points of a given batch. Can give
         index value or x cutoff value.
@@ -234,3 +423,58 @@ class DataHandler:
         else:
             raise Exception("Either x_inds or x_vals needs to be specified!")
 
+    def _allocate(self, shape):
+        r''' Function returns a new float array of a given shape, either in
+        memory or memory-mapped in storage_dir, depending on self.storage.
+        '''
+
+        if self.storage == 'memory':
+            return np.empty(shape)
+
+        if self.storage_path is None:
+            if self.storage_dir is not None:
+                os.makedirs(self.storage_dir, exist_ok=True)
+            self.storage_path = tempfile.mkdtemp(prefix='pca_exp_',
+                                                 dir=self.storage_dir)
+            self._finalizer = weakref.finalize(self, shutil.rmtree,
+                                               self.storage_path,
+                                               ignore_errors=True)
+
+        path = os.path.join(self.storage_path, 'array' + str(self._no_files)
+                            + '.npy')
+        self._no_files += 1
+
+        return np.lib.format.open_memmap(path, mode='w+', dtype=float, 
+                                         shape=tuple(shape))
+
+    def _release(self, array):
+        r''' Function deletes the memory-mapped file of an array replaced in
+        the handler, if the handler created it and no batch or prepared data
+        still uses it.
+        '''
+        path = getattr(array, 'filename', None)
+        if (path is None or self.storage_path is None
+                or os.path.dirname(path) != os.path.realpath(
+                    self.storage_path)):
+            return
+
+        for held in self.batches + self.prepared_data:
+            if getattr(held, 'filename', None) == path:
+                return
+
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _chunk(self, batch):
+        r''' Function returns the number of measurements of a batch processed
+        at once.
+        '''
+
+        if self.chunk_size is not None:
+            return self.chunk_size
+        if self.storage == 'memory':
+            return None
+
+        return max(1, CHUNK_BYTES // (batch.shape[0] * batch.shape[2] * 8))
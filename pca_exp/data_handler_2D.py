@@ -15,7 +15,12 @@ class DataHandler2D:
     r''' Class takes the 2D data input and prepares it for ML procedures.
 
     Attribs:
+        batches: list of 3D arrays (image stacks) with indices [i, x, y], 
+        where i runs through measurements.
 
+        prepared_data: list of 3D arrays, where prepared_data[k][0] is a 2D
+        array with indices [i, j], where i runs through pixels and j through
+        measurements.
     '''
 
     def __init__(self):
@@ -28,11 +33,22 @@ class DataHandler2D:
         '''
         self.batches.append(array)
 
+    def load_batch_from_file(self, path, mmap=True):
+        r''' Function loads a stack of images with indices [i, x, y] from a
+        .npy file. With mmap the stack is memory-mapped read-only instead of 
+        being read into memory, e.g. for PCAMachine.perform_pca_2D.
+        '''
+        self.batches.append(np.load(path, mmap_mode='r' if mmap else None))
+
     def prepare_XYE_PCA(self, batch_ind=0):
+        r''' Function that flattens the images of a stack into columns of a
+        2D array of pixels and measurements. For a contiguous stack the 
+        array is a view of it and nothing is copied.
+        '''
         data2d = self.batches[batch_ind]
         a = np.reshape(data2d, (data2d.shape[0],
                  data2d.shape[1] * data2d.shape[2])).T
 
-        self.prepared_data.append(np.array([a]))
+        self.prepared_data.append(a[np.newaxis])
 
     
\ No newline at end of file
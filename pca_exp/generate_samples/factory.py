@@ -0,0 +1,206 @@
+# factory.py
+
+''' Code contains the functions that build large synthetic datasets of
+relaxation curves (Kubo Toyabe by default, or any model of the models
+registry): a sampling plan of the parameters is split into shards, which are
+generated in a process pool and written to disk with their parameters.
+'''
+
+# libraries
+
+import os
+import re
+
+import numpy as np
+
+# internal modules
+
+from pca_exp.generate_samples.models import KT
+from pca_exp.utils.scheduler import SpawnPool
+
+METHODS = ('grid', 'uniform', 'lhs')
+
+def sampling_plan(ranges, method='grid', no_samples=None, seed=None):
+    r''' Function returns the parameters of every sample of a dataset.
+
+    Args:
+        ranges: dictionary with the names of the parameters of the model as
+        keys, e.g. 'sig', 'Lam', 'a0' and 'ab' of the default Kubo Toyabe
+        model of make_dataset. A float value fixes the parameter. Otherwise,
+        for method 'grid' the value is a 1D array of the grid values of the
+        parameter, and for methods 'uniform' and 'lhs' it is a tuple
+        (min, max).
+
+        method: string, 'grid' takes all combinations of the grid values,
+        'uniform' draws the parameters independently and uniformly, 'lhs'
+        draws a Latin hypercube sample, which stratifies each parameter into
+        no_samples equal intervals with one sample in each.
+
+        no_samples: integer number of samples of methods 'uniform' and
+        'lhs'.
+
+        seed: seed of the random sampling.
+
+    Returns:
+        Dictionary with the keys of ranges and values 1D numpy arrays of the
+        parameters of every sample.
+    '''
+    if method not in METHODS:
+        raise ValueError('method should be one of ' + str(METHODS) + '.')
+
+    fixed = {p: float(v) for p, v in ranges.items() if np.ndim(v) == 0}
+    free = [p for p in ranges if p not in fixed]
+
+    if method == 'grid':
+        grids = np.meshgrid(*[np.asarray(ranges[p], dtype=float)
+                              for p in free], indexing='ij')
+        plan = {p: g.ravel() for p, g in zip(free, grids)}
+        no_samples = grids[0].size if free else 1
+    else:
+        if no_samples is None:
+            raise ValueError("no_samples is needed for method '" + method
+                             + "'.")
+        rng = np.random.default_rng(seed)
+        u = rng.random((len(free), no_samples))
+        if method == 'lhs':
+            strata = np.argsort(rng.random((len(free), no_samples)), axis=1)
+            u = (strata + u) / no_samples
+        plan = {}
+        for p, u_p in zip(free, u):
+            lo, hi = ranges[p]
+            plan[p] = lo + (hi - lo) * u_p
+
+    for p, value in fixed.items():
+        plan[p] = np.full(no_samples, value)
+
+    return {p: plan[p] for p in ranges}
+
+def _make_shard(path, model, t, e, params, seed, dtype):
+    rng = np.random.default_rng(seed)
+
+    y = model(t, **params).astype(dtype)
+    y += e[np.newaxis].T * rng.standard_normal(y.shape, dtype=dtype)
+
+    np.save(path + '.npy', y)
+    np.savez(path + '_labels.npz', **params)
+
+    return path
+
+def make_dataset(t, plan, er, loc, name='kt', shard_size=10000, seed=None,
+                 workers=None, dtype=np.float64, model=None):
+    r''' Function generates the curves with gaussian noise of all samples of
+    a sampling plan and writes them to shards in the folder loc.
+    Shards are generated in a process pool. Each shard draws its noise from
+    its own random stream spawned from one SeedSequence, so the dataset only
+    depends on seed and shard_size, not on the number of workers.
+
+    Files written:
+        <name>_meta.npz with the time values 't' and errors 'e', stored once,
+        and the file names of the shards 'shards', written last.
+
+        <name>_<i>.npy with the curves of shard i as a 2D numpy array with
+        indices [j, k], where j runs through t and k through the samples.
+
+        <name>_<i>_labels.npz with the parameters of the samples of shard
+        i.
+
+    Args:
+        t: 1D numpy array that holds values of time windows.
+
+        plan: dictionary of parameters returned by sampling_plan.
+
+        er: float standard deviation of the noise, or 1D numpy array of the
+        same size as t.
+
+        loc: string, folder of the dataset. Created if it does not exist.
+
+        name: string prefix of the files.
+
+        shard_size: integer number of samples of each shard.
+
+        seed: integer seed of the SeedSequence.
+
+        workers: integer number of worker processes. Shards are generated in
+        this process if 1, and the default of ProcessPoolExecutor is used if
+        None. Workers are started with 'spawn' and one BLAS thread each.
+
+        dtype: numpy float type of the curves, e.g. np.float32.
+
+        model: Model of the models registry, e.g. 
+        models.get_model('dynamic_kt'). The Kubo Toyabe model of generateKT,
+        models.KT, is used if None.
+
+    Returns:
+        List of the paths of the shards without extension.
+    '''
+    model = model or KT
+    missing = [p for p in model.params if p not in plan]
+    if missing:
+        raise ValueError('Missing parameters ' + str(missing) + ' of '
+                         + model.name + '.')
+
+    os.makedirs(loc, exist_ok=True)
+
+    t = np.asarray(t, dtype=dtype)
+    e = np.broadcast_to(np.asarray(er, dtype=dtype), t.shape).copy()
+
+    no_samples = plan[model.params[0]].size
+    starts = range(0, no_samples, shard_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    width = len(str(len(starts)))
+
+    tasks = []
+    for i, start in enumerate(starts):
+        sl = slice(start, start + shard_size)
+        path = os.path.join(loc, name + '_' + str(i).zfill(width))
+        params = {p: plan[p][sl] for p in model.params}
+        tasks.append((path, model, t, e, params, seeds[i], dtype))
+
+    if workers == 1:
+        paths = [_make_shard(*task) for task in tasks]
+    else:
+        with SpawnPool(workers, 1) as pool:
+            paths = list(pool.map(_make_shard, *zip(*tasks)))
+
+    np.savez(os.path.join(loc, name + '_meta.npz'), t=t, e=e,
+             shards=np.array([os.path.basename(p) for p in paths]))
+
+    return paths
+
+def load_dataset(loc, name='kt', mmap_mode='r'):
+    r''' Function loads a dataset written by make_dataset. Only the shards
+    listed in the meta file are loaded, so shards of earlier datasets with
+    the same name, or of datasets whose name starts with name, are ignored.
+
+    Args:
+        loc: string, folder of the dataset.
+
+        name: string prefix of the files.
+
+        mmap_mode: mmap_mode of np.load for the shards, None reads them into
+        memory.
+
+    Returns:
+        Tuple (t, e, shards, labels) of the time values, the errors, the list
+        of 2D arrays of the shards and the dictionary of the parameters of
+        all samples.
+    '''
+    meta = np.load(os.path.join(loc, name + '_meta.npz'))
+
+    if 'shards' in meta.files:
+        paths = meta['shards'].tolist()
+    else:
+        # Meta files written before the shard list was stored.
+        pattern = re.compile(re.escape(name) + r'_\d+\.npy$')
+        paths = sorted(f[:-4] for f in os.listdir(loc) if pattern.match(f))
+
+    shards = [np.load(os.path.join(loc, p + '.npy'), mmap_mode=mmap_mode)
+              for p in paths]
+    labels = {}
+    for path in paths:
+        with np.load(os.path.join(loc, path + '_labels.npz')) as f:
+            for p in f.files:
+                labels.setdefault(p, []).append(f[p])
+
+    return (meta['t'], meta['e'], shards,
+            {p: np.concatenate(v) for p, v in labels.items()})
@@ -6,7 +6,16 @@ with randomised noise.
 
 import numpy as np
 
-def generateKT(t, a0, ab, sig=(0, 1), Lam=(0, 1), er=0.1, no_samples=100):
+# internal modules
+
+from pca_exp.utils.instrument import stage
+
+# Number of samples of generateKT_chunks drawn from one random stream.
+SEED_BLOCK = 1024
+
+@stage()
+def generateKT(t, a0, ab, sig=(0, 1), Lam=(0, 1), er=0.1, no_samples=100,
+               ranges='width'):
     r''' Function that generates the Kubo Toyabe curves with gaussian noise, 
     which can be dependent on the time variable t.
     
@@ -17,14 +26,15 @@ def generateKT(t, a0, ab, sig=(0, 1), Lam=(0, 1), er=0.1, no_samples=100):
 
         ab: float that specifies the background asymmetry.
 
-        sig: tuple of two floats (sig_min, sig_max) that specifies minimum 
-        and maximum values of sigma parameter. Alternatively 1D numpy array
-        that specifies values of sigma parameter directly.
+        sig: tuple of two floats (sig_min, sig_width) that specifies minimum 
+        value and width of the range of sigma parameter, drawn uniformly
+        (see ranges). Alternatively 1D numpy array that specifies values of 
+        sigma parameter directly.
 
-        Lam: tuple of two floats (Lam_min, Lam_max) that specifies minimum 
-        and maximum values of Lambda parameter. Alternatively 1D numpy array
-        that specifies values of Lambda parameter directly. If both sig and Lam
-        are 1D numpy arrays, then their size must match.
+        Lam: tuple of two floats (Lam_min, Lam_width) that specifies minimum 
+        value and width of the range of Lambda parameter. Alternatively 1D 
+        numpy array that specifies values of Lambda parameter directly. If 
+        both sig and Lam are 1D numpy arrays, then their size must match.
 
         er: float that specifies the uniform standard deviation over all 
         samples. Alternatively 1D numpy array of the same size as t, that 
@@ -32,8 +42,19 @@ def generateKT(t, a0, ab, sig=(0, 1), Lam=(0, 1), er=0.1, no_samples=100):
 
         no_samples: number of measurements generated. Only needed if both sig
         and Lam are tuples.
+
+        ranges: string, 'width' reads the tuples sig and Lam as (min, width),
+        'minmax' as (min, max), e.g. (sig_min, sig_max).
     '''
     
+    if ranges not in ('width', 'minmax'):
+        raise ValueError("ranges should be 'width' or 'minmax'.")
+    if ranges == 'minmax':
+        if type(sig) is tuple:
+            sig = (sig[0], sig[1] - sig[0])
+        if type(Lam) is tuple:
+            Lam = (Lam[0], Lam[1] - Lam[0])
+
     t = t[np.newaxis].T
 
     if type(sig) is np.ndarray and type(Lam) is np.ndarray:
@@ -66,7 +87,7 @@ def generateKT(t, a0, ab, sig=(0, 1), Lam=(0, 1), er=0.1, no_samples=100):
     a = (a0 * (1 / 3 + 2 / 3 * (1 - (sig_r * t) ** 2) * np.exp(- 
             (sig_r * t) ** 2 / 2)) * np.exp(-Lam_r * t) + ab)
 
-    if type(er) == int:
+    if np.ndim(er) == 0:
         noise = er * np.random.randn(t.size, no_samples)
         e = er * np.ones((t.size, no_samples))
     elif type(er) == np.ndarray:
@@ -75,10 +96,177 @@ def generateKT(t, a0, ab, sig=(0, 1), Lam=(0, 1), er=0.1, no_samples=100):
         noise = er[np.newaxis].T * np.random.randn(t.size, no_samples)
         e = np.repeat(er[np.newaxis].T, no_samples, axis=1)
     else:
-        raise ValueError('er should be either integer or a vector.')
+        raise ValueError('er should be either a number or a vector.')
 
     return np.transpose(np.array([np.repeat(t, no_samples, axis=1), a + noise,
                     e]), axes=(1, 2, 0)), sig_r[0,:], Lam_r[0,:]
 
     
         
+def kubo_toyabe(t, sig, Lam, a0, ab):
+    r''' Function returns the Kubo Toyabe curves with Lorentzian damping as a
+    2D numpy array with indices [i, j], where i runs through t and j through
+    the values of sig and Lam.
+
+    Args:
+        t: 1D numpy array of time values.
+
+        sig, Lam: 1D numpy arrays of the sigma and Lambda parameters.
+
+        a0: float initial asymmetry.
+
+        ab: float background asymmetry.
+    '''
+    st2 = (sig[np.newaxis] * t[np.newaxis].T) ** 2
+    a = 1 / 3 + 2 / 3 * (1 - st2) * np.exp(-st2 / 2)
+    a *= a0 * np.exp(-Lam[np.newaxis] * t[np.newaxis].T)
+    a += ab
+    return a
+
+def _KT_draws(sig, Lam, n, n_t, rng, dtype):
+    r''' Function returns the random parameters (None for parameters given
+    as arrays) and the noise of shape (n, n_t) of n samples.
+    '''
+    draws = [None if isinstance(p, np.ndarray)
+             else (p[0] + p[1] * rng.random(n, dtype=dtype)).astype(dtype)
+             for p in (sig, Lam)]
+    return draws + [rng.standard_normal((n, n_t), dtype=dtype)]
+
+def _iter_KT(t, e, a0, ab, sig, Lam, no_samples, chunk_size, seeds, dtype,
+             out):
+    block = None
+    for start in range(0, no_samples, chunk_size):
+        stop = min(start + chunk_size, no_samples)
+
+        parts = []
+        for b in range(start // SEED_BLOCK, (stop - 1) // SEED_BLOCK + 1):
+            first = b * SEED_BLOCK
+            if block is None or block[0] != b:
+                n = min(SEED_BLOCK, no_samples - first)
+                block = (b, _KT_draws(sig, Lam, n, t.size,
+                                      np.random.default_rng(seeds[b]),
+                                      dtype))
+            sl = slice(max(start, first) - first, min(stop, first
+                                                      + SEED_BLOCK) - first)
+            parts.append([None if d is None else d[sl] for d in block[1]])
+
+        sig_c, Lam_c = [p[start:stop].astype(dtype)
+                        if isinstance(p, np.ndarray)
+                        else np.concatenate([part[i] for part in parts])
+                        for i, p in enumerate((sig, Lam))]
+        noise = np.concatenate([part[2] for part in parts])
+
+        y = kubo_toyabe(t, sig_c, Lam_c, dtype.type(a0), dtype.type(ab))
+        y += e[np.newaxis].T * noise.T
+
+        sl = slice(start, stop)
+        if out is not None:
+            out[:,sl] = y
+            y = out[:,sl]
+
+        yield sl, y, sig_c, Lam_c
+
+def generateKT_chunks(t, a0, ab, sig=(0, 1), Lam=(0, 1), er=0.1,
+                      no_samples=100, chunk_size=10000, seed=None,
+                      dtype=np.float64, out=None, ranges='width'):
+    r''' Function that generates Kubo Toyabe curves with gaussian noise in
+    chunks of chunk_size samples, so that training sets larger than the
+    memory can be generated. Unlike generateKT, the time and error vectors
+    are returned once and not repeated for every sample. Every block of 
+    SEED_BLOCK samples draws from its own random stream spawned from one
+    SeedSequence, so the samples only depend on seed and their position,
+    not on chunk_size.
+
+    Args:
+        t: 1D numpy array that holds values of time windows.
+
+        a0: float that specifies the initial asymmetry.
+
+        ab: float that specifies the background asymmetry.
+
+        sig: tuple of two floats (sig_min, sig_width) that specifies minimum
+        value and width of the range of sigma parameter, drawn uniformly 
+        (see ranges). Alternatively 1D numpy array that specifies values of
+        sigma parameter directly.
+
+        Lam: tuple of two floats (Lam_min, Lam_width) or 1D numpy array, as 
+        sig. If both sig and Lam are 1D numpy arrays, their size must match.
+
+        er: float that specifies the uniform standard deviation over all 
+        samples. Alternatively 1D numpy array of the same size as t, that 
+        specify the error as a function of time.
+
+        no_samples: number of measurements generated. Only needed if both sig
+        and Lam are tuples.
+
+        chunk_size: integer number of samples of each chunk.
+
+        seed: integer seed of the SeedSequence.
+
+        dtype: numpy float type of the generated data, e.g. np.float32.
+
+        out: 2D array of shape (t.size, no_samples), e.g. a np.memmap. If 
+        given, the chunks are written into it and the yielded chunks are
+        views of it.
+
+        ranges: string, 'width' reads the tuples sig and Lam as (min, width),
+        'minmax' as (min, max), as in generateKT.
+
+    Returns:
+        Tuple (t, e, chunks), where t and e are 1D numpy arrays of the time
+        values and errors, and chunks is a generator yielding tuples 
+        (sl, y, sig, Lam) of the slice sl of samples in the chunk, the 2D 
+        array y with indices [i, j], where i runs through t and j through the
+        samples of the chunk, and the parameters of these samples. The chunks
+        can be passed to PCAMachine.partial_fit, or to 
+        DataHandler.load_batch_from_array after KT_batch.
+    '''
+    if ranges not in ('width', 'minmax'):
+        raise ValueError("ranges should be 'width' or 'minmax'.")
+
+    dtype = np.dtype(dtype)
+    t = np.asarray(t, dtype=dtype)
+
+    sizes = [p.size for p in (sig, Lam) if isinstance(p, np.ndarray)]
+    for p, name in ((sig, 'sig'), (Lam, 'Lam')):
+        if isinstance(p, np.ndarray):
+            assert p.ndim == 1, name + ' has to be a vector.'
+        elif isinstance(p, tuple):
+            assert len(p) == 2, name + ' has to be a tuple of two numbers.'
+        else:
+            raise ValueError('Lam and sig should be either numpy arrays or '
+                             + 'tuples of two numbers.')
+    if sizes:
+        assert min(sizes) == max(sizes), 'Lam and sig should have same size.'
+        no_samples = sizes[0]
+    if ranges == 'minmax':
+        sig, Lam = [p if isinstance(p, np.ndarray) else (p[0], p[1] - p[0])
+                    for p in (sig, Lam)]
+
+    if np.ndim(er) == 0:
+        e = np.full(t.size, er, dtype=dtype)
+    else:
+        e = np.asarray(er, dtype=dtype)
+        assert e.ndim == 1, 'er has to be a vector.'
+        assert e.size == t.size, 'er size has to be equal to t size.'
+
+    if out is not None and out.shape != (t.size, no_samples):
+        raise ValueError('out should have shape ' + str((t.size, no_samples))
+                         + '.')
+
+    no_blocks = -(-no_samples // SEED_BLOCK)
+    seeds = np.random.SeedSequence(seed).spawn(no_blocks)
+
+    return t, e, _iter_KT(t, e, a0, ab, sig, Lam, no_samples, chunk_size,
+                          seeds, dtype, out)
+
+def KT_batch(t, y, e):
+    r''' Function returns the batch array of shape (t.size, samples, 3) of 
+    DataHandler.load_batch_from_array from the time values t, a chunk y and
+    the errors e.
+    '''
+    batch = np.empty(y.shape + (3,), dtype=y.dtype)
+    batch[:,:,0] = t[np.newaxis].T
+    batch[:,:,1] = y
+    batch[:,:,2] = e[np.newaxis].T
+    return batch
@@ -0,0 +1,342 @@
+# models.py
+
+''' Code contains the registry of muon spin relaxation models used to
+generate synthetic data. Every model is evaluated fully broadcast over time
+values and parameter sets, and models can be combined into sums and
+products. Models without a closed form (longitudinal field and dynamic Kubo
+Toyabe) are interpolated from dimensionless tables, which are computed once
+and cached on disk.
+'''
+
+# libraries
+
+import os
+import json
+import hashlib
+
+import numpy as np
+
+# Muon gyromagnetic ratio over 2 pi in MHz/G, so that fields B are given in
+# gauss and times in microseconds.
+GAMMA_MU = 0.01355342
+
+# Folder of the cached tables.
+TABLE_DIR = os.environ.get('PCA_EXP_CACHE', os.path.join(
+    os.path.expanduser('~'), '.cache', 'pca_exp'))
+
+# Grids of the tables in the dimensionless time x = sig * t and in the
+# dimensionless field r = omega / sig or fluctuation rate q = nu / sig.
+X_STEP, X_MAX = 0.01, 30.0
+R_STEP, R_MAX = 0.05, 20.0
+Q_STEP, Q_MAX = 0.1, 20.0
+
+MODELS = {}
+
+_tables = {}
+
+
+class Model:
+    r''' Class of a relaxation model. Calling the model with a 1D array of
+    time values t and 1D arrays (or floats) of its parameters returns a 2D
+    numpy array with indices [i, j], where i runs through t and j through
+    the parameter sets. Models are combined with + and *, where parameters
+    of the same name are shared, and rename gives parameters new names.
+
+    Params:
+        func: function of t of shape (t.size, 1) and the parameters of shape
+        (1, n) as keyword arguments, returning an array broadcastable to
+        (t.size, n).
+
+        params: tuple of strings, names of the parameters of func.
+
+        name: string name of the model.
+    '''
+
+    def __init__(self, func, params, name=None):
+        self.func = func
+        self.params = tuple(params)
+        self.name = name or func.__name__
+        self._names = {p: p for p in self.params}
+
+    def __call__(self, t, **params):
+        missing = [p for p in self.params if p not in params]
+        if missing:
+            raise ValueError('Missing parameters ' + str(missing) + ' of '
+                             + self.name + '.')
+
+        t = np.asarray(t, dtype=float)[np.newaxis].T
+        args = {p: np.atleast_1d(np.asarray(params[p], dtype=float))
+                [np.newaxis] for p in self.params}
+        n = max([a.size for a in args.values()], default=1)
+
+        return np.array(np.broadcast_to(self._eval(t, args), (t.size, n)))
+
+    def _eval(self, t, args):
+        return self.func(t, **{p: args[q] for p, q in self._names.items()})
+
+    def rename(self, **names):
+        r''' Function returns a copy of the model with the parameters renamed
+        as given by keywords old_name='new_name'.
+        '''
+        model = Model(self.func, (), self.name)
+        model._names = {p: names.get(q, q) for p, q in self._names.items()}
+        model.params = tuple(model._names.values())
+        return model
+
+    def __add__(self, other):
+        return Compound('+', [self, other])
+
+    def __mul__(self, other):
+        return Compound('*', [self, other])
+
+    def __repr__(self):
+        return self.name + '(' + ', '.join(self.params) + ')'
+
+
+class Compound(Model):
+    r''' Class of the sum (op '+') or product (op '*') of models.
+    '''
+
+    def __init__(self, op, models):
+        self.op = op
+        self.models = [m for model in models
+                       for m in (model.models if isinstance(model, Compound)
+                                 and model.op == op else [model])]
+        self.params = tuple(dict.fromkeys(p for m in self.models
+                                          for p in m.params))
+        self.name = '(' + (' ' + op + ' ').join(repr(m)
+                                                for m in self.models) + ')'
+
+    def _eval(self, t, args):
+        out = self.models[0]._eval(t, args)
+        for model in self.models[1:]:
+            if self.op == '+':
+                out = out + model._eval(t, args)
+            else:
+                out = out * model._eval(t, args)
+        return out
+
+    def rename(self, **names):
+        return Compound(self.op, [m.rename(**names) for m in self.models])
+
+    def __repr__(self):
+        return self.name
+
+
+def register_model(name, params):
+    r''' Decorator which adds a function to the registry of models under a
+    given name, with parameters given by the tuple of strings params.
+    '''
+    def decorator(func):
+        MODELS[name] = Model(func, params, name)
+        return func
+    return decorator
+
+def get_model(name):
+    r''' Function returns the registered model of a given name.
+    '''
+    if name not in MODELS:
+        raise ValueError('Model ' + name + ' is not one of '
+                         + str(sorted(MODELS)) + '.')
+    return MODELS[name]
+
+def load_table(name, builder, **grid):
+    r''' Function returns the table of a given name computed by builder(),
+    which is cached in memory and in the folder TABLE_DIR. The file name
+    holds a hash of grid, so the table is computed again when the grid
+    changes.
+    '''
+    desc = json.dumps(sorted(grid.items()))
+    key = name + '_' + hashlib.sha1(desc.encode()).hexdigest()[:12]
+
+    if key in _tables:
+        return _tables[key]
+
+    path = os.path.join(TABLE_DIR, key + '.npy')
+    try:
+        table = np.load(path)
+    except (OSError, ValueError):
+        table = builder()
+        try:
+            os.makedirs(TABLE_DIR, exist_ok=True)
+            tmp = path[:-4] + '.' + str(os.getpid()) + '.npy'
+            np.save(tmp, table)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    _tables[key] = table
+    return table
+
+def _interp_table(table, x, y, x_step, y_step):
+    r''' Function interpolates bilinearly the table with indices [y, x] on
+    uniform grids starting at 0. Values outside of the grids are clamped to
+    the edges. y is constant along the first axis of x, e.g. of shape (1, n).
+    '''
+    ny, nx = table.shape
+
+    fy = np.clip(y / y_step, 0, ny - 1)
+    iy = np.minimum(fy.astype(int), ny - 2)
+    wy = fy - iy
+
+    fx = np.clip(x / x_step, 0, nx - 1)
+    ix = np.minimum(fx.astype(int), nx - 2)
+    wx = fx - ix
+
+    flat = table.ravel()
+    idx = ix + iy * nx
+    low = flat.take(idx)
+    low += wx * (flat.take(idx + 1) - low)
+    idx += nx
+    high = flat.take(idx)
+    high += wx * (flat.take(idx + 1) - high)
+
+    return low + wy * (high - low)
+
+def _grid(step, stop):
+    return np.arange(int(round(stop / step)) + 1) * step
+
+def _static_kt(x):
+    return 1 / 3 + 2 / 3 * (1 - x ** 2) * np.exp(-x ** 2 / 2)
+
+def _lf_kt_table():
+    r''' Function returns the static longitudinal field Gaussian Kubo Toyabe
+    function G(x, r) on the grids of r and x, integrated with Simpson's rule
+    on every step of x.
+    '''
+    x = _grid(X_STEP, X_MAX)
+    r = _grid(R_STEP, R_MAX)[1:,np.newaxis]
+
+    mid = x[:-1] + X_STEP / 2
+    f = np.exp(-x ** 2 / 2) * np.sin(r * x)
+    f_mid = np.exp(-mid ** 2 / 2) * np.sin(r * mid)
+    steps = X_STEP / 6 * (f[:,:-1] + 4 * f_mid + f[:,1:])
+    integral = np.concatenate([np.zeros((r.size, 1)),
+                               np.cumsum(steps, axis=1)], axis=1)
+
+    G = (1 - 2 / r ** 2 * (1 - np.exp(-x ** 2 / 2) * np.cos(r * x))
+         + 2 / r ** 3 * integral)
+
+    return np.vstack([_static_kt(x), G])
+
+def _dynamic_kt_table():
+    r''' Function returns the dynamic zero field Gaussian Kubo Toyabe
+    function G(x, q) of the strong collision model on the grids of q and x,
+    solving the Volterra equation
+    G(x) = g(x) exp(-q x) + q int_0^x g(u) exp(-q u) G(x - u) du
+    with the static function g. The factor exp(-q u) is integrated exactly
+    and g(u) G(x - u) linearly between grid points, so that fast 
+    fluctuations (q X_STEP close to 1) stay accurate.
+    '''
+    x = _grid(X_STEP, X_MAX)
+    q = _grid(Q_STEP, Q_MAX)[:,np.newaxis]
+
+    # Weights of the linear pieces right (A) and left (B) of a grid point,
+    # with their series for small q X_STEP.
+    a = q[:,0] * X_STEP
+    with np.errstate(divide='ignore', invalid='ignore'):
+        A = np.where(a > 1e-3, (a - 1 + np.exp(-a)) / a ** 2,
+                     1 / 2 - a / 6 + a ** 2 / 24)
+        B = np.where(a > 1e-3, (np.exp(a) - 1 - a) / a ** 2,
+                     1 / 2 + a / 6 + a ** 2 / 24)
+
+    K = _static_kt(x) * np.exp(-q * x)
+    G = np.empty(K.shape)
+    G[:,0] = 1
+    c = q[:,0] * X_STEP
+
+    for n in range(1, x.size):
+        conv = (A + B) * np.sum(K[:,1:n] * G[:,n-1:0:-1], axis=1)
+        G[:,n] = (K[:,n] + c * (conv + B * K[:,n])) / (1 - c * A)
+
+    return G
+
+@register_model('constant', ('a',))
+def constant(t, a):
+    return a
+
+@register_model('exponential', ('Lam',))
+def exponential(t, Lam):
+    return np.exp(-Lam * t)
+
+@register_model('gaussian', ('sig',))
+def gaussian(t, sig):
+    return np.exp(-(sig * t) ** 2 / 2)
+
+@register_model('stretched_exponential', ('Lam', 'beta'))
+def stretched_exponential(t, Lam, beta):
+    return np.exp(-(Lam * t) ** beta)
+
+@register_model('static_kt', ('sig',))
+def static_kt(t, sig):
+    return _static_kt(sig * t)
+
+@register_model('lorentzian_kt', ('Lam',))
+def lorentzian_kt(t, Lam):
+    return 1 / 3 + 2 / 3 * (1 - Lam * t) * np.exp(-Lam * t)
+
+@register_model('precession', ('freq', 'phi'))
+def precession(t, freq, phi):
+    return np.cos(2 * np.pi * freq * t + phi)
+
+@register_model('lf_kt', ('sig', 'B'))
+def lf_kt(t, sig, B):
+    r''' Static Gaussian Kubo Toyabe function in a longitudinal field B
+    (gauss). Interpolated from a table for omega / sig <= R_MAX and given by
+    its expansion in sig / omega above.
+    '''
+    table = load_table('lf_kt', _lf_kt_table, x_step=X_STEP, x_max=X_MAX,
+                       r_step=R_STEP, r_max=R_MAX)
+
+    sig, B = np.broadcast_arrays(sig, B)
+    omega = 2 * np.pi * GAMMA_MU * B
+    r = np.full(sig.shape, np.inf)
+    np.divide(omega, sig, out=r, where=sig > 0)
+
+    G = _interp_table(table, sig * t, np.minimum(r, R_MAX), X_STEP, R_STEP)
+
+    G[:,sig[0] == 0] = 1
+
+    cols = (r[0] > R_MAX) & (sig[0] > 0)
+    if np.any(cols):
+        x = sig[:,cols] * t
+        r = r[:,cols]
+        G[:,cols] = 1 - ((2 / r ** 2 - 2 / r ** 4)
+                         * (1 - np.exp(-x ** 2 / 2) * np.cos(r * x)))
+
+    return G
+
+@register_model('dynamic_kt', ('sig', 'nu'))
+def dynamic_kt(t, sig, nu):
+    r''' Zero field Gaussian Kubo Toyabe function with fluctuation rate nu
+    in the strong collision model. Interpolated from a table for
+    nu / sig <= Q_MAX, with the tail beyond sig * t = X_MAX continued by
+    exp(-2 nu t / 3), and given by the motional narrowing (Abragam) formula
+    above.
+    '''
+    table = load_table('dynamic_kt', _dynamic_kt_table, x_step=X_STEP,
+                       x_max=X_MAX, q_step=Q_STEP, q_max=Q_MAX)
+
+    sig, nu = np.broadcast_arrays(sig, nu)
+    q = np.full(sig.shape, np.inf)
+    np.divide(nu, sig, out=q, where=sig > 0)
+
+    x = sig * t
+    q_tab = np.minimum(q, Q_MAX)
+    G = _interp_table(table, x, q_tab, X_STEP, Q_STEP)
+    G *= np.exp(-2 / 3 * q_tab * np.maximum(x - X_MAX, 0))
+
+    G[:,sig[0] == 0] = 1
+
+    cols = (q[0] > Q_MAX) & (sig[0] > 0)
+    if np.any(cols):
+        sig = sig[:,cols]
+        nu = nu[:,cols]
+        G[:,cols] = np.exp(-2 * sig ** 2 / nu ** 2
+                           * (np.exp(-nu * t) - 1 + nu * t))
+
+    return G
+
+# Model of generateKT: a0 * static_kt * exponential + ab.
+KT = (get_model('constant').rename(a='a0') * get_model('static_kt')
+      * get_model('exponential') + get_model('constant').rename(a='ab'))
@@ -0,0 +1,352 @@
+# live.py
+
+''' Code contains the live mode of the package: a folder is polled for new
+run files named prenum + N + ext while an experiment is running, only new or
+changed files are parsed and the incremental PCA of PCAMachine is updated
+with them. The processed files and their data are checkpointed, so a
+session can be restarted without reading the files again.
+'''
+
+# libraries
+
+import os
+import re
+import json
+import time
+import contextlib
+
+import numpy as np
+
+# internal modules
+
+from pca_exp.data_handler import DataHandler
+from pca_exp.pca_machine import PCAMachine
+from pca_exp.utils.loaders import load_files
+from pca_exp.utils import instrument
+
+
+class LiveSession:
+    r''' Class which follows the run files of a folder and keeps an
+    incremental PCA of them up to date. Every poll parses the files that are
+    new or whose size or modification time changed, preprocesses them with
+    the slicing, binning and filter plan of the session (the plan is found
+    from the first files and kept, so all runs share the x values) and
+    updates the PCA with PCAMachine.partial_fit, so the cost of a poll
+    depends on the new files only. A changed file replaces its earlier
+    measurement; as the incremental PCA cannot remove data, it is then
+    refitted from the stored prepared data of all runs.
+
+        session = LiveSession('data/', 'EMU585', '.dat', checkpoint='live/')
+        session.watch(interval=60, callback=lambda s, new: print(new))
+
+    Params:
+        loc: string, folder of the run files.
+
+        prenum: string beginning of the file names, before the run number.
+
+        ext: string end of the file names, after the run number, e.g. '.dat'.
+
+        checkpoint: string, folder the state and the data of the session are
+        written to after every poll, and read from if it exists. Not
+        checkpointed if None.
+
+        n_components: integer number of principal components kept.
+
+        x_vals: tuple of two floats (x_start_val, x_stop_val) the runs are
+        sliced to with DataHandler.slice_batch. Not sliced if None.
+
+        x_0: 1D numpy array of bin centres the runs are binned to with
+        DataHandler.bin_data. Not binned if None, in which case all runs
+        need the x values of the first run processed, and runs with other x
+        values are reported in errors.
+
+        delimiter, skiprows, workers: arguments of utils.loaders.load_files.
+
+        settle: float number of seconds since the last modification before
+        a file is parsed, so that files still being written are skipped.
+
+        quiet: if True, the progress messages of PCAMachine are silenced.
+
+    Attribs:
+        machine: PCAMachine holding the last result only, with the scores of
+        the runs in the order of self.runs.
+
+        files: dictionary with keys file names and values [size, mtime_ns,
+        chunk, column] of the processed files, the last two locating their
+        data in self.chunks.
+
+        chunks: list of dictionaries with the 'names' of the files, the raw
+        'batch' and the 'prepared' data of every poll.
+
+        plan: 1D numpy array of the filter plan, None before the first poll.
+
+        errors: dictionary of the paths of the files that could not be
+        parsed or whose x values differ from the session in the last poll,
+        and their error messages. They are tried again in the next poll.
+    '''
+
+    def __init__(self, loc, prenum='', ext='', checkpoint=None,
+                 n_components=4, x_vals=None, x_0=None, delimiter=None,
+                 skiprows=0, workers=None, settle=1.0, quiet=True):
+        self.loc = loc
+        self.prenum = prenum
+        self.ext = ext
+        self.checkpoint = checkpoint
+        self.n_components = n_components
+        self.x_vals = None if x_vals is None else tuple(x_vals)
+        self.x_0 = None if x_0 is None else np.asarray(x_0, dtype=float)
+        self.load_args = {'delimiter': delimiter, 'skiprows': skiprows,
+                          'workers': workers}
+        self.settle = settle
+        self.quiet = quiet
+
+        self.pattern = re.compile(re.escape(prenum) + r'(\d+)'
+                                  + re.escape(ext) + '$')
+        self.machine = PCAMachine(DataHandler(), max_results=1)
+        self.files = {}
+        self.chunks = []
+        self.plan = None
+        self.errors = {}
+
+        if checkpoint is not None and os.path.exists(
+                os.path.join(checkpoint, 'state.json')):
+            self._restore()
+
+    def _settings(self):
+        return {'prenum': self.prenum, 'ext': self.ext,
+                'x_vals': None if self.x_vals is None else list(self.x_vals),
+                'x_0': None if self.x_0 is None else self.x_0.tolist(),
+                'n_components': self.n_components,
+                'delimiter': self.load_args['delimiter'],
+                'skiprows': self.load_args['skiprows']}
+
+    def scan(self):
+        r''' Function returns the names of the files of the folder matching
+        prenum and ext that are new or changed since they were processed and
+        were not modified in the last settle seconds, ordered by run number.
+        '''
+        now = time.time()
+        found = []
+        for name in os.listdir(self.loc):
+            match = self.pattern.match(name)
+            if match is None:
+                continue
+            try:
+                st = os.stat(os.path.join(self.loc, name))
+            except OSError:
+                continue
+            if now - st.st_mtime < self.settle:
+                continue
+            seen = self.files.get(name)
+            if seen is None or seen[:2] != [st.st_size, st.st_mtime_ns]:
+                found.append((int(match.group(1)), name, st))
+
+        return [(name, st) for _, name, st in sorted(found)]
+
+    def poll(self):
+        r''' Function processes the new and changed files of the folder,
+        updates the PCA and writes the checkpoint.
+
+        Returns:
+            List of the names of the processed files, in the order their
+            measurements were appended.
+        '''
+        found = self.scan()
+        self.errors = {}
+        if not found:
+            return []
+
+        paths = [os.path.join(self.loc, name) for name, _ in found]
+        batch, self.errors = load_files(paths, shape=self._shape(),
+                                        skip=True, **self.load_args)
+        found = [(name, st) for (name, st), path in zip(found, paths)
+                 if path not in self.errors]
+        if not found:
+            return []
+
+        same = self._same_x(batch)
+        for (name, _), ok in zip(found, same):
+            if not ok:
+                self.errors[os.path.join(self.loc, name)] = (
+                    'x values differ from those of the session; runs need '
+                    'the same x values unless x_0 is given.')
+        if not same.all():
+            batch = batch[:,same,:]
+            found = [f for f, ok in zip(found, same) if ok]
+            if not found:
+                return []
+
+        prepared = self._prepare(batch)
+        changed = any(name in self.files for name, _ in found)
+
+        chunk = len(self.chunks)
+        names = [name for name, _ in found]
+        self.chunks.append({'names': names, 'batch': batch,
+                            'prepared': prepared})
+        for col, (name, st) in enumerate(found):
+            self.files[name] = [st.st_size, st.st_mtime_ns, chunk, col]
+
+        with self._silence():
+            if changed:
+                self.machine.incremental = None
+                self.machine.partial_fit(self.prepared()[0],
+                                         self.n_components)
+            else:
+                self.machine.partial_fit(prepared[0], self.n_components)
+            self.machine.finalize(reset=False)
+
+        if self.checkpoint is not None:
+            self._save_chunk(chunk)
+            self._save_state()
+
+        return names
+
+    def watch(self, interval=60.0, callback=None, max_polls=None):
+        r''' Function polls the folder every interval seconds until it is
+        interrupted (KeyboardInterrupt) or max_polls polls were made.
+
+        Args:
+            interval: float number of seconds between polls.
+
+            callback: function called as callback(session, names) after each
+            poll that processed files. Optional.
+
+            max_polls: integer number of polls. Unlimited if None.
+        '''
+        polls = 0
+        try:
+            while max_polls is None or polls < max_polls:
+                names = self.poll()
+                if names and callback is not None:
+                    callback(self, names)
+                polls += 1
+                if max_polls is None or polls < max_polls:
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+    def _silence(self):
+        return instrument.quiet() if self.quiet else contextlib.nullcontext()
+
+    def _shape(self):
+        r''' Function returns the shape (rows, columns) the files of the
+        session need, None if the runs are binned or no file was processed.
+        '''
+        if self.x_0 is not None or not self.chunks:
+            return None
+        batch = self.chunks[0]['batch']
+        return batch.shape[0], batch.shape[2]
+
+    def _same_x(self, batch):
+        r''' Function returns a boolean array telling which runs of a new
+        batch have the x values of the session (of its first run, if no file
+        was processed). All runs pass if they are binned.
+        '''
+        if self.x_0 is not None:
+            return np.ones(batch.shape[1], dtype=bool)
+        ref = (self.chunks[0]['batch'] if self.chunks else batch)[:,0,0]
+        return np.all(np.isclose(batch[:,:,0], ref[:,np.newaxis], rtol=1e-9,
+                                 atol=0), axis=0)
+
+    def _prepare(self, batch):
+        r''' Function slices, bins and prepares a batch of new runs on a
+        throwaway DataHandler with the plan of the session, which is found
+        from the first batch.
+        '''
+        dh = DataHandler()
+        dh.load_batch_from_array(batch)
+        if self.x_vals is not None:
+            dh.slice_batch(0, x_vals=self.x_vals)
+        if self.x_0 is not None:
+            dh.bin_data(self.x_0)
+        dh.prepare_XYE_PCA(plan=self.plan)
+        self.plan = dh.prepared_plans[-1]
+
+        return dh.prepared_data[-1]
+
+    def _live(self):
+        r''' Function returns, for every chunk, the columns of its files that
+        were not replaced by a later version.
+        '''
+        cols = [[] for _ in self.chunks]
+        for name, (_, _, chunk, col) in self.files.items():
+            cols[chunk].append(col)
+        return [np.sort(c).astype(int) for c in cols]
+
+    @property
+    def runs(self):
+        r''' List of the run numbers of the measurements of the PCA, in the
+        order of their scores.
+        '''
+        return [int(self.pattern.match(chunk['names'][col]).group(1))
+                for chunk, cols in zip(self.chunks, self._live())
+                for col in cols]
+
+    def batch(self):
+        r''' Function returns the batch of the raw data of all runs, in the
+        order of self.runs (see DataHandler for the layout).
+        '''
+        return np.concatenate([chunk['batch'][:,cols,:] for chunk, cols
+                               in zip(self.chunks, self._live())], axis=1)
+
+    def prepared(self):
+        r''' Function returns the prepared data of all runs, in the order of
+        self.runs (see DataHandler.prepare_XYE_PCA).
+        '''
+        return np.concatenate([chunk['prepared'][:,:,cols] for chunk, cols
+                               in zip(self.chunks, self._live())], axis=2)
+
+    def data_handler(self):
+        r''' Function returns a new DataHandler holding the batch and the
+        prepared data of all runs, e.g. for a full PCAMachine analysis.
+        '''
+        dh = DataHandler()
+        dh.load_batch_from_array(self.batch(), self.prenum)
+        dh.prepared_data.append(self.prepared())
+        dh.prepared_plans.append(self.plan)
+        return dh
+
+    def _save_chunk(self, chunk):
+        os.makedirs(self.checkpoint, exist_ok=True)
+        path = os.path.join(self.checkpoint, 'chunk' + str(chunk) + '.npz')
+        tmp = path[:-4] + '.' + str(os.getpid()) + '.npz'
+        np.savez(tmp, names=np.array(self.chunks[chunk]['names']),
+                 batch=self.chunks[chunk]['batch'],
+                 prepared=self.chunks[chunk]['prepared'])
+        os.replace(tmp, path)
+
+    def _save_state(self):
+        path = os.path.join(self.checkpoint, 'state.json')
+        tmp = path + '.' + str(os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump({'settings': self._settings(), 'files': self.files,
+                       'chunks': len(self.chunks),
+                       'plan': self.plan.tolist()}, f)
+        os.replace(tmp, path)
+
+    def _restore(self):
+        r''' Function reads the state and the data of the checkpoint and
+        fits the PCA to the stored prepared data of all runs.
+        '''
+        with open(os.path.join(self.checkpoint, 'state.json')) as f:
+            state = json.load(f)
+
+        if state['settings'] != self._settings():
+            raise ValueError('Checkpoint ' + self.checkpoint + ' was written'
+                             ' with settings ' + str(state['settings'])
+                             + ', not ' + str(self._settings()) + '.')
+
+        self.files = state['files']
+        self.plan = np.array(state['plan'], dtype=int)
+        for chunk in range(state['chunks']):
+            with np.load(os.path.join(self.checkpoint, 'chunk' + str(chunk)
+                                      + '.npz')) as f:
+                self.chunks.append({'names': f['names'].tolist(),
+                                    'batch': f['batch'],
+                                    'prepared': f['prepared']})
+
+        if self.chunks:
+            with self._silence():
+                self.machine.partial_fit(self.prepared()[0],
+                                         self.n_components)
+                self.machine.finalize(reset=False)
@@ -6,7 +6,27 @@ components, scores and other information.
 
 # libraries
 import numpy as np
-import matplotlib.pyplot as plt
+
+# internal modules
+
+from pca_exp.utils.solvers import (svd, weighted_svd, weighted_als,
+                                   chunked_gram_pca, tiled_snapshot_pca,
+                                   IncrementalSVD)
+from pca_exp.utils.utils import CHUNK_BYTES, iter_chunks, average_rows
+from pca_exp.utils.resampling import bootstrap_pca
+from pca_exp.pca_result import PCAResult, ResultView
+from pca_exp.utils.instrument import stage, echo
+
+def _result_shapes(args, kwargs, result):
+    r''' Function returns the shapes of the principal components and scores
+    of the last result of the PCAMachine args[0], recorded after
+    instrumented stages.
+    '''
+    res = args[0].results[-1] if args[0].results else None
+    if res is None:
+        return {}
+    return {'components': np.shape(res.components),
+            'scores': np.shape(res.scores)}
 
 
 class PCAMachine:
@@ -17,7 +37,13 @@ class PCAMachine:
         data_handler: pca_exp.data_handler class specifing the instance that
         holds processed data, used in PCA algorithm.
 
+        max_results: positive integer number of results kept. When 
+        exceeded, the oldest results are evicted. Not limited if None.
+
     Attribs:
+        results: list of pca_result.PCAResult objects, one per PCA, with None
+        in place of evicted results (so that res_idx stays valid).
+
         pc_scores: list of 2D numpy arrays that holds the PC scores of each
         PCA. The 2D array have indices [i, j], where i runs through PC 
         numbers and j runs through different measurements.
@@ -32,41 +58,88 @@ class PCAMachine:
         PCA.
 
         pc_z: list of 2D numpy array, which holds the initial measurement
-        curves, with removed average.
+        curves, with removed average. Computed only when an item is accessed.
+
+        The pc_* lists are views of the attributes of self.results.
+
+        incremental: utils.solvers.IncrementalSVD instance holding the state
+        of the incremental PCA updated by partial_fit, or None.
 
         data_handler: pca_exp.data_handler class specifing the instance that
         holds processed data, used in PCA algorithm.
     '''
 
-    def __init__(self, data_handler):
-        self.pc_scores = []
-        self.pc_curves = []
-        self.pc_av = []
-        self.pc_sing = []
-        self.pc_z = []
+    def __init__(self, data_handler, max_results=None):
+        if max_results is not None and max_results < 1:
+            raise ValueError('max_results should be at least 1, the last '
+                             'result is always kept.')
+
+        self.results = []
+        self.pc_scores = ResultView(self.results, 'scores')
+        self.pc_curves = ResultView(self.results, 'components')
+        self.pc_av = ResultView(self.results, 'mean')
+        self.pc_sing = ResultView(self.results, 'sing')
+        self.pc_z = ResultView(self.results, 'centred')
         self.data_handler = data_handler
+        self.max_results = max_results
+        self.incremental = None
+
+    def add_result(self, result):
+        r''' Function that stores a new result and evicts the oldest ones if
+        there are more than max_results. Returns the index of the result.
+
+        Args:
+            result: pca_result.PCAResult object.
+        '''
+        self.results.append(result)
+
+        if self.max_results is not None:
+            kept = [i for i, r in enumerate(self.results) if r is not None]
+            for i in kept[:-self.max_results]:
+                self.results[i] = None
+
+        return len(self.results) - 1
+
+    def evict(self, res_idx=None, keep_last=None):
+        r''' Function that frees the memory of stored results. Evicted 
+        results are replaced by None, so indices of the other results do not
+        change.
+
+        Args:
+            res_idx: integer or list of integers of the evicted results.
+
+            keep_last: integer, if given all but the last keep_last results 
+            are evicted.
+        '''
+        if res_idx is not None:
+            for i in np.atleast_1d(res_idx):
+                self.results[i] = None
+        if keep_last is not None:
+            for i in range(len(self.results) - keep_last):
+                self.results[i] = None
 
     def print_pca_representation(self):
         r''' Function that prints the scree plot in the console log of a last
-        principal component analysis.
+        principal component analysis, in percent of the total variance.
         '''
-        sing_total = np.sum(self.pc_sing[-1])
-        sing_show = self.pc_sing[-1][:8] * 100 / sing_total
+        sing_show = self.results[-1].explained_variance()[:8] * 100
         
-        print(str(int(sing_show[0])) + '%', '^')
+        echo(str(int(sing_show[0])) + '%', '^')
         for i in range(10):
-            print('    |', end='\t')
+            echo('    |', end='\t')
             for s_j in sing_show:
                 if s_j / sing_show[0] < (10 - i) / 10:
-                    print(' ', end='\t')
+                    echo(' ', end='\t')
                 else:
-                    print('#', end='\t')
-            print()
-        print('    ---------------------------------------------' +
+                    echo('#', end='\t')
+            echo()
+        echo('    ---------------------------------------------' +
                     '-------------------->')
 
 
-    def perform_pca(self, prep_ind = 0):
+    @stage(shapes=_result_shapes)
+    def perform_pca(self, prep_ind = 0, n_components=None, solver='auto',
+                    random_state=None):
         r''' Function that performs the principal component analysis on the 
         data specified by prep_ind. It save the results in attributes of the 
         class.
@@ -74,30 +147,403 @@ class PCAMachine:
         Args:
             prep_ind: integer that specifies the data, on which PCA is 
             performed.
+
+            n_components: integer number of principal components kept. All
+            components are kept if None.
+
+            solver: string specifying the SVD solver (see utils.solvers).
+            'economy' skips singular vectors without singular values, 'gram'
+            eigendecomposes the smaller Gram matrix of lopsided data,
+            'randomized' uses a randomized range finder, 'lanczos' uses
+            Lanczos bidiagonalisation and 'full' reproduces the square 
+            pc_curves matrix of the full SVD. 'auto' picks the cheapest one
+            from the matrix shape and n_components.
+
+            random_state: seed of the randomized and lanczos solvers.
+
+        If the prepared data is memory-mapped (DataHandler storage 'mmap'),
+        the PCA is performed out of core with utils.solvers.chunked_gram_pca
+        regardless of solver.
+
+        The percentages of the printed scree plot (and of the plotted ones)
+        are the shares of the total variance, pc_sing ** 2 over the sum of 
+        squares of the centred data (see PCAResult.explained_variance), and
+        no longer pc_sing / sum(pc_sing). With the default solver 'auto', 
+        pc_curves holds at most min(x, measurements) columns instead of the
+        square matrix of the full SVD; solver='full' gives the old shape.
         '''
         data_hand = self.data_handler
         a = data_hand.prepared_data[prep_ind][0]
-        av = np.sum(a, axis = 1)[np.newaxis].T / a.shape[1]
-        z = a - av
 
-        print('Performing PCA on prepared data')
-        curves, sing, _ = np.linalg.svd(z)
-        scores = np.dot(curves.T, z)  
+        echo('Performing PCA on prepared data')
+        total = None
+        if isinstance(a, np.memmap):
+            chunk = max(1, CHUNK_BYTES // (8 * a.shape[0]))
+            av, curves, sing, scores = chunked_gram_pca(a, n_components, 
+                                                        chunk)
+        else:
+            av = np.sum(a, axis = 1)[np.newaxis].T / a.shape[1]
+            z = a - av
+
+            curves, sing, _ = svd(z, n_components=n_components, 
+                                  solver=solver, random_state=random_state)
+            scores = np.dot(curves.T, z)  
+            total = float(np.sum(z ** 2))
+
+        self.add_result(PCAResult(av, curves, sing, scores, data=a,
+                                  prep_ind=prep_ind, total=total))
+
+        echo('Showing the percentage of covariance of most important PCs:')
+        self.print_pca_representation()
+
+    @stage(shapes=_result_shapes)
+    def perform_pca_2D(self, batch_ind=0, n_components=4, tile=None, 
+                       out=None):
+        r''' Function that performs the principal component analysis on a 
+        stack of images of a DataHandler2D, with pixels as x values. The
+        stack (e.g. memory-mapped with DataHandler2D.load_batch_from_file) is
+        streamed in tiles of image rows with 
+        utils.solvers.tiled_snapshot_pca, so the flattened matrix of pixels
+        and measurements is never formed. The result is stored as any other
+        PCA result, with the mean and components flattened over pixels.
+
+        Args:
+            batch_ind: integer index of the stack in 
+            self.data_handler.batches.
+
+            n_components: integer number of principal components kept. All
+            components are kept if None.
+
+            tile: integer number of image rows processed at once. Chosen
+            from utils.utils.CHUNK_BYTES if None.
+
+            out: array of shape (x, y, n_components) the component images 
+            are written to, e.g. a np.memmap. Allocated if None.
+
+        Returns:
+            Tuple (av, images) of the mean image of shape (x, y) and the 
+            component images of shape (x, y, n_components).
+        '''
+        stack = self.data_handler.batches[batch_ind]
+        n, nx, ny = stack.shape
+
+        if tile is None:
+            tile = max(1, CHUNK_BYTES // (8 * n * ny))
+
+        echo('Performing PCA on image stack')
+        av, images, sing, scores = tiled_snapshot_pca(stack, n_components, 
+                                                      tile, out)
+
+        data = None
+        if stack.flags.c_contiguous:
+            data = np.reshape(stack, (n, nx * ny)).T
+
+        self.add_result(PCAResult(np.reshape(av, (-1, 1)),
+                                  np.reshape(images, (-1, sing.size)), sing,
+                                  scores, data=data, kind='image'))
+
+        echo('Showing the percentage of covariance of most important PCs:')
+        self.print_pca_representation()
+
+        return av, images
+
+    @stage(shapes=_result_shapes)
+    def perform_weighted_pca(self, prep_ind=0, n_components=4, errors=None,
+                             col_errors=None, elementwise=False, 
+                             solver='auto', max_iter=100, tol=1e-6,
+                             random_state=None):
+        r''' Function that performs the principal component analysis 
+        weighted by the errors of the data, so that noisy x bins do not
+        dominate the components. It finds the rank n_components 
+        approximation of the centred data with the smallest chi^2 and saves
+        it like perform_pca: pc_curves are its orthonormal components, 
+        pc_sing its singular values and pc_scores the scores.
+
+        Args:
+            prep_ind: integer that specifies the data, on which PCA is 
+            performed.
+
+            n_components: integer number of principal components.
+
+            errors: 1D array of the errors of each x bin (e.g. E1 returned by
+            filter_data), or 2D array of the errors of each value. If None,
+            the errors of the prepared data are used: per element if
+            elementwise is True, otherwise combined into the errors of each
+            bin, sqrt(mean(e ** 2)) over measurements, which equals E1.
+
+            col_errors: 1D array of relative errors of each measurement, used
+            to weight the columns with 1D errors. Equal if None.
+
+            elementwise: if True and errors is None, the per-element errors 
+            of the prepared data are used.
+
+            solver: string, SVD solver used with 1D errors.
+
+            max_iter, tol: maximal number of iterations and relative 
+            tolerance of chi^2 of the iterative solver used with 2D errors.
+
+            random_state: seed of the randomized and lanczos solvers.
+
+        With 1D errors the rows (and columns) of the data are scaled by the
+        inverse errors and a truncated SVD is performed 
+        (utils.solvers.weighted_svd), so the cost stays that of the
+        unweighted PCA. With 2D errors alternating weighted least squares
+        (utils.solvers.weighted_als) are iterated, starting from the 1D
+        weighted solution.
+        '''
+        prepared = self.data_handler.prepared_data[prep_ind]
+        a = prepared[0]
+
+        if errors is None:
+            if len(prepared) < 3:
+                raise Exception('Prepared data has no errors, give errors!')
+            errors = prepared[2]
+            if not elementwise:
+                errors = np.sqrt(np.mean(errors ** 2, axis=1))
+        errors = np.asarray(errors, dtype=float)
+
+        echo('Performing weighted PCA on prepared data')
+        if errors.ndim == 1:
+            col_w = None if col_errors is None else 1 / np.asarray(col_errors)
+            w_col = np.ones(a.shape[1]) if col_w is None else col_w ** 2
+            av = (a @ w_col / np.sum(w_col))[np.newaxis].T
+            curves, sing, Vt = weighted_svd(a - av, 1 / errors, col_w,
+                                            n_components, solver,
+                                            random_state=random_state)
+        else:
+            w = 1 / errors ** 2
+            av = (np.sum(w * a, axis=1) / np.sum(w, axis=1))[np.newaxis].T
+            row_errors = np.sqrt(np.mean(errors ** 2, axis=1))
+            U0 = weighted_svd(a - av, 1 / row_errors, None, n_components,
+                              solver, random_state=random_state)[0]
+            curves, sing, Vt, n_iter = weighted_als(a - av, w, n_components,
+                                                    U0, max_iter, tol)
+            echo('Iterative solver finished after', n_iter, 'iterations')
+
+        scores = sing[np.newaxis].T * Vt
+
+        self.add_result(PCAResult(av, curves, sing, scores, data=a,
+                                  prep_ind=prep_ind, kind='weighted'))
+
+        echo('Showing the percentage of covariance of most important PCs:')
+        self.print_pca_representation()
+
+    @stage()
+    def transform(self, batch, res_idx=0, n_components=None, chunk=None):
+        r''' Function that projects new measurements onto the principal
+        components of a stored result, giving their PC scores. The input is
+        processed in chunks of measurements, so only one chunk of the centred
+        data exists at a time.
+
+        Args:
+            batch: either a 2D array with indices [i, j], where i runs 
+            through the x values of the result and j runs through 
+            measurements, or a raw 3D batch in the DataHandler layout 
+            (x, measurement, column), or an integer index of a batch in 
+            self.data_handler. Raw batches are re-binned with the bin plan
+            stored for the prepared data of the result, so they need to be
+            sliced and binned (bin_data) the same way as the reference data.
+
+            res_idx: integer, specifing the index of the result.
+
+            n_components: integer number of PC scores returned. All stored
+            components are used if None.
+
+            chunk: integer number of measurements processed at once. Chunks
+            of about CHUNK_BYTES are used if None.
+
+        Returns:
+            2D numpy array of scores with indices [i, j], where i runs 
+            through PC numbers and j runs through measurements.
+        '''
+        result = self.results[res_idx]
+        if result is None:
+            raise Exception('Result ' + str(res_idx) + ' has been evicted!')
+
+        if isinstance(batch, (int, np.integer)):
+            batch = self.data_handler.batches[batch]
+
+        plan = None
+        if batch.ndim == 3:
+            if result.prep_ind is None:
+                raise Exception('Result ' + str(res_idx) + ' has no bin plan'
+                                + ' to apply to a raw batch!')
+            plan = self.data_handler.prepared_plans[result.prep_ind]
+            batch = batch[:,:,1]
+
+        curves = result.components[:,:n_components]
+        if chunk is None:
+            chunk = max(1, CHUNK_BYTES // (8 * batch.shape[0]))
+
+        scores = np.empty((curves.shape[1], batch.shape[1]))
+        for sl in iter_chunks(batch.shape[1], chunk):
+            a = batch[:,sl]
+            if plan is not None:
+                a = average_rows(plan, a)
+            scores[:,sl] = curves.T @ (a - result.mean)
+
+        return scores
+
+    @stage()
+    def inverse_transform(self, scores, res_idx=0, chunk=None):
+        r''' Function that reconstructs measurements from their PC scores 
+        using the mean and the principal components of a stored result. 
+
+        Args:
+            scores: 2D array with indices [i, j], where i runs through the
+            first PC numbers and j runs through measurements.
+
+            res_idx: integer, specifing the index of the result.
+
+            chunk: integer number of measurements processed at once. Chunks
+            of about CHUNK_BYTES are used if None.
+
+        Returns:
+            2D numpy array with indices [i, j], where i runs through x values
+            and j runs through measurements.
+        '''
+        result = self.results[res_idx]
+        if result is None:
+            raise Exception('Result ' + str(res_idx) + ' has been evicted!')
+
+        scores = np.atleast_2d(scores)
+        curves = result.components[:,:scores.shape[0]]
+        if chunk is None:
+            chunk = max(1, CHUNK_BYTES // (8 * curves.shape[0]))
+
+        out = np.empty((curves.shape[0], scores.shape[1]))
+        for sl in iter_chunks(scores.shape[1], chunk):
+            out[:,sl] = result.mean + curves @ scores[:,sl]
+
+        return out
+
+    @stage()
+    def bootstrap(self, res_idx=0, n_components=4, n_boot=200, 
+                  method='noise', workers=None, seed=None, ci=0.95,
+                  solver='auto', blas=1):
+        r''' Function that estimates the uncertainty of the principal 
+        components of a stored result by resampling its input data n_boot
+        times and repeating a truncated PCA on each replicate in a process
+        pool (see utils.resampling.bootstrap_pca). The signs of the 
+        components of each replicate are aligned to the stored result.
+
+        Args:
+            res_idx: integer, specifing the index of the result.
+
+            n_components: integer number of components estimated.
+
+            n_boot: integer number of replicates.
+
+            method: string, 'noise' redraws the data from the errors of the
+            prepared data (prepared_data[prep_ind][2]), 'measurements' 
+            bootstraps over measurements.
+
+            workers: integer number of worker processes (1 runs in this
+            process).
+
+            seed: integer seed; each replicate gets an independent stream 
+            spawned from it.
+
+            ci: float confidence level of the bands.
+
+            solver: string, SVD solver of utils.solvers.svd.
+
+            blas: integer number of BLAS threads of each worker.
+
+        Returns:
+            Dictionary of replicates and confidence bands of 'curves', 'sing'
+            and 'scores' (e.g. 'curves_low', 'curves_high', 'scores_std').
+
+        Only results of perform_pca, and of perform_pca_2D with method
+        'measurements' (the image stack has no errors), are resampled, as the
+        replicates repeat an unweighted PCA. Other results raise a 
+        ValueError.
+        '''
+        result = self.results[res_idx]
+        if result is None or result.data is None:
+            raise Exception('Input data of result ' + str(res_idx) 
+                            + ' is not available!')
+
+        if result.kind == 'image' and method == 'noise':
+            raise ValueError("Results of perform_pca_2D have no errors, use "
+                             "method 'measurements'.")
+        if result.kind not in ('pca', 'image'):
+            raise ValueError('Bootstrap of ' + result.kind + ' results is not '
+                             'supported, only of perform_pca and '
+                             'perform_pca_2D results.')
+
+        e = None
+        if method == 'noise':
+            prepared = self.data_handler.prepared_data[result.prep_ind]
+            if len(prepared) < 3:
+                raise Exception('Prepared data has no errors to resample!')
+            e = prepared[2]
+
+        return bootstrap_pca(result.data, result.components[:,:n_components],
+                             e=e, n_boot=n_boot, method=method,
+                             workers=workers, seed=seed, ci=ci, 
+                             solver=solver, blas=blas)
+
+    @stage()
+    def partial_fit(self, new_columns, n_components=None):
+        r''' Function that updates the incremental principal component 
+        analysis with new measurements. The running mean and a rank 
+        n_components factorisation are kept in self.incremental, so the cost
+        of each call depends on the number of new measurements only. Call
+        finalize to store the results.
+
+        Args:
+            new_columns: 2D numpy array with indices [i, j], where i runs 
+            through x values and j runs through new measurements, e.g. 
+            prepared_data[prep_ind][0] of new data binned with the same plan.
+
+            n_components: integer number of principal components kept. Only
+            used on the first call; all components are kept if None.
+        '''
+        if self.incremental is None:
+            self.incremental = IncrementalSVD(n_components)
+
+        self.incremental.update(new_columns)
+
+    @stage(shapes=_result_shapes)
+    def finalize(self, reset=True):
+        r''' Function that stores the results of the incremental principal
+        component analysis in the attributes of the class, in the same layout
+        as perform_pca. The input data is not kept by the incremental 
+        analysis, so pc_z of this result is None.
+
+        Args:
+            reset: if True, the incremental analysis is started anew on the
+            next call of partial_fit.
+
+        Returns:
+            Tuple (pc_curves, pc_scores, pc_sing, pc_av) of the results.
+        '''
+        inc = self.incremental
+        if inc is None or inc.n_seen == 0:
+            raise Exception("partial_fit needs to be called before finalize!")
+
+        curves = inc.U
+        scores = inc.scores()
+        av = inc.mean[np.newaxis].T
 
-        self.pc_scores.append(scores)
-        self.pc_curves.append(curves)
-        self.pc_av.append(av)
-        self.pc_sing.append(sing)
-        self.pc_z.append(z)
+        self.add_result(PCAResult(av, curves, inc.s, scores,
+                                  total=inc.total, kind='incremental'))
 
-        print('Showing the percentage of covariance of most important PCs:')
+        if reset:
+            self.incremental = None
+
+        echo('Showing the percentage of covariance of most important PCs:')
         self.print_pca_representation()
 
+        return curves, scores, inc.s, av
+
     def show_pca_results_1(self, param1, param1_name='param1', res_idx=0,
-                                 prep_idx=0):
+                                 prep_idx=0, path=None, fmt='png'):
         r''' Function that prints plots showing the result of PCA. This
-        function shows scree plot, PC curves and 1st PC vs 2nd PC scores
-        as well as up to 4th PC scores vs paramters specified in param1.
+        function shows scree plot, PC curves as well as up to 4th PC scores 
+        vs paramters specified in param1. The plots are drawn by the 
+        pca_exp.reporting module, which is only imported here.
 
         Args:
             param1: list or 1D numpy.array of float values of a chosen 
@@ -110,77 +556,38 @@ class PCAMachine:
 
             prep_idx: integer, specyfing the index of prepared data in 
             self.data_handler.
+
+            path: string. If given, the figures are written to the files
+            <path>_1.<fmt> and <path>_2.<fmt> instead of being shown.
+
+            fmt: string, file format of the figures.
+
+        Returns:
+            List of the written paths if path is given.
         '''
 
-        x = self.data_handler.prepared_data[prep_idx][1][:,0]
+        from pca_exp import reporting
 
-        plt.style.use(['dark_background'])
-        plt.rcParams['font.size'] = '12'
-        plt.rcParams['lines.markersize'] = '5'
+        args = reporting.report_args(self, res_idx, prep_idx)
+        args += (param1, param1_name)
 
+        total = self.results[res_idx].total_variance()
 
-        # First figure
-        fig1 = plt.figure(1, figsize=[12, 5], dpi=50)
-        
-        plt.subplot(121)
-        plt.title('PC curves')
-        plt.plot(x, self.pc_curves[res_idx][:,0], '-o', label='1st PC')
-        plt.plot(x, self.pc_curves[res_idx][:,1], '-o', label='2nd PC')
-        plt.plot(x, self.pc_curves[res_idx][:,2], '-o', label='3rd PC')
-        plt.plot(x, self.pc_curves[res_idx][:,3], '-o', label='4th PC')
-        plt.legend()
-        plt.xlabel('x')
-        plt.ylabel('PC vectors')
-        plt.grid()
-
-        plt.subplot(122)
-        plt.title('Scree plot')
-        sing_norm = 100 * self.pc_sing[res_idx] / np.sum(self.pc_sing[res_idx])
-        plt.plot(np.arange(1, sing_norm.size+1), sing_norm, '-sr')
-        plt.xlabel('PC no.')
-        plt.ylabel('Covariance captured [%]')
-        plt.grid()
-
-        plt.tight_layout()
-        
-        # Second figure
-        fig2 = plt.figure(2, figsize=[20, 5], dpi=50)
-        plt.suptitle('Principal component scores vs ' + param1_name)
-        
-        plt.subplot(141)
-        plt.title('1st PC scores')
-        plt.plot(param1, self.pc_scores[res_idx][0,:], 'or')
-        plt.xlabel(param1_name)
-        plt.ylabel('PC scores vs ' + param1_name)
-        plt.grid()
-
-        plt.subplot(142)
-        plt.title('2nd PC scores')
-        plt.plot(param1, self.pc_scores[res_idx][1,:], 'ob')
-        plt.xlabel(param1_name)
-        plt.grid()
-
-        plt.subplot(143)
-        plt.title('3rd PC scores')
-        plt.plot(param1, self.pc_scores[res_idx][2,:], 'og')
-        plt.xlabel(param1_name)
-        plt.grid()
-
-        plt.subplot(144)
-        plt.title('4th PC scores')
-        plt.plot(param1, self.pc_scores[res_idx][3,:], 'oc')
-        plt.xlabel(param1_name)
-        plt.grid()
-
-        plt.tight_layout()
-
-        plt.show()
-
-    def show_pca_results_2(self, param1, param2, res_idx=0, prep_idx=0):
+        if path is None:
+            reporting.show_figures(1, *args, total=total)
+            return
+
+        return reporting.save_figures(reporting.pca_figures_1(*args,
+                                                              total=total),
+                                      path, fmt=fmt)
+
+    def show_pca_results_2(self, param1, param2, res_idx=0, prep_idx=0,
+                           path=None, fmt='png'):
         r''' Function that prints plots showing the result of PCA. This
         function shows scree plot, PC curves and 1st PC vs 2nd PC scores
         as well as up to 4th PC scores vs paramters specified in param1,
-        param2.
+        param2. The plots are drawn by the pca_exp.reporting module, which
+        is only imported here.
 
         Args:
             param1: list or 1D numpy.array of float values of a first chosen 
@@ -194,128 +601,70 @@ class PCAMachine:
 
             prep_idx: integer, specyfing the index of prepared data in 
             self.data_handler.
+
+            path: string. If given, the figures are written to the files
+            <path>_1.<fmt> and <path>_2.<fmt> instead of being shown.
+
+            fmt: string, file format of the figures.
+
+        Returns:
+            List of the written paths if path is given.
         '''
 
-        x = self.data_handler.prepared_data[prep_idx][1][:,0]
+        from pca_exp import reporting
 
-        plt.style.use(['dark_background'])
-        plt.rcParams['font.size'] = '12'
-        plt.rcParams['lines.markersize'] = '5'
+        args = reporting.report_args(self, res_idx, prep_idx)
+        args += (param1, param2)
 
+        total = self.results[res_idx].total_variance()
 
-        # First figure
-        fig1 = plt.figure(1, figsize=[10, 6], dpi=50)
-        
-        plt.subplot(221)
-        plt.title('PC curves')
-        plt.plot(x, self.pc_curves[res_idx][:,0], '-o', label='1st PC')
-        plt.plot(x, self.pc_curves[res_idx][:,1], '-o', label='2nd PC')
-        plt.plot(x, self.pc_curves[res_idx][:,2], '-o', label='3rd PC')
-        plt.plot(x, self.pc_curves[res_idx][:,3], '-o', label='4th PC')
-        plt.legend()
-        plt.xlabel('x')
-        plt.ylabel('PC vectors')
-        plt.grid()
-
-        plt.subplot(222)
-        plt.title('Scree plot')
-        sing_norm = 100 * self.pc_sing[res_idx] / np.sum(self.pc_sing[res_idx])
-        plt.plot(np.arange(1, sing_norm.size+1), sing_norm, '-sr')
-        plt.xlabel('PC no.')
-        plt.ylabel('Covariance captured [%]')
-        plt.grid()
-
-        plt.subplot(223)
-        plt.title('PC1 vs PC2 (param1)')
-        plt.scatter(self.pc_scores[res_idx][0,:], 
-                    self.pc_scores[res_idx][1,:],
-                    c=param1)
-        cbar = plt.colorbar(pad = 0, fraction=0.08)
-        plt.xlabel('PC1 score')
-        plt.ylabel('PC2 score')
-        plt.grid()
-
-        plt.subplot(224)
-        plt.title('PC1 vs PC2 (param1)')
-        plt.scatter(self.pc_scores[res_idx][0,:], 
-                    self.pc_scores[res_idx][1,:],
-                    c=param2)
-        cbar = plt.colorbar(pad = 0, fraction=0.08)
-        plt.xlabel('PC1 score')
-        plt.ylabel('PC2 score')
-        plt.grid()
-
-        plt.tight_layout()
-        
-        # Second figure
-        fig2 = plt.figure(2, figsize=[20, 6], dpi=50)
-        plt.suptitle('Principal component scores vs (param)')
-        
-        plt.subplot(241)
-        plt.title('1st PC scores')
-        plt.plot(param1, self.pc_scores[res_idx][0,:], 'or')
-        plt.xlabel('param1')
-        plt.ylabel('PC scores vs param1')
-        plt.grid()
-
-        plt.subplot(242)
-        plt.title('2nd PC scores')
-        plt.plot(param1, self.pc_scores[res_idx][1,:], 'ob')
-        plt.xlabel('param1')
-        plt.grid()
-
-        plt.subplot(243)
-        plt.title('3rd PC scores')
-        plt.plot(param1, self.pc_scores[res_idx][2,:], 'og')
-        plt.xlabel('param1')
-        plt.grid()
-
-        plt.subplot(244)
-        plt.title('4th PC scores')
-        plt.plot(param1, self.pc_scores[res_idx][3,:], 'oc')
-        plt.xlabel('param1')
-        plt.grid()
-
-        plt.subplot(245)
-        plt.plot(param2, self.pc_scores[res_idx][0,:], 'or')
-        plt.ylabel('PC scores vs param2')
-        plt.xlabel('param2')
-        plt.grid()
-
-        plt.subplot(246)
-        plt.plot(param2, self.pc_scores[res_idx][1,:], 'ob')
-        plt.xlabel('param2')
-        plt.grid()
-
-        plt.subplot(247)
-        plt.plot(param2, self.pc_scores[res_idx][2,:], 'og')
-        plt.xlabel('param2')
-        plt.grid()
-
-        plt.subplot(248)
-        plt.plot(param2, self.pc_scores[res_idx][2,:], 'oc')
-        plt.xlabel('param2')
-        plt.grid()
-
-        plt.tight_layout()
-
-        plt.show()
+        if path is None:
+            reporting.show_figures(2, *args, total=total)
+            return
 
-    def turn_pc_into_2D(self, x_no, res_idx=0):
-        r''' Function takes the results of PCA and turns it back to 2D data.
+        return reporting.save_figures(reporting.pca_figures_2(*args,
+                                                              total=total),
+                                      path, fmt=fmt)
+
+    def save_reports(self, res_indices, param1, param2=None, 
+                     param1_name='param1', loc='.', name='pca', 
+                     prep_idx=None, fmt='png', workers=None):
+        r''' Function writes the plots of several results to files, 
+        rendering them in parallel worker processes. See 
+        pca_exp.reporting.render_reports for the arguments.
+
+        Returns:
+            Dictionary with keys res_idx and values lists of the written 
+            paths.
         '''
 
-        self.pc_av[res_idx] = np.reshape(self.pc_av[res_idx], (x_no, 
-                                        self.pc_ac[res_idx].shape[1] / x_no))
-        self.pc_curves[res_idx] = np.reshape(self.pc_curves[res_idx], (x_no, 
-                                    self.pc_curves[res_idx].shape[1] / x_no))
+        from pca_exp import reporting
 
-        
-        
+        return reporting.render_reports(self, res_indices, param1, 
+                                        param2=param2, 
+                                        param1_name=param1_name, loc=loc,
+                                        name=name, prep_idx=prep_idx, 
+                                        fmt=fmt, workers=workers)
 
-        
+    def turn_pc_into_2D(self, x_no, res_idx=0):
+        r''' Function takes the results of PCA and turns it back to 2D data.
+        The average becomes an image of shape (x_no, y_no) and the PC curves
+        images of shape (x_no, y_no, n_components), where y_no is the number
+        of pixels divided by x_no. The stored result stays flat, so transform
+        and inverse_transform keep working on it.
 
+        Args:
+            x_no: integer number of image rows.
+
+            res_idx: integer, specifing the index of the results stored in 
+            this instance of the class.
 
+        Returns:
+            Tuple of copies of the average image and the PC images.
+        '''
+        y_no = self.pc_av[res_idx].size // x_no
 
+        av = np.reshape(self.pc_av[res_idx], (x_no, y_no)).copy()
+        curves = np.reshape(self.pc_curves[res_idx], (x_no, y_no, -1)).copy()
 
-    
\ No newline at end of file
+        return av, curves
@@ -0,0 +1,155 @@
+# pca_result.py
+
+''' Code contains the class which holds the result of one principal component
+analysis, and the list-like view used by pca_machine to expose the results
+attribute by attribute.
+'''
+
+# libraries
+
+from collections.abc import Sequence
+
+import numpy as np
+
+# internal modules
+
+from pca_exp.utils.utils import CHUNK_BYTES, iter_chunks
+
+
+class PCAResult:
+    r''' Class which holds the result of one PCA. Only the mean, the
+    components, the singular values and the scores are stored; the centred
+    data, reconstructions and residuals are computed on demand from the
+    referenced (not copied) input data.
+
+    Params and attribs:
+        mean: 2D numpy array of shape (n_x, 1), the average measurement.
+
+        components: 2D numpy array with indices [i, j], where i runs through
+        x values and j runs through PC numbers.
+
+        sing: 1D numpy array of singular values.
+
+        scores: 2D numpy array with indices [i, j], where i runs through PC
+        numbers and j runs through measurements.
+
+        data: 2D array the PCA was performed on, or None if it is not
+        available (e.g. incremental PCA).
+
+        prep_ind: integer index of the prepared data in the data handler, or
+        None.
+
+        total: float sum of squares of the centred input data, the total
+        variance the singular values are compared with. Computed from the
+        input data when it is first needed if None.
+
+        kind: string naming the analysis that produced the result: 'pca'
+        (perform_pca), 'weighted' (perform_weighted_pca), 'image'
+        (perform_pca_2D) or 'incremental' (finalize).
+    '''
+
+    __slots__ = ('mean', 'components', 'sing', 'scores', 'data', 'prep_ind',
+                 'total', 'kind')
+
+    def __init__(self, mean, components, sing, scores, data=None,
+                 prep_ind=None, total=None, kind='pca'):
+        self.mean = mean
+        self.components = components
+        self.sing = sing
+        self.scores = scores
+        self.data = data
+        self.prep_ind = prep_ind
+        self.total = total
+        self.kind = kind
+
+    def total_variance(self):
+        r''' Function returns the sum of squares of the centred input data,
+        computed in chunks of measurements on the first call. If neither it
+        nor the input data is available, the sum of the squared singular
+        values is returned, which is the total variance only if all
+        components were kept.
+        '''
+        if self.total is None and self.data is not None:
+            chunk = max(1, CHUNK_BYTES // (8 * self.data.shape[0]))
+            self.total = sum(float(np.sum((self.data[:,sl] - self.mean) ** 2))
+                             for sl in iter_chunks(self.data.shape[1], chunk))
+        if self.total is None:
+            return float(np.sum(np.asarray(self.sing) ** 2))
+        return self.total
+
+    def explained_variance(self):
+        r''' Function returns the fraction of the total variance of the
+        centred data captured by each stored component, sing ** 2 / total.
+        For truncated results the fractions sum to less than one.
+        '''
+        return np.asarray(self.sing) ** 2 / self.total_variance()
+
+    @property
+    def centred(self):
+        r''' The input data with the mean removed, or None if the input data
+        is not available.
+        '''
+        if self.data is None:
+            return None
+        return self.data - self.mean
+
+    def reconstruction(self, n_components=None):
+        r''' Function returns the data reconstructed from the first
+        n_components principal components.
+
+        Args:
+            n_components: integer number of components used. All stored
+            components are used if None.
+        '''
+        k = n_components
+        return self.mean + self.components[:,:k] @ self.scores[:k]
+
+    def residuals(self, n_components=None):
+        r''' Function returns the difference between the input data and its
+        reconstruction from the first n_components principal components.
+
+        Args:
+            n_components: integer number of components used. All stored
+            components are used if None.
+        '''
+        if self.data is None:
+            raise Exception('Input data of this result is not available!')
+        return self.data - self.reconstruction(n_components)
+
+    def nbytes(self):
+        r''' Function returns the number of bytes held by the stored arrays
+        (without the referenced input data).
+        '''
+        return sum(np.asarray(getattr(self, name)).nbytes
+                   for name in ('mean', 'components', 'sing', 'scores'))
+
+
+class ResultView(Sequence):
+    r''' Class which exposes one attribute of a list of PCAResult objects as
+    a list, e.g. PCAMachine.pc_scores. Items of evicted results are None.
+    Setting an item sets the attribute of the result.
+
+    Params:
+        results: list of PCAResult objects (or None for evicted results).
+
+        attr: string, name of the exposed attribute.
+    '''
+
+    def __init__(self, results, attr):
+        self._results = results
+        self._attr = attr
+
+    def __len__(self):
+        return len(self._results)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        result = self._results[idx]
+        return None if result is None else getattr(result, self._attr)
+
+    def __setitem__(self, idx, value):
+        setattr(self._results[idx], self._attr, value)
+
+    def __repr__(self):
+        return 'ResultView(' + self._attr + ', ' + str(len(self)) + ')'
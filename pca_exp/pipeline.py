@@ -0,0 +1,414 @@
+# pipeline.py
+
+''' Code contains the declarative preprocessing pipeline of the DataHandler
+steps load -> slice -> bin -> filter -> prepare. A pipeline is evaluated
+lazily and the output of every step is memoised in a StageStore, keyed by
+the inputs and parameters of the whole chain up to the step, so that e.g. a
+pipeline differing only in the binning reuses the loaded and sliced data.
+'''
+
+# libraries
+
+import os
+import json
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+# internal modules
+
+from pca_exp.data_handler import DataHandler
+
+# Steps that produce batches and steps that end a pipeline.
+BATCH_STEPS = ('load', 'load_array', 'slice', 'bin')
+FINAL_STEPS = ('filter', 'prepare')
+
+
+class StageStore:
+    r''' Class which holds the outputs of pipeline steps in memory, evicting
+    the least recently used ones when their size exceeds max_bytes.
+    Read-only views of the arrays are stored, as later steps and other
+    pipelines share them, while the arrays passed in stay writeable. The
+    size of a value is the sum of nbytes of its arrays, with memory-mapped
+    arrays counted as 0, and slices counted as whole arrays although they
+    share the memory of their parent step. Every value can be stored with
+    owners, objects kept alive as long as the value is stored, e.g. the
+    DataHandlers whose memory-mapped files hold its arrays.
+
+    Params:
+        max_bytes: integer size limit of the store in bytes. Not limited if
+        None.
+
+    Attribs:
+        hits: integer number of values returned from the store.
+
+        misses: integer number of lookups that were not found in the store.
+
+        entries: OrderedDict with keys of the steps and values (value, size,
+        owners) in order of use, the least recently used first.
+    '''
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        r''' Function returns the stored value of a given key or None if it is
+        not in the store.
+        '''
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def owners(self, key):
+        r''' Function returns the tuple of owners of the value of a given key,
+        empty if it is not in the store.
+        '''
+        entry = self.entries.get(key)
+        return entry[2] if entry is not None else ()
+
+    def put(self, key, value, owners=()):
+        r''' Function stores the value of a step, a dictionary of numpy arrays
+        or tuples of them, with its owners, and evicts the least recently
+        used values if the size limit is exceeded. The value itself is kept
+        even if it exceeds the limit alone.
+
+        Returns:
+            The stored value, with read-only views of the arrays of value.
+        '''
+        size = 0
+        stored = {}
+        for name, item in value.items():
+            views = []
+            for arr in (item if isinstance(item, tuple) else (item,)):
+                if not isinstance(arr, np.memmap):
+                    size += arr.nbytes
+                view = arr.view()
+                view.flags.writeable = False
+                views.append(view)
+            stored[name] = (tuple(views) if isinstance(item, tuple)
+                            else views[0])
+
+        self.entries[key] = (stored, size, tuple(owners))
+        self.entries.move_to_end(key)
+
+        if self.max_bytes is not None:
+            while self.size() > self.max_bytes and len(self.entries) > 1:
+                self.entries.popitem(last=False)
+
+        return stored
+
+    def size(self):
+        r''' Function returns the total size of the stored values in bytes.
+        '''
+        return sum(entry[1] for entry in self.entries.values())
+
+    def clear(self):
+        r''' Function removes all stored values.
+        '''
+        self.entries.clear()
+
+    def stats(self):
+        r''' Function returns a dictionary with the number of hits, misses,
+        entries and the total size of the store in bytes.
+        '''
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self.entries), 'bytes': self.size()}
+
+
+def _token(value):
+    r''' Function returns a JSON serialisable description of a parameter,
+    with numpy arrays replaced by the hash of their contents.
+    '''
+    if isinstance(value, np.ndarray):
+        data = np.ascontiguousarray(value)
+        return ['array', value.shape, str(value.dtype),
+                hashlib.sha1(data.view(np.uint8)).hexdigest()]
+    if isinstance(value, (list, tuple)):
+        return [_token(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _token(v) for k, v in sorted(value.items())}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def _batch_list(batch_ind, every):
+    r''' Function returns the list of batch indices of a step: every batch if
+    batch_ind is None, otherwise batch_ind as a list.
+    '''
+    if batch_ind is None:
+        return every
+    if np.ndim(batch_ind) == 0:
+        return [int(batch_ind)]
+    return list(batch_ind)
+
+def _load_paths(params):
+    enum = [meas for meas in range(params['stsp'][0], params['stsp'][1] + 1)
+            if meas not in params['excep']]
+    return [params['loc'] + params['prenum'] + str(meas) + params['ext']
+            for meas in enum]
+
+def _fingerprint(paths):
+    finger = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            finger.append([path, None])
+            continue
+        finger.append([os.path.abspath(path), st.st_size, st.st_mtime_ns])
+    return finger
+
+
+class Pipeline:
+    r''' Class which describes the preprocessing of one or more batches as a
+    chain of steps. Steps return a new Pipeline sharing the store, so chains
+    can branch from a common prefix:
+
+        base = Pipeline(max_bytes=2**30).load((0, 99), 'kt', '.dat', loc)
+        base = base.slice(x_vals=(0.1, 10))
+        coarse = base.bin(np.linspace(0.1, 10, 100)).prepare()
+        fine = base.bin(np.linspace(0.1, 10, 400)).prepare()
+        machine = PCAMachine(fine.data_handler())
+
+    Nothing is computed until batches(), plan(), prepared() or
+    data_handler() is called. Every step is computed on a throwaway
+    DataHandler with its methods and its output is memoised in the store,
+    keyed by the parameters of the chain up to the step. The key of a load
+    step includes the sizes and modification times of the files, so a
+    changed file is loaded again. Descriptions of the other steps, e.g. the
+    hash of an array of load_array, are computed once and inherited by the
+    pipelines branching off. With handler_args storage='mmap', the arrays
+    are memory-mapped files of the throwaway DataHandlers, which are kept
+    alive (see StageStore.owners) while the steps using them are stored, so
+    their files are not deleted under the store.
+
+    Params:
+        store: StageStore shared by the pipeline. A new one is made if None.
+
+        max_bytes: integer size limit of the new store.
+
+        handler_args: keyword arguments of the DataHandler the steps are
+        computed on, e.g. cache or storage.
+
+    Attribs:
+        steps: tuple of (name, params) of the steps of the chain.
+    '''
+
+    def __init__(self, store=None, max_bytes=None, **handler_args):
+        self.store = store if store is not None else StageStore(max_bytes)
+        self.handler_args = handler_args
+        self.steps = ()
+        self._tokens = {}
+
+    def _then(self, name, params):
+        if self.steps and self.steps[-1][0] == 'prepare':
+            raise ValueError('No step can follow prepare.')
+        if self.steps and self.steps[-1][0] == 'filter' and name != 'prepare':
+            raise ValueError('Only prepare can follow filter.')
+        if name not in ('load', 'load_array') and not any(
+                s[0] in ('load', 'load_array') for s in self.steps):
+            raise ValueError('The pipeline needs to load a batch before '
+                             + name + '.')
+
+        pipe = Pipeline(self.store, **self.handler_args)
+        pipe.steps = self.steps + ((name, params),)
+        pipe._tokens = dict(self._tokens)
+        return pipe
+
+    def load(self, stsp, prenum='', ext='', loc='./', excep=[], name='',
+             delimiter=None, skiprows=0, workers=None, executor='auto'):
+        r''' Function adds a batch loaded from files with
+        DataHandler.load_batch, with the same arguments. A pipeline can load
+        several batches, which later steps process together.
+        '''
+        return self._then('load', {'stsp': tuple(stsp), 'prenum': prenum,
+                                   'ext': ext, 'loc': loc,
+                                   'excep': list(excep), 'name': name,
+                                   'delimiter': delimiter,
+                                   'skiprows': skiprows, 'workers': workers,
+                                   'executor': executor})
+
+    def load_array(self, asymm, name=''):
+        r''' Function adds a batch from a numpy array with
+        DataHandler.load_batch_from_array. The array is hashed for the key
+        once and a read-only view of it is stored, so it should not be
+        changed afterwards.
+        '''
+        return self._then('load_array', {'asymm': asymm, 'name': name})
+
+    def slice(self, x_inds=None, x_vals=None, batch_ind=None):
+        r''' Function adds DataHandler.slice_batch of the batches batch_ind,
+        an integer or a list (all batches if None), with the given x_inds or
+        x_vals.
+        '''
+        return self._then('slice', {'x_inds': x_inds, 'x_vals': x_vals,
+                                    'batch_ind': batch_ind})
+
+    def bin(self, x_0, edges=None, empty='nan', batch_ind=None):
+        r''' Function adds DataHandler.bin_data of the batches batch_ind, an
+        integer or a list (all batches if None), with the given x_0, edges
+        and empty.
+        '''
+        return self._then('bin', {'x_0': x_0, 'edges': edges,
+                                  'empty': empty, 'batch_ind': batch_ind})
+
+    def filter(self, plan=None):
+        r''' Function adds the computation of the bin plan of
+        DataHandler.filter_data over all batches. A given plan is used
+        instead.
+        '''
+        return self._then('filter', {'plan': plan})
+
+    def prepare(self):
+        r''' Function adds DataHandler.prepare_XYE_PCA of all batches, with
+        the plan of the filter step if there is one.
+        '''
+        return self._then('prepare', {})
+
+    def key(self, upto=None):
+        r''' Function returns the key of the output of the first upto steps
+        (of all steps if None).
+        '''
+        desc = []
+        for i, (name, params) in enumerate(self.steps[:upto]):
+            if name == 'load':
+                params = {k: v for k, v in params.items()
+                          if k not in ('workers', 'executor')}
+                params['files'] = _fingerprint(_load_paths(params))
+                desc.append([name, _token(params)])
+                continue
+            if i not in self._tokens:
+                self._tokens[i] = [name, _token(params)]
+            desc.append(self._tokens[i])
+
+        return hashlib.sha1(json.dumps(desc, default=str).encode()
+                            ).hexdigest()
+
+    def evaluate(self, upto=None):
+        r''' Function returns the output of the first upto steps (of all
+        steps if None), taken from the store or computed from the output of
+        the previous step. The output is a dictionary with 'batches', a
+        tuple of the batches, after the load, slice and bin steps, 'batches'
+        and 'plan' after the filter step, and 'prepared' and 'plan' after
+        the prepare step.
+        '''
+        return self._evaluate(upto)[0]
+
+    def _evaluate(self, upto=None):
+        r''' Function returns the output of the first upto steps, as
+        evaluate, and the owners of its arrays: the DataHandlers with
+        memory-mapped storage of this and the previous steps.
+        '''
+        upto = len(self.steps) if upto is None else upto
+        if upto == 0:
+            return {'batches': ()}, ()
+
+        key = self.key(upto)
+        value = self.store.get(key)
+        if value is not None:
+            return value, self.store.owners(key)
+
+        value, owners = self._evaluate(upto - 1)
+        value, dh = self._compute(self.steps[upto - 1], value)
+        if dh.storage_path is not None:
+            owners += (dh,)
+
+        return self.store.put(key, value, owners), owners
+
+    def _compute(self, step, value):
+        r''' Function computes the output of a step from the output value of
+        the previous one on a new DataHandler, and returns the output and
+        the handler.
+        '''
+        name, params = step
+        dh = DataHandler(**self.handler_args)
+        dh.batches = list(value['batches'])
+        dh.batches_names = [''] * len(dh.batches)
+        every = list(range(len(dh.batches)))
+
+        if name == 'load':
+            dh.load_batch(params['stsp'], params['prenum'], params['ext'],
+                          params['loc'], params['excep'], params['name'],
+                          delimiter=params['delimiter'],
+                          skiprows=params['skiprows'],
+                          workers=params['workers'],
+                          executor=params['executor'])
+        elif name == 'load_array':
+            dh.load_batch_from_array(params['asymm'], params['name'])
+        elif name == 'slice':
+            for batch_i in _batch_list(params['batch_ind'], every):
+                dh.slice_batch(batch_i, params['x_inds'], params['x_vals'])
+        elif name == 'bin':
+            dh.bin_data(params['x_0'],
+                        _batch_list(params['batch_ind'], every),
+                        edges=params['edges'], empty=params['empty'])
+        elif name == 'filter':
+            plan = params['plan']
+            if plan is None:
+                plan = dh.filter_plan(every)
+            return {'batches': value['batches'], 'plan': np.asarray(plan)}, dh
+        elif name == 'prepare':
+            dh.prepare_XYE_PCA(every, plan=value.get('plan'))
+            return {'prepared': dh.prepared_data[-1],
+                    'plan': dh.prepared_plans[-1]}, dh
+
+        return {'batches': tuple(dh.batches)}, dh
+
+    def _batch_upto(self):
+        upto = len(self.steps)
+        while upto and self.steps[upto - 1][0] not in BATCH_STEPS:
+            upto -= 1
+        return upto
+
+    def batches(self):
+        r''' Function returns the list of read-only batches after the last
+        load, slice or bin step.
+        '''
+        return list(self.evaluate(self._batch_upto())['batches'])
+
+    def plan(self):
+        r''' Function returns the bin plan of the filter or prepare step.
+        '''
+        if not self.steps or self.steps[-1][0] not in FINAL_STEPS:
+            raise ValueError('The pipeline does not end with filter or '
+                             'prepare.')
+        return self.evaluate()['plan']
+
+    def prepared(self):
+        r''' Function returns the read-only prepared data, a 3D numpy array
+        (see DataHandler.prepare_XYE_PCA), of a pipeline ending with
+        prepare.
+        '''
+        if not self.steps or self.steps[-1][0] != 'prepare':
+            raise ValueError('The pipeline does not end with prepare.')
+        return self.evaluate()['prepared']
+
+    def data_handler(self):
+        r''' Function returns a new DataHandler holding the batches of the
+        pipeline and, if it ends with prepare, the prepared data and its plan,
+        e.g. to be passed to PCAMachine. The arrays are the read-only arrays
+        of the store, and the handlers owning their memory-mapped files are
+        kept in dh.owners, so they stay valid after the store evicts them.
+        '''
+        dh = DataHandler(**self.handler_args)
+        value, owners = self._evaluate(self._batch_upto())
+        dh.batches = list(value['batches'])
+        dh.owners = list(owners)
+        dh.batches_names = [params.get('name', '') for name, params
+                            in self.steps if name in ('load', 'load_array')]
+        if self.steps and self.steps[-1][0] == 'prepare':
+            value, owners = self._evaluate()
+            dh.prepared_data.append(value['prepared'])
+            dh.prepared_plans.append(value['plan'])
+            dh.owners += [o for o in owners
+                          if not any(o is h for h in dh.owners)]
+        return dh
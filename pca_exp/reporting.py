@@ -0,0 +1,247 @@
+# reporting.py
+
+''' Code contains the functions that plot the results of PCA. Figures are
+drawn with the object-oriented interface of matplotlib and written to files
+with the Agg backend, so no display and no global figure state are needed.
+The module is imported by pca_machine only when a plot is requested.
+'''
+
+# libraries
+
+import os
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import matplotlib.style
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Style of all figures, applied only while they are drawn.
+STYLE = ['dark_background', {'font.size': 12, 'lines.markersize': 5}]
+
+ORDINALS = ['1st', '2nd', '3rd', '4th']
+COLOURS = ['r', 'b', 'g', 'c']
+
+def _agg_figure(**kwargs):
+    fig = Figure(**kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+def _plot_curves(ax, x, curves):
+    ax.set_title('PC curves')
+    for k in range(min(4, curves.shape[1])):
+        ax.plot(x, curves[:,k], '-o', label=ORDINALS[k] + ' PC')
+    ax.legend()
+    ax.set_xlabel('x')
+    ax.set_ylabel('PC vectors')
+    ax.grid()
+
+def _plot_scree(ax, sing, total=None):
+    ax.set_title('Scree plot')
+    total = np.sum(sing ** 2) if total is None else total
+    sing_norm = 100 * sing ** 2 / total
+    ax.plot(np.arange(1, sing_norm.size+1), sing_norm, '-sr')
+    ax.set_xlabel('PC no.')
+    ax.set_ylabel('Variance captured [%]')
+    ax.grid()
+
+def _plot_scores(axes, scores, param, param_name, titles=True):
+    for k, ax in enumerate(axes[:scores.shape[0]]):
+        if titles:
+            ax.set_title(ORDINALS[k] + ' PC scores')
+        ax.plot(param, scores[k,:], 'o' + COLOURS[k])
+        ax.set_xlabel(param_name)
+        ax.grid()
+    axes[0].set_ylabel('PC scores vs ' + param_name)
+
+def _plot_scatter(fig, ax, scores, param, param_name):
+    ax.set_title('PC1 vs PC2 (' + param_name + ')')
+    points = ax.scatter(scores[0,:], scores[1,:], c=param)
+    fig.colorbar(points, ax=ax, pad=0, fraction=0.08)
+    ax.set_xlabel('PC1 score')
+    ax.set_ylabel('PC2 score')
+    ax.grid()
+
+def pca_figures_1(x, curves, sing, scores, param1, param1_name='param1',
+                  figure=None, total=None):
+    r''' Function draws the PC curves and the scree plot in a first figure
+    and up to 4 PC scores vs param1 in a second figure.
+
+    Args:
+        x: 1D numpy array of x values of the PC curves.
+
+        curves, sing, scores: PC curves, singular values and scores of one
+        result of PCAMachine.
+
+        param1: list or 1D numpy array of a chosen parameter of each
+        measurement.
+
+        param1_name: string of the name of the chosen parameter.
+
+        figure: function creating a figure from figsize and dpi, e.g.
+        matplotlib.pyplot.figure. A figure of the Agg backend is created if
+        None.
+
+        total: float total variance of the centred data (see
+        PCAResult.total_variance) the scree plot is relative to. The sum of
+        sing ** 2 if None, which is only right if all components were kept.
+
+    Returns:
+        Tuple of the two figures.
+    '''
+    figure = figure or _agg_figure
+
+    with matplotlib.style.context(STYLE):
+        fig1 = figure(figsize=[12, 5], dpi=50)
+        ax1, ax2 = fig1.subplots(1, 2)
+        _plot_curves(ax1, x, curves)
+        _plot_scree(ax2, sing, total)
+        fig1.tight_layout()
+
+        fig2 = figure(figsize=[20, 5], dpi=50)
+        fig2.suptitle('Principal component scores vs ' + param1_name)
+        _plot_scores(fig2.subplots(1, 4), scores, param1, param1_name)
+        fig2.tight_layout()
+
+    return fig1, fig2
+
+def pca_figures_2(x, curves, sing, scores, param1, param2, figure=None,
+                  total=None):
+    r''' Function draws the PC curves, the scree plot and the 1st vs 2nd PC
+    scores coloured by param1 and param2 in a first figure and up to 4 PC
+    scores vs param1 and param2 in a second figure.
+
+    Args:
+        x: 1D numpy array of x values of the PC curves.
+
+        curves, sing, scores: PC curves, singular values and scores of one
+        result of PCAMachine.
+
+        param1, param2: lists or 1D numpy arrays of two chosen parameters of
+        each measurement.
+
+        figure, total: as in pca_figures_1.
+
+    Returns:
+        Tuple of the two figures.
+    '''
+    figure = figure or _agg_figure
+
+    with matplotlib.style.context(STYLE):
+        fig1 = figure(figsize=[10, 6], dpi=50)
+        axes = fig1.subplots(2, 2)
+        _plot_curves(axes[0,0], x, curves)
+        _plot_scree(axes[0,1], sing, total)
+        _plot_scatter(fig1, axes[1,0], scores, param1, 'param1')
+        _plot_scatter(fig1, axes[1,1], scores, param2, 'param2')
+        fig1.tight_layout()
+
+        fig2 = figure(figsize=[20, 6], dpi=50)
+        fig2.suptitle('Principal component scores vs (param)')
+        axes = fig2.subplots(2, 4)
+        _plot_scores(axes[0], scores, param1, 'param1')
+        _plot_scores(axes[1], scores, param2, 'param2', titles=False)
+        fig2.tight_layout()
+
+    return fig1, fig2
+
+FIGURES = {1: pca_figures_1, 2: pca_figures_2}
+
+def save_figures(figs, path, fmt='png'):
+    r''' Function writes figures to the files <path>_1.<fmt>, <path>_2.<fmt>,
+    ... and returns their paths. The folder of path is created if it does not
+    exist.
+    '''
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    paths = []
+    for i, fig in enumerate(figs):
+        paths.append(path + '_' + str(i+1) + '.' + fmt)
+        with matplotlib.style.context(STYLE):
+            fig.savefig(paths[-1], format=fmt, facecolor=fig.get_facecolor())
+    return paths
+
+def show_figures(kind, *args, **kwargs):
+    r''' Function draws the figures of a given kind (1 or 2, see FIGURES) in
+    new pyplot windows and shows them. pyplot is only imported here.
+    '''
+    import matplotlib.pyplot as plt
+
+    figs = FIGURES[kind](*args, figure=plt.figure, **kwargs)
+    plt.show()
+    return figs
+
+def _render(kind, path, fmt, args, kwargs):
+    return save_figures(FIGURES[kind](*args, **kwargs), path, fmt=fmt)
+
+def report_args(pca_machine, res_idx, prep_idx=None):
+    r''' Function returns the x values, PC curves, singular values and scores
+    of a result of pca_machine. The x values are taken from the prepared
+    data of the result, or of prep_idx if given.
+    '''
+    if prep_idx is None:
+        prep_idx = pca_machine.results[res_idx].prep_ind or 0
+    x = pca_machine.data_handler.prepared_data[prep_idx][1][:,0]
+
+    return (np.asarray(x), np.asarray(pca_machine.pc_curves[res_idx]),
+            np.asarray(pca_machine.pc_sing[res_idx]),
+            np.asarray(pca_machine.pc_scores[res_idx]))
+
+def render_reports(pca_machine, res_indices, param1, param2=None,
+                   param1_name='param1', loc='.', name='pca', prep_idx=None,
+                   fmt='png', workers=None):
+    r''' Function writes the figures of several results of pca_machine to
+    files, rendering the results in parallel worker processes. The figures of
+    pca_figures_2 are drawn if param2 is given, else those of pca_figures_1.
+
+    Args:
+        pca_machine: PCAMachine holding the results.
+
+        res_indices: list of integer indices of the results.
+
+        param1, param2: lists or 1D numpy arrays of chosen parameters of each
+        measurement.
+
+        param1_name: string of the name of param1 (pca_figures_1 only).
+
+        loc: string, folder of the files. Created if it does not exist.
+
+        name: string, files of result res_idx are named
+        <name>_<res_idx>_<figure number>.<fmt>.
+
+        prep_idx: integer index of the prepared data holding the x values.
+        The prepared data of each result is used if None.
+
+        fmt: string, file format understood by matplotlib.
+
+        workers: integer number of worker processes. Results are rendered in
+        this process if 1, and the default of ProcessPoolExecutor is used if
+        None. Workers are started with 'spawn'.
+
+    Returns:
+        Dictionary with keys res_idx and values lists of the written paths.
+    '''
+    os.makedirs(loc, exist_ok=True)
+
+    if param2 is None:
+        kind, extra, kwargs = 1, (param1,), {'param1_name': param1_name}
+    else:
+        kind, extra, kwargs = 2, (param1, param2), {}
+
+    tasks = {}
+    for res_idx in res_indices:
+        args = report_args(pca_machine, res_idx, prep_idx) + extra
+        path = os.path.join(loc, name + '_' + str(res_idx))
+        total = pca_machine.results[res_idx].total_variance()
+        tasks[res_idx] = (kind, path, fmt, args, dict(kwargs, total=total))
+
+    if workers == 1:
+        return {res_idx: _render(*task) for res_idx, task in tasks.items()}
+
+    with ProcessPoolExecutor(workers,
+                             mp_context=mp.get_context('spawn')) as pool:
+        futures = {res_idx: pool.submit(_render, *task)
+                   for res_idx, task in tasks.items()}
+        return {res_idx: future.result()
+                for res_idx, future in futures.items()}
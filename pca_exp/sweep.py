@@ -0,0 +1,231 @@
+# sweep.py
+
+''' Code contains the runner of sweeps over the preprocessing and PCA
+settings: every combination of slicing cut-offs and binning grids of a grid
+is prepared with a Pipeline and analysed with PCAMachine in a process pool,
+and the scree fractions, score summaries and reconstruction errors of every
+number of components are collected into one table.
+'''
+
+# libraries
+
+import csv
+import json
+import itertools
+import contextlib
+from concurrent.futures import as_completed
+
+import numpy as np
+
+# internal modules
+
+from pca_exp.pipeline import Pipeline
+from pca_exp.pca_machine import PCAMachine
+from pca_exp.utils.scheduler import SpawnPool
+from pca_exp.utils import instrument
+
+# Columns of the table, in order. Columns holding a value for every
+# component are written to CSV as JSON lists.
+COLUMNS = ('point', 'x_vals', 'x_0', 'n_bins', 'n_x', 'n_components',
+           'explained', 'rel_error', 'chi2', 'scree', 'score_std',
+           'score_min', 'score_max', 'error')
+
+# Pipeline of the loaded batches and the settings of the sweep shared by the
+# points of one worker process, set by _init_worker.
+_shared = {}
+
+def _init_worker(batches, names, x_0_grid, n_components, max_bytes,
+                 quiet):
+    pipe = Pipeline(max_bytes=max_bytes)
+    for batch, name in zip(batches, names):
+        pipe = pipe.load_array(batch, name)
+    pipe.batches()
+
+    _shared['base'] = pipe
+    _shared['x_0_grid'] = x_0_grid
+    _shared['n_components'] = n_components
+    _shared['quiet'] = quiet
+
+def _run_point(point, x_vals, b):
+    r''' Function prepares the data with the cut-offs x_vals and the binning
+    grid b of the sweep, performs one PCA with the largest number of
+    components and returns the rows of every number of components. A point
+    that fails returns a single row with the error message.
+    '''
+    try:
+        return point, _point_rows(point, x_vals, b)
+    except Exception as err:
+        x_0 = _shared['x_0_grid'][b]
+        row = dict.fromkeys(COLUMNS)
+        row.update({'point': point,
+                    'x_vals': None if x_vals is None else list(x_vals),
+                    'x_0': b, 'n_bins': None if x_0 is None else x_0.size,
+                    'error': type(err).__name__ + ': ' + str(err)})
+        return point, [row]
+
+def _point_rows(point, x_vals, b):
+    x_0 = _shared['x_0_grid'][b]
+    n_list = _shared['n_components']
+
+    pipe = _shared['base']
+    if x_vals is not None:
+        pipe = pipe.slice(x_vals=tuple(x_vals))
+    if x_0 is not None:
+        # Bins outside of the cut-offs are empty and dropped.
+        pipe = pipe.bin(x_0, empty='drop')
+    pipe = pipe.prepare()
+
+    a, e = pipe.prepared()[0], pipe.prepared()[2]
+    machine = PCAMachine(pipe.data_handler())
+    silence = instrument.quiet if _shared['quiet'] else contextlib.nullcontext
+    with silence():
+        machine.perform_pca(n_components=min(max(n_list), *a.shape))
+    res = machine.results[-1]
+
+    z = a - res.mean
+    total = np.sum(z ** 2)
+    fractions = res.sing ** 2 / total
+
+    rows = []
+    for n in n_list:
+        n = min(n, res.sing.size)
+        resid = z - np.dot(res.components[:,:n], res.scores[:n])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            chi2 = float(np.mean((resid / e) ** 2))
+        scores = res.scores[:n]
+        rows.append({'point': point,
+                     'x_vals': None if x_vals is None else list(x_vals),
+                     'x_0': b, 'n_bins': None if x_0 is None else x_0.size,
+                     'n_x': a.shape[0], 'n_components': n,
+                     'explained': float(np.sum(fractions[:n])),
+                     'rel_error': float(np.sqrt(np.sum(resid ** 2) / total)),
+                     'chi2': chi2,
+                     'scree': fractions[:n].tolist(),
+                     'score_std': np.std(scores, axis=1).tolist(),
+                     'score_min': np.min(scores, axis=1).tolist(),
+                     'score_max': np.max(scores, axis=1).tolist(),
+                     'error': None})
+
+    return rows
+
+def iter_sweep(base, grid, workers=None, blas=1, max_bytes=None,
+               quiet=True):
+    r''' Generator which runs the points of a sweep in a process pool and
+    yields their rows as the points finish. The batches of base are
+    evaluated once in this process and sent to every worker, which keeps
+    its own Pipeline store, so the loading is shared by all points and a
+    slice is reused by the points of a worker with the same cut-offs. One
+    PCA with the largest number of components serves all numbers of
+    components of a point.
+
+    Args:
+        base: pipeline.Pipeline of the load steps (and optionally further
+        batch steps) common to all points.
+
+        grid: dictionary with optional keys 'x_vals', a list of tuples
+        (x_start_val, x_stop_val) of DataHandler.slice_batch, 'x_0', a list
+        of 1D numpy arrays of bin centres of DataHandler.bin_data, and
+        'n_components', a list of integer numbers of principal components.
+        None in the lists of 'x_vals' and 'x_0' skips the step, which is the
+        default of missing keys. The default of 'n_components' is [1, 2, 3,
+        4, 5].
+
+        workers: integer number of worker processes. Points are run in this
+        process if 1, and the default of ProcessPoolExecutor is used if None.
+
+        blas: integer number of BLAS threads of each worker, or None to keep
+        the environment of this process.
+
+        max_bytes: integer size limit of the Pipeline store of each worker.
+
+        quiet: if True, the progress messages of PCAMachine are silenced.
+
+    Yields:
+        Tuples (point, rows) of the index of the point in the product of
+        grid['x_vals'] and grid['x_0'] and the list of its rows, one
+        dictionary with the keys COLUMNS for each number of components:
+        x_0 is the index of the grid in grid['x_0'], n_x the number of x
+        values of the prepared data, scree the fractions of the variance of
+        the centred data explained by each component, explained their sum,
+        rel_error the Frobenius norm of the residual of the reconstruction
+        relative to the centred data, chi2 the mean squared residual in units
+        of the prepared errors, and score_std, score_min and score_max the
+        summaries of the scores of each component. Bins of grid['x_0']
+        without data are dropped. A point whose preparation or PCA fails
+        yields one row with the message of the exception in 'error' and
+        None in the columns it could not compute; error is None in the other
+        rows.
+    '''
+    x_vals_grid = list(grid.get('x_vals', [None]))
+    x_0_grid = [None if x_0 is None else np.asarray(x_0, dtype=float)
+                for x_0 in grid.get('x_0', [None])]
+    n_components = sorted(grid.get('n_components', [1, 2, 3, 4, 5]))
+
+    names = [params.get('name', '') for name, params in base.steps
+             if name in ('load', 'load_array')]
+    initargs = (base.batches(), names, x_0_grid, n_components, max_bytes,
+                quiet)
+    points = list(itertools.product(x_vals_grid, range(len(x_0_grid))))
+
+    if workers == 1:
+        old = _shared.copy()
+        _init_worker(*initargs)
+        try:
+            for point, (x_vals, b) in enumerate(points):
+                yield _run_point(point, x_vals, b)
+        finally:
+            _shared.clear()
+            _shared.update(old)
+        return
+
+    with SpawnPool(workers, blas, _init_worker, initargs) as pool:
+        futures = [pool.submit(_run_point, point, x_vals, b)
+                   for point, (x_vals, b) in enumerate(points)]
+        for future in as_completed(futures):
+            yield future.result()
+
+def run_sweep(base, grid, workers=None, blas=1, max_bytes=None, quiet=True,
+              callback=None):
+    r''' Function runs a sweep (see iter_sweep, with the same arguments) and
+    returns its table.
+
+    Args:
+        callback: function called as callback(point, rows) as the points
+        finish, e.g. to report progress. Optional.
+
+    Returns:
+        List of the rows of all points, ordered by point and number of
+        components.
+    '''
+    table = {}
+    for point, rows in iter_sweep(base, grid, workers, blas, max_bytes,
+                                  quiet):
+        table[point] = rows
+        if callback is not None:
+            callback(point, rows)
+
+    return [row for point in sorted(table) for row in table[point]]
+
+def best_rows(table, key='rel_error', per='n_components'):
+    r''' Function returns, for every value of the column per, the row of the
+    table with the smallest value of the column key. Rows of failed points
+    are skipped.
+    '''
+    best = {}
+    for row in table:
+        if row['error'] is not None:
+            continue
+        if row[per] not in best or row[key] < best[row[per]][key]:
+            best[row[per]] = row
+    return [best[v] for v in sorted(best)]
+
+def save_table(table, path):
+    r''' Function writes the table of run_sweep to a CSV file, with list
+    values as JSON.
+    '''
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for row in table:
+            writer.writerow([json.dumps(row[c]) if isinstance(row[c], list)
+                             else row[c] for c in COLUMNS])
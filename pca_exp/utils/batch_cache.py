@@ -0,0 +1,173 @@
+# batch_cache.py
+
+''' Code contains the class which caches parsed batches of data on disk, so
+that the text files do not need to be parsed again after a restart.
+'''
+
+# libraries
+
+import os
+import json
+import hashlib
+
+import numpy as np
+
+class BatchCache:
+    r''' Class which stores loaded batches as .npy files in a folder. Entries
+    are keyed by the paths, sizes and modification times of the source files
+    and by the parse options, so a change of any file invalidates its entry.
+    The total size of the cache is limited by evicting the least recently
+    used entries.
+
+    Params:
+        loc: string, folder of the cache. Created if it does not exist.
+
+        max_bytes: integer size limit of the cache in bytes. Not limited if
+        None.
+
+        mmap: if True, cached batches are returned as read-only memory-mapped
+        arrays instead of being read into memory.
+
+    Attribs:
+        hits: integer number of batches returned from the cache.
+
+        misses: integer number of lookups that were not found in the cache.
+
+        index: dictionary with keys of the entries and values holding the
+        file name, size in bytes and last use of each entry.
+    '''
+
+    def __init__(self, loc, max_bytes=None, mmap=True):
+        self.loc = loc
+        self.max_bytes = max_bytes
+        self.mmap = mmap
+        self.hits = 0
+        self.misses = 0
+        self._clock = 0
+
+        os.makedirs(loc, exist_ok=True)
+        self.index_path = os.path.join(loc, 'index.json')
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+            self._clock = max([e['last_used'] for e in self.index.values()],
+                              default=0)
+        else:
+            self.index = {}
+
+    def make_key(self, paths, **options):
+        r''' Function returns the key of a batch loaded from the given files
+        with the given parse options, or None if some of the files do not
+        exist.
+
+        Args:
+            paths: list of strings, paths of the files of the batch.
+
+            options: parse options, e.g. delimiter and skiprows.
+        '''
+        finger = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return None
+            finger.append([os.path.abspath(path), st.st_size, st.st_mtime_ns])
+
+        desc = json.dumps([finger, sorted(options.items())], default=str)
+        return hashlib.sha1(desc.encode()).hexdigest()
+
+    def get(self, key):
+        r''' Function returns the cached batch of a given key or None if it is
+        not in the cache.
+
+        Args:
+            key: string returned by make_key.
+        '''
+        entry = self.index.get(key) if key is not None else None
+        path = os.path.join(self.loc, entry['file']) if entry else None
+
+        if entry is None or not os.path.exists(path):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._touch(key)
+        self._save_index()
+
+        return np.load(path, mmap_mode='r' if self.mmap else None)
+
+    def put(self, key, batch):
+        r''' Function stores a batch in the cache under the given key and
+        evicts the least recently used entries if the size limit is exceeded.
+
+        Args:
+            key: string returned by make_key.
+
+            batch: numpy array of the batch.
+        '''
+        if key is None:
+            return
+
+        name = key + '.npy'
+        np.save(os.path.join(self.loc, name), batch)
+
+        self.index[key] = {'file': name, 'bytes': int(batch.nbytes),
+                           'last_used': 0}
+        self._touch(key)
+        self._evict(keep=key)
+        self._save_index()
+
+    def invalidate(self, key=None):
+        r''' Function removes the entry of a given key from the cache. All
+        entries are removed if key is None.
+
+        Args:
+            key: string returned by make_key, or None.
+        '''
+        keys = list(self.index) if key is None else [key]
+
+        for k in keys:
+            entry = self.index.pop(k, None)
+            if entry is not None:
+                try:
+                    os.remove(os.path.join(self.loc, entry['file']))
+                except OSError:
+                    pass
+
+        self._save_index()
+
+    def size(self):
+        r''' Function returns the total size of the cached batches in bytes.
+        '''
+        return sum(entry['bytes'] for entry in self.index.values())
+
+    def stats(self):
+        r''' Function returns a dictionary with the number of hits, misses,
+        entries and the total size of the cache in bytes.
+        '''
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self.index), 'bytes': self.size()}
+
+    def _touch(self, key):
+        self._clock += 1
+        self.index[key]['last_used'] = self._clock
+
+    def _evict(self, keep=None):
+        if self.max_bytes is None:
+            return
+
+        lru = sorted(self.index, key=lambda k: self.index[k]['last_used'])
+        total = self.size()
+
+        for k in lru:
+            if total <= self.max_bytes:
+                break
+            if k == keep:
+                continue
+            total -= self.index[k]['bytes']
+            self.invalidate(k)
+
+    def _save_index(self):
+        with open(self.index_path, 'w') as f:
+            json.dump(self.index, f)
@@ -0,0 +1,323 @@
+# instrument.py
+
+''' Code contains the instrumentation layer of the package. Functions
+decorated with stage report a Record (wall time, CPU time, peak allocation
+and array shapes) of every call to the registered hooks, e.g. a Profiler.
+Without hooks the decorated functions only pay for one check of a list. The
+module also holds the quiet switch of the progress messages of the package.
+'''
+
+# libraries
+
+import io
+import csv
+import json
+import time
+import functools
+import contextlib
+import tracemalloc
+
+import numpy as np
+
+# Registered hooks, functions called with every finished Record.
+_hooks = []
+
+# Stack of the open stages and the memory tracing state.
+_state = {'quiet': False, 'memory': 0, 'stack': []}
+
+
+class Record:
+    r''' Class which holds the measurement of one call of a stage.
+
+    Attribs:
+        stage: string name of the stage.
+
+        start: float time.time() at the start of the call.
+
+        wall: float wall time of the call in seconds.
+
+        cpu: float CPU time of the process during the call in seconds.
+
+        peak_bytes: integer peak memory allocated during the call above the
+        memory at its start, or None if memory was not traced.
+
+        shapes: dictionary of the shapes of arrays passed to and returned by
+        the call.
+
+        depth: integer number of stages the call is nested in.
+    '''
+
+    __slots__ = ('stage', 'start', 'wall', 'cpu', 'peak_bytes', 'shapes',
+                 'depth')
+
+    def __init__(self, stage, start, wall, cpu, peak_bytes, shapes, depth):
+        self.stage = stage
+        self.start = start
+        self.wall = wall
+        self.cpu = cpu
+        self.peak_bytes = peak_bytes
+        self.shapes = shapes
+        self.depth = depth
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return 'Record(' + self.stage + ', ' + '{:.4g}'.format(self.wall) \
+            + ' s)'
+
+
+def add_hook(hook):
+    r''' Function registers a hook, a function called with every Record.
+    '''
+    _hooks.append(hook)
+
+def remove_hook(hook):
+    r''' Function removes a registered hook.
+    '''
+    _hooks.remove(hook)
+
+def enabled():
+    r''' Function returns True if any hook is registered.
+    '''
+    return bool(_hooks)
+
+def echo(*args, **kwargs):
+    r''' Function prints its arguments as print does, unless quiet mode is
+    on. Used by the package instead of print for progress messages.
+    '''
+    if not _state['quiet']:
+        print(*args, **kwargs)
+
+def set_quiet(quiet=True):
+    r''' Function switches quiet mode, which silences the progress messages
+    of the package, on or off.
+    '''
+    _state['quiet'] = quiet
+
+def is_quiet():
+    r''' Function returns True if quiet mode is on.
+    '''
+    return _state['quiet']
+
+@contextlib.contextmanager
+def quiet():
+    r''' Context manager which silences the progress messages of the package
+    inside its block.
+    '''
+    old = _state['quiet']
+    _state['quiet'] = True
+    try:
+        yield
+    finally:
+        _state['quiet'] = old
+
+def _array_shapes(args, kwargs, result):
+    shapes = {}
+    for i, arg in enumerate(args):
+        if isinstance(arg, np.ndarray):
+            shapes['arg' + str(i)] = arg.shape
+    for name, arg in kwargs.items():
+        if isinstance(arg, np.ndarray):
+            shapes[name] = arg.shape
+
+    results = result if isinstance(result, tuple) else (result,)
+    for i, res in enumerate(results):
+        if isinstance(res, np.ndarray):
+            shapes['out' + str(i)] = res.shape
+
+    return shapes
+
+def stage(name=None, shapes=None):
+    r''' Decorator which makes a function an instrumented stage.
+
+    Args:
+        name: string name of the stage. The qualified name of the function
+        if None.
+
+        shapes: function called as shapes(args, kwargs, result) returning a
+        dictionary of shapes recorded for the call, e.g. of arrays held by
+        the instance. By default the shapes of the array arguments and
+        results are recorded.
+    '''
+    def decorator(func):
+        stage_name = name or func.__qualname__
+        get_shapes = shapes or _array_shapes
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _hooks:
+                return func(*args, **kwargs)
+
+            frame = _enter()
+            start = time.time()
+            wall = time.perf_counter()
+            cpu = time.process_time()
+
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                wall = time.perf_counter() - wall
+                cpu = time.process_time() - cpu
+                peak = _leave(frame)
+
+            try:
+                found = get_shapes(args, kwargs, result)
+            except Exception:
+                found = {}
+
+            record = Record(stage_name, start, wall, cpu, peak,
+                            {k: tuple(v) for k, v in found.items()},
+                            len(_state['stack']))
+            for hook in list(_hooks):
+                hook(record)
+
+            return result
+
+        return wrapper
+    return decorator
+
+def _enter():
+    frame = {'base': None, 'seen': 0}
+    if _state['memory'] and tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        if _state['stack']:
+            parent = _state['stack'][-1]
+            parent['seen'] = max(parent['seen'], peak)
+        tracemalloc.reset_peak()
+        frame['base'] = current
+    _state['stack'].append(frame)
+    return frame
+
+def _leave(frame):
+    _state['stack'].pop()
+    if frame['base'] is None or not tracemalloc.is_tracing():
+        return None
+
+    peak = max(frame['seen'], tracemalloc.get_traced_memory()[1])
+    if _state['stack']:
+        parent = _state['stack'][-1]
+        parent['seen'] = max(parent['seen'], peak)
+
+    return peak - frame['base']
+
+
+class Profiler:
+    r''' Class which collects the Records of all stages while it is active.
+    Used as a context manager:
+
+        with Profiler(memory=True, quiet=True) as prof:
+            pca_machine.perform_pca()
+        print(prof.summary())
+
+    Params:
+        memory: if True, peak allocations are traced with tracemalloc, which
+        slows down allocation heavy code.
+
+        quiet: if True, the progress messages of the package are silenced
+        while the profiler is active.
+
+    Attribs:
+        records: list of Record objects in the order the calls finished.
+    '''
+
+    def __init__(self, memory=True, quiet=False):
+        self.memory = memory
+        self.quiet = quiet
+        self.records = []
+        self._started_tracing = False
+        self._old_quiet = None
+
+    def __call__(self, record):
+        self.records.append(record)
+
+    def start(self):
+        r''' Function registers the profiler as a hook.
+        '''
+        if self.memory:
+            _state['memory'] += 1
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+        if self.quiet:
+            self._old_quiet = _state['quiet']
+            _state['quiet'] = True
+        add_hook(self)
+        return self
+
+    def stop(self):
+        r''' Function removes the profiler from the hooks.
+        '''
+        remove_hook(self)
+        if self.memory:
+            _state['memory'] -= 1
+            if self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+        if self.quiet:
+            _state['quiet'] = self._old_quiet
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def totals(self):
+        r''' Function returns a dictionary with keys stage names and values
+        dictionaries of the number of calls, total wall and CPU time and
+        maximal peak allocation of the stage.
+        '''
+        out = {}
+        for rec in self.records:
+            tot = out.setdefault(rec.stage, {'calls': 0, 'wall': 0.0,
+                                             'cpu': 0.0, 'peak_bytes': None})
+            tot['calls'] += 1
+            tot['wall'] += rec.wall
+            tot['cpu'] += rec.cpu
+            if rec.peak_bytes is not None:
+                tot['peak_bytes'] = max(tot['peak_bytes'] or 0,
+                                        rec.peak_bytes)
+        return out
+
+    def summary(self):
+        r''' Function returns the totals of every stage as a text table
+        sorted by wall time.
+        '''
+        lines = ['{:<40} {:>6} {:>11} {:>11} {:>11}'.format(
+            'stage', 'calls', 'wall [s]', 'cpu [s]', 'peak [MB]')]
+        totals = self.totals()
+        for name in sorted(totals, key=lambda k: -totals[k]['wall']):
+            tot = totals[name]
+            peak = tot['peak_bytes']
+            lines.append('{:<40} {:>6} {:>11.4f} {:>11.4f} {:>11}'.format(
+                name, tot['calls'], tot['wall'], tot['cpu'],
+                '-' if peak is None else '{:.2f}'.format(peak / 2**20)))
+        return '\n'.join(lines)
+
+    def to_json(self, path=None):
+        r''' Function returns the records as a JSON string and writes it to
+        path if given.
+        '''
+        text = json.dumps([rec.as_dict() for rec in self.records], indent=1)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def to_csv(self, path=None):
+        r''' Function returns the records as CSV text, with the shapes as a
+        JSON column, and writes it to path if given.
+        '''
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(Record.__slots__)
+        for rec in self.records:
+            row = rec.as_dict()
+            row['shapes'] = json.dumps(row['shapes'])
+            writer.writerow([row[name] for name in Record.__slots__])
+
+        if path is not None:
+            with open(path, 'w', newline='') as f:
+                f.write(buf.getvalue())
+        return buf.getvalue()
@@ -0,0 +1,196 @@
+# loaders.py
+
+''' Code contains the functions that parse the text files with measurements
+and load them concurrently into one array.
+'''
+
+# libraries
+
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+
+# Smallest number of files parsed by a process pool with executor='auto'.
+# parse_columns holds the GIL for most of its time, so threads barely run in
+# parallel, and below this count starting the processes costs more than the
+# parsing they save.
+PROCESS_MIN_FILES = 32
+
+class BatchLoadError(Exception):
+    r''' Exception raised when some of the files of a batch could not be
+    parsed.
+
+    Attribs:
+        errors: dictionary with paths of the failed files as keys and error
+        messages as values.
+    '''
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('Could not load ' + str(len(errors)) + ' file(s):\n'
+                         + '\n'.join(path + ': ' + msg
+                                     for path, msg in errors.items()))
+
+def parse_columns(path, delimiter=None, skiprows=0):
+    r''' Function reads a text file with columns of numbers into a 2D numpy
+    array. The whole file is split into rows of tokens, which are converted
+    to floats in bulk, and np.loadtxt is used as a fallback for files that
+    are not a plain table (e.g. with rows of different lengths, which it
+    rejects).
+
+    Args:
+        path: string, path of the file.
+
+        delimiter: string separating the columns. Whitespace if None.
+
+        skiprows: integer number of lines skipped at the top of the file.
+    '''
+    with open(path) as f:
+        text = f.read()
+
+    if skiprows:
+        parts = text.split('\n', skiprows)
+        text = parts[skiprows] if len(parts) > skiprows else ''
+    if '#' in text:
+        text = '\n'.join(line.split('#', 1)[0] for line in text.splitlines())
+    if delimiter is not None:
+        text = text.replace(delimiter, ' ')
+
+    rows = [line.split() for line in text.split('\n') if line.strip()]
+
+    try:
+        values = np.array(rows, dtype=float)
+    except ValueError:
+        values = None
+
+    if values is None or values.ndim != 2 or values.shape[1] == 0:
+        return np.loadtxt(path, delimiter=delimiter, skiprows=skiprows,
+                          ndmin=2)
+
+    return values
+
+def _parse_safe(path, delimiter, skiprows):
+    try:
+        return parse_columns(path, delimiter, skiprows), None
+    except Exception as err:
+        return None, type(err).__name__ + ': ' + str(err)
+
+def _shape_error(shape, expected):
+    return 'Shape ' + str(shape) + ' differs from ' + str(expected) + '.'
+
+def load_files(paths, delimiter=None, skiprows=0, workers=None,
+               executor='auto', out=None, alloc=np.empty, shape=None,
+               skip=False):
+    r''' Function parses a list of files concurrently and writes them into
+    one array with indices [i, j, k], where i runs through rows of the files,
+    j runs through files and k runs through columns. All files must have the
+    same number of rows and columns.
+
+    Args:
+        paths: list of strings, paths of the files.
+
+        delimiter: string separating the columns. Whitespace if None.
+
+        skiprows: integer number of lines skipped at the top of each file.
+
+        workers: integer number of workers. Files are parsed one after
+        another if 1, and the default of the executor (the number of CPUs
+        for 'auto') is used if None.
+
+        executor: string, 'thread' for a thread pool, 'process' for a
+        process pool, or 'auto' for a process pool if there are more than 
+        one worker and at least PROCESS_MIN_FILES files, and parsing one
+        file after another otherwise. The parser holds the GIL, so a thread
+        pool gives little speedup; the process pool avoids it, but the 
+        parsed arrays are copied back to the main process. Scripts using a
+        process pool on platforms that spawn processes (Windows, macOS) need
+        the if __name__ == '__main__' guard.
+
+        out: optional preallocated 3D array (e.g. memory-mapped) the files
+        are written to. Allocated from the shape of the first file if None.
+
+        alloc: function taking a shape and returning the array allocated
+        when out is None.
+
+        shape: tuple of two integers (rows, columns) every file must have.
+        The shape of the first file that is parsed if None.
+
+        skip: if True, the files that could not be parsed are left out
+        instead of raising BatchLoadError.
+
+    Returns:
+        3D numpy array of the files. With skip, a tuple (batch, errors) of
+        the array of the parsed files, in the order of paths (None if no
+        file was parsed), and the dictionary of errors of BatchLoadError.
+
+    Raises:
+        BatchLoadError listing every file that could not be parsed or has a
+        different shape than the others.
+    '''
+    errors = {}
+    paths = list(paths)
+
+    for j_first, path in enumerate(paths):
+        first, msg = _parse_safe(path, delimiter, skiprows)
+        if msg is None and shape is not None and first.shape != tuple(shape):
+            msg = _shape_error(first.shape, tuple(shape))
+        if msg is None:
+            break
+        errors[path] = msg
+    else:
+        if skip:
+            return None, errors
+        raise BatchLoadError(errors)
+
+    if out is None:
+        out = alloc((first.shape[0], len(paths), first.shape[1]))
+
+    def store(j, path, arr, msg):
+        if msg is not None:
+            errors[path] = msg
+        elif arr.shape != first.shape:
+            errors[path] = _shape_error(arr.shape, first.shape)
+        else:
+            out[:,j,:] = arr
+
+    out[:,j_first,:] = first
+    rest = list(enumerate(paths))[j_first + 1:]
+
+    if executor == 'auto':
+        if (workers or os.cpu_count() or 1) > 1 and (len(paths)
+                                                     >= PROCESS_MIN_FILES):
+            executor = 'process'
+        else:
+            workers = 1
+
+    if workers == 1 or len(rest) < 2:
+        for j, path in rest:
+            store(j, path, *_parse_safe(path, delimiter, skiprows))
+    elif executor == 'thread':
+        def task(item):
+            store(item[0], item[1], *_parse_safe(item[1], delimiter,
+                                                 skiprows))
+        with ThreadPoolExecutor(workers) as pool:
+            list(pool.map(task, rest))
+    elif executor == 'process':
+        with ProcessPoolExecutor(workers) as pool:
+            results = pool.map(_parse_safe, [path for _, path in rest],
+                               [delimiter] * len(rest),
+                               [skiprows] * len(rest),
+                               chunksize=max(1, len(rest) // 64))
+            for (j, path), result in zip(rest, results):
+                store(j, path, *result)
+    else:
+        raise ValueError("executor should be 'auto', 'thread' or "
+                         + "'process'.")
+
+    if skip:
+        if errors:
+            out = out[:,[j for j, path in enumerate(paths)
+                         if path not in errors],:]
+        return out, errors
+    if errors:
+        raise BatchLoadError(errors)
+
+    return out
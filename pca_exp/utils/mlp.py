@@ -0,0 +1,216 @@
+# mlp.py
+
+''' Code contains a small multilayer perceptron classifier written in numpy,
+used by the confusion_machine module instead of TensorFlow. Several
+independent networks of the same architecture (heads) are trained side by
+side with batched matrix products.
+'''
+
+# libraries
+
+import numpy as np
+
+def _linear(x):
+    return x
+
+def _linear_grad(g, y):
+    return g
+
+def _relu(x):
+    return np.maximum(x, 0)
+
+def _relu_grad(g, y):
+    return g * (y > 0)
+
+def _sigmoid(x):
+    return 0.5 * (1 + np.tanh(0.5 * x))
+
+def _sigmoid_grad(g, y):
+    return g * y * (1 - y)
+
+def _tanh_grad(g, y):
+    return g * (1 - y ** 2)
+
+def _softmax(x):
+    e = np.exp(x - np.max(x, axis=-1, keepdims=True))
+    return e / np.sum(e, axis=-1, keepdims=True)
+
+def _softmax_grad(g, y):
+    return y * (g - np.sum(g * y, axis=-1, keepdims=True))
+
+# Activations given by name (as in keras) with the derivative expressed by
+# the gradient of the output g and the output y.
+ACTIVATIONS = {
+    None: (_linear, _linear_grad),
+    'linear': (_linear, _linear_grad),
+    'relu': (_relu, _relu_grad),
+    'sigmoid': (_sigmoid, _sigmoid_grad),
+    'tanh': (np.tanh, _tanh_grad),
+    'softmax': (_softmax, _softmax_grad),
+}
+
+
+class StackedMLP:
+    r''' Class of no_heads independent multilayer perceptrons with the same
+    architecture, trained side by side on their own labels with the softmax
+    cross entropy of their outputs (keras SparseCategoricalCrossentropy with
+    from_logits=True) and the Adam optimiser with keras default parameters.
+    Without hidden layers the networks are logistic regressions.
+
+    Params:
+        neuron_vector: list of integers, number of input features followed
+        by the number of neurons of each hidden layer.
+
+        activation_vector: list of names of the activations of each hidden
+        layer followed by the activation of the output layer (None for a
+        linear output).
+
+        no_heads: integer number of independent networks.
+
+        no_classes: integer number of outputs (classes) of each network.
+
+        seed: seed of the initial weights and of the shuffling of batches.
+
+    Attribs:
+        weights: list of tuples (W, b) of each layer, where W has shape
+        (no_heads, n_in, n_out) and b has shape (no_heads, n_out).
+
+        init_weights: copy of the initial weights used by reset.
+    '''
+
+    def __init__(self, neuron_vector, activation_vector, no_heads=1,
+                 no_classes=2, seed=None):
+        for act in activation_vector:
+            if act not in ACTIVATIONS:
+                raise ValueError('Activation ' + str(act) + ' is not one of '
+                                 + str(list(ACTIVATIONS)) + '.')
+
+        self.rng = np.random.default_rng(seed)
+        self.activations = [ACTIVATIONS[act] for act in activation_vector]
+        self.no_heads = no_heads
+
+        sizes = list(neuron_vector) + [no_classes]
+        self.weights = []
+        for n_in, n_out in zip(sizes[:-1], sizes[1:]):
+            limit = np.sqrt(6 / (n_in + n_out))
+            W = self.rng.uniform(-limit, limit, (no_heads, n_in, n_out))
+            self.weights.append((W, np.zeros((no_heads, n_out))))
+
+        self.init_weights = [(W.copy(), b.copy()) for W, b in self.weights]
+
+    def reset(self):
+        r''' Function restores the initial weights.
+        '''
+        self.weights = [(W.copy(), b.copy()) for W, b in self.init_weights]
+
+    def forward(self, x):
+        r''' Function returns the outputs of all layers for the input x of
+        shape (batch, n_features). The last one has shape
+        (no_heads, batch, no_classes).
+        '''
+        outs = [np.broadcast_to(x, (self.no_heads,) + x.shape)]
+        for (W, b), (act, _) in zip(self.weights, self.activations):
+            outs.append(act(outs[-1] @ W + b[:,np.newaxis,:]))
+        return outs
+
+    def predict(self, x):
+        r''' Function returns the predicted classes of shape (batch,
+        no_heads) for the input x of shape (batch, n_features).
+        '''
+        return np.argmax(self.forward(x)[-1], axis=2).T
+
+    def accuracy(self, x, labels):
+        r''' Function returns the accuracy of each network.
+
+        Args:
+            x: 2D numpy array of shape (batch, n_features).
+
+            labels: 2D integer array of shape (batch, no_heads).
+        '''
+        return np.mean(self.predict(x) == labels, axis=0)
+
+    def gradients(self, x, labels):
+        r''' Function returns the gradients of the mean cross entropy of each
+        network with respect to its weights, and the predicted classes.
+        '''
+        outs = self.forward(x)
+        logits = outs[-1]
+        onehot = np.zeros(logits.shape)
+        np.put_along_axis(onehot, labels.T[:,:,np.newaxis], 1, axis=2)
+
+        g = (_softmax(logits) - onehot) / x.shape[0]
+        grads = []
+        for l in range(len(self.weights) - 1, -1, -1):
+            g = self.activations[l][1](g, outs[l+1])
+            grads.append((np.swapaxes(outs[l], 1, 2) @ g, np.sum(g, axis=1)))
+            g = g @ np.swapaxes(self.weights[l][0], 1, 2)
+
+        return grads[::-1], np.argmax(logits, axis=2).T
+
+    def fit(self, x, labels, epochs=200, batch_size=32, learning_rate=1e-3,
+            patience=None, min_delta=1e-3):
+        r''' Function trains the networks with the Adam optimiser on shuffled
+        batches.
+
+        Args:
+            x: 2D numpy array of shape (batch, n_features).
+
+            labels: 2D integer array of shape (batch, no_heads).
+
+            epochs: integer maximal number of epochs.
+
+            batch_size: integer size of the training batches.
+
+            learning_rate: float learning rate of Adam.
+
+            patience: integer. If given, the training stops when the mean
+            training accuracy did not improve by min_delta during patience
+            epochs.
+
+            min_delta: float, minimal improvement of the accuracy.
+
+        Returns:
+            List of the mean training accuracy of each epoch.
+        '''
+        beta1, beta2, eps = 0.9, 0.999, 1e-7
+        m = [(np.zeros_like(W), np.zeros_like(b)) for W, b in self.weights]
+        v = [(np.zeros_like(W), np.zeros_like(b)) for W, b in self.weights]
+        step = 0
+        history = []
+        best = -np.inf
+        wait = 0
+
+        for epoch in range(epochs):
+            order = self.rng.permutation(x.shape[0])
+            correct = 0
+
+            for start in range(0, x.shape[0], batch_size):
+                idx = order[start:start + batch_size]
+                grads, pred = self.gradients(x[idx], labels[idx])
+                correct += np.sum(pred == labels[idx])
+
+                step += 1
+                lr = (learning_rate * np.sqrt(1 - beta2 ** step)
+                      / (1 - beta1 ** step))
+                for l, (gW, gb) in enumerate(grads):
+                    new = []
+                    for j, (p, g) in enumerate(zip(self.weights[l],
+                                                   (gW, gb))):
+                        m[l][j][...] = beta1 * m[l][j] + (1 - beta1) * g
+                        v[l][j][...] = beta2 * v[l][j] + (1 - beta2) * g ** 2
+                        new.append(p - lr * m[l][j] / (np.sqrt(v[l][j])
+                                                       + eps))
+                    self.weights[l] = tuple(new)
+
+            history.append(correct / labels.size)
+
+            if patience is not None:
+                if history[-1] > best + min_delta:
+                    best = history[-1]
+                    wait = 0
+                else:
+                    wait += 1
+                    if wait >= patience:
+                        break
+
+        return history
@@ -0,0 +1,143 @@
+# resampling.py
+
+''' Code contains the functions that estimate the uncertainty of principal
+components by repeating a truncated PCA on resampled data in a process pool.
+'''
+
+# libraries
+
+import os
+
+import numpy as np
+
+# internal modules
+
+from pca_exp.utils.solvers import svd
+from pca_exp.utils.scheduler import SpawnPool
+
+# Data shared by the replicates of one worker process, set by _init_worker.
+_shared = {}
+
+def _init_worker(a, e, reference):
+    _shared['a'] = a
+    _shared['e'] = e
+    _shared['reference'] = reference
+
+def _replicates(seeds, method, solver):
+    r''' Function runs the replicates of given seeds on the data shared by
+    _init_worker and returns their aligned curves, singular values and
+    scores.
+    '''
+    a = _shared['a']
+    e = _shared['e']
+    reference = _shared['reference']
+    k = reference.shape[1]
+
+    # Components a solver does not return stay nan.
+    curves = np.full((len(seeds), a.shape[0], k), np.nan)
+    sing = np.full((len(seeds), k), np.nan)
+    scores = np.full((len(seeds), k, a.shape[1]), np.nan)
+
+    for r, seed in enumerate(seeds):
+        rng = np.random.default_rng(seed)
+
+        if method == 'noise':
+            a_r = a + e * rng.standard_normal(a.shape)
+        else:
+            a_r = a[:,rng.integers(0, a.shape[1], a.shape[1])]
+
+        av = np.mean(a_r, axis=1)[np.newaxis].T
+        U, s, _ = svd(a_r - av, n_components=k, solver=solver,
+                      random_state=rng)
+
+        # Singular vectors are defined up to sign, so each one is flipped to
+        # agree with the reference component.
+        sign = np.sign(np.sum(U * reference[:,:U.shape[1]], axis=0))
+        sign[sign == 0] = 1
+        U = U * sign
+
+        curves[r,:,:U.shape[1]] = U
+        sing[r,:s.size] = s
+        if method == 'noise':
+            scores[r,:U.shape[1]] = U.T @ (a_r - av)
+        else:
+            scores[r,:U.shape[1]] = U.T @ (a - av)
+
+    return curves, sing, scores
+
+def bootstrap_pca(a, reference, e=None, n_boot=200, method='noise',
+                  workers=None, seed=None, ci=0.95, solver='auto', blas=1):
+    r''' Function repeats the truncated PCA of data resampled n_boot times
+    and returns confidence bands of the principal components. Every replicate
+    has its own random stream spawned from one SeedSequence, so the results
+    only depend on seed, not on the number of workers.
+
+    Args:
+        a: 2D numpy array of data with indices [i, j], where i runs through x
+        values and j runs through measurements.
+
+        reference: 2D numpy array of reference components (e.g. pc_curves of
+        the PCA of a) with indices [i, j], where j runs through the
+        n_components components estimated. The signs of the components of
+        each replicate are aligned to it.
+
+        e: 2D numpy array of errors of a. Needed for method 'noise'.
+
+        n_boot: integer number of replicates.
+
+        method: string, 'noise' redraws every value from a gaussian with the
+        standard deviation e, 'measurements' draws the measurements with
+        replacement.
+
+        workers: integer number of worker processes. Replicates are computed
+        in this process if 1, and the default of ProcessPoolExecutor is used
+        if None. Workers are started with 'spawn'.
+
+        seed: integer seed of the SeedSequence.
+
+        ci: float confidence level of the bands.
+
+        solver: string, SVD solver of utils.solvers.svd.
+
+        blas: integer number of BLAS threads of each worker, or None to keep
+        the environment of this process.
+
+    Returns:
+        Dictionary with arrays 'curves', 'sing' and 'scores' of all
+        replicates (replicate index first), their means ('<name>_mean'),
+        standard deviations ('<name>_std') and lower and upper bounds of the
+        ci confidence bands ('<name>_low', '<name>_high'). Components a
+        replicate did not return are nan and left out of the statistics.
+    '''
+    if method not in ('noise', 'measurements'):
+        raise ValueError("method should be 'noise' or 'measurements'.")
+    if method == 'noise' and e is None:
+        raise ValueError("Errors e are needed for method 'noise'.")
+
+    a = np.asarray(a)
+    e = None if e is None else np.asarray(e)
+    seeds = np.random.SeedSequence(seed).spawn(n_boot)
+
+    if workers == 1:
+        _init_worker(a, e, reference)
+        parts = [_replicates(seeds, method, solver)]
+    else:
+        no_tasks = min(n_boot, 4 * (workers or os.cpu_count() or 1))
+        tasks = [list(t) for t in np.array_split(seeds, no_tasks)]
+        with SpawnPool(workers, blas, _init_worker,
+                       (a, e, reference)) as pool:
+            parts = list(pool.map(_replicates, tasks, [method] * no_tasks,
+                                  [solver] * no_tasks))
+
+    out = {}
+    q = [(1 - ci) / 2 * 100, (1 + ci) / 2 * 100]
+    for j, name in enumerate(('curves', 'sing', 'scores')):
+        reps = np.concatenate([part[j] for part in parts])
+        low, high = np.nanpercentile(reps, q, axis=0)
+        out[name] = reps
+        out[name + '_mean'] = np.nanmean(reps, axis=0)
+        out[name + '_std'] = np.nanstd(reps, axis=0)
+        out[name + '_low'] = low
+        out[name + '_high'] = high
+
+    return out
@@ -0,0 +1,155 @@
+# scheduler.py
+
+''' Code contains the scheduler which spreads the thresholds of a confusion
+scan over worker processes, and the helpers which start process pools with
+a pinned number of BLAS threads per worker.
+'''
+
+# libraries
+
+import os
+import contextlib
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+# internal modules
+
+from pca_exp.utils.mlp import StackedMLP
+
+# Environment variables read by the BLAS libraries numpy may be linked to
+# when they are loaded.
+BLAS_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+             'BLIS_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS',
+             'NUMEXPR_NUM_THREADS')
+
+@contextlib.contextmanager
+def blas_threads(n):
+    r''' Context manager which sets the thread count variables of the BLAS
+    libraries to n and restores them on exit. Processes started inside (with
+    the 'spawn' context, so that numpy is loaded again) use n BLAS threads.
+    Nothing is changed if n is None. The variables apply to the whole
+    process while they are set, so the block should only start processes
+    (see SpawnPool).
+    '''
+    if n is None:
+        yield
+        return
+
+    old = {var: os.environ.get(var) for var in BLAS_VARS}
+    os.environ.update({var: str(n) for var in BLAS_VARS})
+    try:
+        yield
+    finally:
+        for var, value in old.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+
+class SpawnPool(ProcessPoolExecutor):
+    r''' Class of ProcessPoolExecutor with the 'spawn' context whose workers
+    use blas BLAS threads. Spawned workers are started by submit (and map)
+    when no worker is idle, so the BLAS variables of this process are set
+    only during submit, not while results are consumed.
+
+    Params:
+        workers: integer number of worker processes, the default of
+        ProcessPoolExecutor if None.
+
+        blas: integer number of BLAS threads of each worker, or None to keep
+        the environment of this process.
+
+        initializer, initargs: initializer of the workers and its arguments.
+    '''
+
+    def __init__(self, workers=None, blas=1, initializer=None, initargs=()):
+        super().__init__(workers, mp_context=mp.get_context('spawn'),
+                         initializer=initializer, initargs=initargs)
+        self.blas = blas
+
+    def submit(self, fn, /, *args, **kwargs):
+        with blas_threads(self.blas):
+            return super().submit(fn, *args, **kwargs)
+
+
+# Data shared by the thresholds of one worker process, set by _init_worker.
+_shared = {}
+
+def _init_worker(x, param, model_args, fit_args):
+    _shared['x'] = x
+    _shared['param'] = param
+    _shared['model_args'] = model_args
+    _shared['fit_args'] = fit_args
+
+def _train_threshold(j, N_c, seed, n_seeds):
+    r''' Function trains n_seeds networks, initialised from seed, on the
+    labels of threshold N_c and returns j with their final accuracies.
+    '''
+    x = _shared['x']
+    labels = (_shared['param'] < N_c).astype(int)
+    labels = np.repeat(labels[np.newaxis].T, n_seeds, axis=1)
+
+    neuron_vector, activation_vector = _shared['model_args']
+    model = StackedMLP(neuron_vector, activation_vector, no_heads=n_seeds,
+                       seed=seed)
+    model.fit(x, labels, **_shared['fit_args'])
+
+    return j, model.accuracy(x, labels)
+
+def iter_threshold_scan(x, param, param_range, neuron_vector,
+                        activation_vector, n_seeds=1, seed=None, workers=None,
+                        blas=1, **fit_args):
+    r''' Generator which trains the classifiers of every threshold of
+    param_range in a process pool and yields the results as the thresholds
+    finish. Each threshold gets its own seed spawned from one SeedSequence,
+    so the results only depend on seed, not on the number of workers or the
+    order of completion.
+
+    Args:
+        x: 2D numpy array of features with indices [i, j], where i runs
+        through measurements.
+
+        param: 1D numpy array of the parameter of each measurement.
+
+        param_range: list or 1D numpy array of thresholds N_c.
+
+        neuron_vector, activation_vector: architecture of the networks, as in
+        utils.mlp.StackedMLP.
+
+        n_seeds: integer number of networks with different initial weights
+        trained on each threshold.
+
+        seed: integer seed of the SeedSequence.
+
+        workers: integer number of worker processes. Thresholds are trained
+        in this process if 1, and the default of ProcessPoolExecutor is used
+        if None.
+
+        blas: integer number of BLAS threads of each worker, or None to keep
+        the environment of this process.
+
+        fit_args: keyword arguments of StackedMLP.fit.
+
+    Yields:
+        Tuples (j, acc) of the index j of the threshold in param_range and the
+        1D numpy array of the accuracies of its n_seeds networks.
+    '''
+    x = np.asarray(x)
+    param = np.asarray(param)
+    seeds = np.random.SeedSequence(seed).spawn(len(param_range))
+    initargs = (x, param, (neuron_vector, activation_vector), fit_args)
+
+    if workers == 1:
+        _init_worker(*initargs)
+        for j, N_c in enumerate(param_range):
+            yield _train_threshold(j, N_c, seeds[j], n_seeds)
+        return
+
+    with SpawnPool(workers, blas, _init_worker, initargs) as pool:
+        futures = [pool.submit(_train_threshold, j, N_c, seeds[j], n_seeds)
+                   for j, N_c in enumerate(param_range)]
+        for future in as_completed(futures):
+            yield future.result()
@@ -0,0 +1,588 @@
+# solvers.py
+
+''' Code contains the singular value decomposition solvers used by the
+pca_machine module. Every solver takes the centred data matrix z with indices
+[i, j], where i runs through x values and j runs through measurements, and
+returns a tuple (U, s, Vt) of the first n_components left singular vectors,
+singular values and right singular vectors.
+'''
+
+# libraries
+
+import numpy as np
+
+# internal modules
+
+from pca_exp.utils.utils import iter_chunks
+from pca_exp.utils.instrument import stage
+
+SOLVERS = ('full', 'economy', 'gram', 'randomized', 'lanczos')
+
+# Minimal ratio of the matrix sides for which the Gram solver is considered.
+GRAM_ASPECT = 10
+
+def full_svd(z, n_components=None, **kwargs):
+    r''' Function performs the SVD with full matrices, so that U is a square
+    matrix with the size of the x axis. Kept for compatibility with the
+    original PCA results.
+
+    Args:
+        z: 2D numpy array of centred data.
+
+        n_components: ignored, all components are returned.
+    '''
+    return np.linalg.svd(z)
+
+def economy_svd(z, n_components=None, **kwargs):
+    r''' Function performs the economy SVD, which skips the singular vectors
+    that do not correspond to any singular value.
+
+    Args:
+        z: 2D numpy array of centred data.
+
+        n_components: integer number of components kept. All are kept if
+        None.
+    '''
+    U, s, Vt = np.linalg.svd(z, full_matrices=False)
+    return U[:,:n_components], s[:n_components], Vt[:n_components]
+
+def gram_svd(z, n_components=None, **kwargs):
+    r''' Function performs the SVD through the eigendecomposition of the
+    smaller of the Gram matrices z z.T and z.T z (the "snapshot" method). The
+    other factor is recovered by projecting z on the eigenvectors. It is much
+    cheaper than the SVD for very lopsided matrices, but the precision of
+    singular values much smaller than the largest one is reduced.
+
+    Args:
+        z: 2D numpy array of centred data.
+
+        n_components: integer number of components kept. All are kept if
+        None.
+    '''
+    m, n = z.shape
+    wide = m <= n
+
+    gram = z @ z.T if wide else z.T @ z
+    evals, evecs = np.linalg.eigh(gram)
+    evals = evals[::-1][:n_components]
+    evecs = evecs[:,::-1][:,:n_components]
+
+    s = np.sqrt(np.maximum(evals, 0))
+    good = s > np.finfo(float).eps * max(m, n) * (s[0] if s.size else 0)
+
+    # Factor recovered by projection; vectors of vanishing singular values
+    # are left as zeros.
+    proj = np.zeros((n if wide else m, s.size))
+    proj[:,good] = (z.T @ evecs[:,good] if wide else z @ evecs[:,good]) \
+                    / s[good]
+
+    if wide:
+        return evecs, s, proj.T
+
+    if not good.all():
+        # Complete the left singular vectors to an orthonormal set.
+        rng = np.random.default_rng(0)
+        fill = rng.standard_normal((m, np.count_nonzero(~good)))
+        q, _ = np.linalg.qr(np.c_[proj[:,good], fill])
+        proj[:,~good] = q[:,np.count_nonzero(good):]
+
+    return proj, s, evecs.T
+
+def randomized_svd(z, n_components, oversample=10, n_iter=None,
+                   random_state=None, **kwargs):
+    r''' Function performs the randomized SVD (Halko, Martinsson and Tropp,
+    2011). The range of z is found from its product with a gaussian random
+    matrix, refined by power iterations, and the SVD is performed on the
+    projection of z on that range.
+
+    Args:
+        z: 2D numpy array of centred data.
+
+        n_components: integer number of components kept.
+
+        oversample: integer number of additional random vectors.
+
+        n_iter: integer number of power iterations. If None, 7 iterations are
+        used for n_components smaller than 10% of the matrix rank and 4
+        otherwise.
+
+        random_state: seed or numpy.random.Generator.
+    '''
+    rng = np.random.default_rng(random_state)
+    p = min(z.shape)
+    l = min(n_components + oversample, p)
+
+    if n_iter is None:
+        n_iter = 7 if n_components < 0.1 * p else 4
+
+    Q = z @ rng.standard_normal((z.shape[1], l))
+    for _ in range(n_iter):
+        Q, _ = np.linalg.qr(Q)
+        Q, _ = np.linalg.qr(z.T @ Q)
+        Q = z @ Q
+    Q, _ = np.linalg.qr(Q)
+
+    Ub, s, Vt = np.linalg.svd(Q.T @ z, full_matrices=False)
+    U = Q @ Ub
+
+    return U[:,:n_components], s[:n_components], Vt[:n_components]
+
+def lanczos_svd(z, n_components, n_lanczos=None, random_state=None,
+                **kwargs):
+    r''' Function performs the partial SVD by Golub-Kahan-Lanczos
+    bidiagonalisation with full reorthogonalisation. Only products of z and
+    z.T with vectors are needed, and the SVD is performed on the small
+    bidiagonal matrix.
+
+    Args:
+        z: 2D numpy array of centred data.
+
+        n_components: integer number of components kept.
+
+        n_lanczos: integer number of Lanczos steps. If None, it is set to
+        max(2 * n_components + 1, n_components + 20), bounded by the matrix
+        rank.
+
+        random_state: seed or numpy.random.Generator.
+    '''
+    rng = np.random.default_rng(random_state)
+    m, n = z.shape
+    p = min(m, n)
+
+    if n_lanczos is None:
+        n_lanczos = max(2 * n_components + 1, n_components + 20)
+    n_lanczos = min(n_lanczos, p)
+
+    U = np.zeros((m, n_lanczos))
+    V = np.zeros((n, n_lanczos + 1))
+    alpha = np.zeros(n_lanczos)
+    beta = np.zeros(n_lanczos)
+
+    v = rng.standard_normal(n)
+    V[:,0] = v / np.linalg.norm(v)
+    u_prev = np.zeros(m)
+    steps = n_lanczos
+
+    for j in range(n_lanczos):
+        u = z @ V[:,j] - (beta[j-1] * u_prev if j > 0 else 0)
+        u -= U[:,:j] @ (U[:,:j].T @ u)
+        alpha[j] = np.linalg.norm(u)
+        if alpha[j] == 0:
+            steps = j
+            break
+        U[:,j] = u / alpha[j]
+
+        v = z.T @ U[:,j] - alpha[j] * V[:,j]
+        v -= V[:,:j+1] @ (V[:,:j+1].T @ v)
+        beta[j] = np.linalg.norm(v)
+        if beta[j] <= np.finfo(float).eps * alpha[j]:
+            steps = j + 1
+            break
+        V[:,j+1] = v / beta[j]
+        u_prev = U[:,j]
+
+    B = np.diag(alpha[:steps]) + np.diag(beta[:steps-1], 1)
+    P, s, Qt = np.linalg.svd(B)
+
+    U = U[:,:steps] @ P
+    Vt = Qt @ V[:,:steps].T
+
+    return U[:,:n_components], s[:n_components], Vt[:n_components]
+
+def solver_cost(solver, shape, n_components):
+    r''' Function estimates the number of floating point operations needed by
+    a solver.
+
+    Args:
+        solver: string, name of the solver.
+
+        shape: tuple of two integers, shape of the data matrix.
+
+        n_components: integer number of components needed.
+    '''
+    m, n = shape
+    p = min(m, n)
+    k = n_components
+
+    if solver in ('full', 'economy'):
+        return 4. * m * n * p + 8. * p ** 3
+    elif solver == 'gram':
+        return 1. * m * n * p + 4. * p ** 3 + 2. * m * n * min(k, p)
+    elif solver == 'randomized':
+        l = min(k + 10, p)
+        n_iter = 7 if k < 0.1 * p else 4
+        return (2 * n_iter + 2) * 2. * m * n * l + 4. * (m + n) * l ** 2
+    elif solver == 'lanczos':
+        ncv = min(max(2 * k + 1, k + 20), p)
+        return 4. * m * n * ncv + 4. * (m + n) * ncv ** 2
+    raise ValueError('Unknown solver ' + str(solver) + '.')
+
+def choose_solver(shape, n_components=None):
+    r''' Function chooses the cheapest solver for a matrix of given shape and
+    number of components. The Gram solver is only considered for matrices 
+    with one side at least GRAM_ASPECT times longer than the other, and the
+    truncated solvers only when less than half of the components are needed.
+
+    Args:
+        shape: tuple of two integers, shape of the data matrix.
+
+        n_components: integer number of components needed, or None for all.
+    '''
+    k = min(shape) if n_components is None else n_components
+
+    candidates = ['economy']
+    if max(shape) >= GRAM_ASPECT * min(shape):
+        candidates.append('gram')
+    if k < min(shape) // 2:
+        candidates += ['randomized', 'lanczos']
+
+    costs = {solver: solver_cost(solver, shape, k) for solver in candidates}
+    return min(costs, key=costs.get)
+
+@stage()
+def svd(z, n_components=None, solver='auto', **kwargs):
+    r''' Function performs the SVD of z with the chosen solver.
+
+    Args:
+        z: 2D numpy array of centred data.
+
+        n_components: integer number of components kept, or None for all.
+
+        solver: string, one of 'auto', 'full', 'economy', 'gram', 
+        'randomized' or 'lanczos'. 'auto' picks the cheapest solver for the matrix shape and
+        n_components.
+
+        kwargs: additional arguments passed to the solver, e.g. random_state.
+    '''
+    if n_components is not None:
+        n_components = min(n_components, min(z.shape))
+
+    if solver == 'auto':
+        solver = choose_solver(z.shape, n_components)
+
+    if solver in ('randomized', 'lanczos') and n_components is None:
+        raise ValueError('n_components has to be given for the ' + solver
+                         + ' solver.')
+
+    if solver == 'full':
+        return full_svd(z, n_components, **kwargs)
+    elif solver == 'economy':
+        return economy_svd(z, n_components, **kwargs)
+    elif solver == 'gram':
+        return gram_svd(z, n_components, **kwargs)
+    elif solver == 'randomized':
+        return randomized_svd(z, n_components, **kwargs)
+    elif solver == 'lanczos':
+        return lanczos_svd(z, n_components, **kwargs)
+    raise ValueError('solver should be one of ' + str(('auto',) + SOLVERS)
+                     + '.')
+
+def orthonormalise_factors(U, V):
+    r''' Function rewrites a rank-k factorisation z = U V.T as U_o diag(s)
+    Vt_o with orthonormal U_o and Vt_o.
+
+    Args:
+        U: 2D numpy array of shape (m, k).
+
+        V: 2D numpy array of shape (n, k).
+
+    Returns:
+        Tuple (U_o, s, Vt_o).
+    '''
+    Qu, Ru = np.linalg.qr(U)
+    Qv, Rv = np.linalg.qr(V)
+    P, s, Qt = np.linalg.svd(Ru @ Rv.T)
+    return Qu @ P, s, Qt @ Qv.T
+
+@stage()
+def weighted_svd(z, row_w, col_w=None, n_components=None, solver='auto',
+                 **kwargs):
+    r''' Function finds the rank n_components approximation of z that
+    minimises the sum of squared residuals weighted by row_w[i]**2 *
+    col_w[j]**2. The weights are applied by scaling the rows and columns of
+    z, so no weight matrix is built, and the cost is that of the truncated
+    SVD of z.
+
+    Args:
+        z: 2D numpy array of centred data.
+
+        row_w: 1D numpy array of row weights (e.g. inverse errors of x bins).
+
+        col_w: 1D numpy array of column weights. Equal weights if None.
+
+        n_components: integer rank of the approximation.
+
+        solver: string, solver of svd used on the scaled matrix.
+
+    Returns:
+        Tuple (U, s, Vt) of the approximation with orthonormal U and Vt.
+    '''
+    if col_w is None:
+        col_w = np.ones(z.shape[1])
+
+    U, s, Vt = svd(row_w[np.newaxis].T * z * col_w, n_components, solver,
+                   **kwargs)
+
+    return orthonormalise_factors(U / row_w[np.newaxis].T, 
+                                  (s[np.newaxis].T * Vt / col_w).T)
+
+def weighted_als(z, w, n_components, U=None, max_iter=100, tol=1e-6):
+    r''' Function finds the rank n_components approximation of z that
+    minimises the sum of squared residuals weighted element by element by w,
+    with alternating weighted least squares. Each iteration solves a small
+    k x k system for every row and column, so its cost is of order
+    z.size * n_components ** 2.
+
+    Args:
+        z: 2D numpy array of centred data.
+
+        w: 2D numpy array of weights of the same shape as z (e.g. inverse
+        squared errors).
+
+        n_components: integer rank of the approximation.
+
+        U: 2D numpy array of the initial left factor of shape 
+        (m, n_components). Leading left singular vectors of z if None.
+
+        max_iter: integer maximal number of iterations.
+
+        tol: float, iterations stop when the relative change of the weighted
+        sum of squared residuals is smaller.
+
+    Returns:
+        Tuple (U, s, Vt, n_iter) of the approximation with orthonormal U and
+        Vt, and the number of iterations done.
+    '''
+    k = n_components
+    if U is None:
+        U = economy_svd(z, k)[0]
+
+    wz = w * z
+    ridge = np.finfo(float).eps * np.max(w) * np.eye(k)
+    chi2 = np.inf
+
+    for n_iter in range(1, max_iter + 1):
+        G = np.einsum('ik,ij,il->jkl', U, w, U) + ridge
+        V = np.linalg.solve(G, (U.T @ wz).T[:,:,np.newaxis])[:,:,0]
+
+        G = np.einsum('jk,ij,jl->ikl', V, w, V) + ridge
+        U = np.linalg.solve(G, (wz @ V)[:,:,np.newaxis])[:,:,0]
+
+        chi2_new = np.sum(w * (z - U @ V.T) ** 2)
+        if abs(chi2 - chi2_new) <= tol * chi2_new:
+            break
+        chi2 = chi2_new
+
+    return orthonormalise_factors(U, V) + (n_iter,)
+
+@stage()
+def chunked_gram_pca(a, n_components=None, chunk=None):
+    r''' Function performs the PCA of data that does not fit in memory (e.g.
+    a memory-mapped array) with more measurements than x values. The mean and
+    the Gram matrix z z.T are accumulated over chunks of measurements, so only
+    one chunk of the centred data exists at a time.
+
+    Args:
+        a: 2D array of data with indices [i, j], where i runs through x
+        values and j runs through measurements.
+
+        n_components: integer number of components kept. All are kept if
+        None.
+
+        chunk: integer number of measurements processed at once. All at once
+        if None.
+
+    Returns:
+        Tuple (av, U, s, scores) of the mean column, left singular vectors,
+        singular values and scores U.T z.
+    '''
+    m, n = a.shape
+    chunks = list(iter_chunks(n, chunk))
+
+    av = np.zeros((m, 1))
+    for sl in chunks:
+        av += np.sum(a[:,sl], axis=1)[np.newaxis].T
+    av /= n
+
+    gram = np.zeros((m, m))
+    for sl in chunks:
+        z = a[:,sl] - av
+        gram += z @ z.T
+
+    evals, U = np.linalg.eigh(gram)
+    s = np.sqrt(np.maximum(evals[::-1][:n_components], 0))
+    U = U[:,::-1][:,:n_components]
+
+    scores = np.empty((s.size, n))
+    for sl in chunks:
+        scores[:,sl] = U.T @ (a[:,sl] - av)
+
+    return av, U, s, scores
+
+@stage()
+def tiled_snapshot_pca(stack, n_components=None, tile=None, out=None):
+    r''' Function performs the PCA of a stack of images (e.g. a memory-mapped
+    array) with pixels as x values, without forming the flattened matrix of
+    pixels and measurements. The measurement by measurement Gram matrix is
+    accumulated over tiles of image rows in one pass over the stack, and the
+    components are formed tile by tile in a second pass. Peak memory depends
+    on the tile size and the number of measurements, not on the image size.
+
+    Args:
+        stack: 3D array with indices [i, x, y], where i runs through
+        measurements and x and y through pixels.
+
+        n_components: integer number of components kept. All are kept if
+        None.
+
+        tile: integer number of image rows x processed at once. All at once
+        if None.
+
+        out: array of shape (x, y, n_components) the component images are
+        written to, e.g. a np.memmap. Allocated if None.
+
+    Returns:
+        Tuple (av, images, s, scores) of the mean image of shape (x, y), the
+        component images of shape (x, y, n_components), the singular values
+        and the scores. av.reshape(-1, 1) and images.reshape(-1,
+        n_components) are the mean and components in the layout of
+        PCAResult.
+    '''
+    n, nx, ny = stack.shape
+    tiles = list(iter_chunks(nx, tile))
+
+    # The Gram matrix of the data shifted by the first image is centred
+    # afterwards; the shift only improves the accuracy.
+    av = np.empty((nx, ny))
+    gram = np.zeros((n, n))
+    for sl in tiles:
+        a = np.reshape(stack[:,sl,:], (n, -1)).astype(float)
+        shift = a - a[0]
+        av[sl] = np.reshape(np.mean(a, axis=0), (-1, ny))
+        gram += shift @ shift.T
+
+    c = np.mean(gram, axis=0)
+    gram += np.mean(c) - c - c[np.newaxis].T
+
+    evals, V = np.linalg.eigh(gram)
+    s = np.sqrt(np.maximum(evals[::-1][:n_components], 0))
+    V = V[:,::-1][:,:s.size]
+
+    inv_s = np.zeros(s.size)
+    inv_s[s > 0] = 1 / s[s > 0]
+
+    if out is None:
+        out = np.empty((nx, ny, s.size))
+    for sl in tiles:
+        z = np.reshape(stack[:,sl,:], (n, -1)) - np.reshape(av[sl], -1)
+        out[sl] = np.reshape(z.T @ (V * inv_s), (-1, ny, s.size))
+
+    return av, out, s, s[np.newaxis].T * V.T
+
+class IncrementalSVD:
+    r''' Class which keeps a running mean and a rank-k SVD of the centred data
+    and updates them with new columns (measurements), following Ross et al.,
+    "Incremental learning for robust visual tracking" (2008). The cost of an
+    update depends on the number of new columns and n_components, not on the
+    number of columns seen so far.
+
+    Params:
+        n_components: integer rank of the kept factorisation. If None, the
+        rank is only limited by the data.
+
+    Attribs:
+        n_seen: integer number of columns seen so far.
+
+        mean: 1D numpy array of the running mean of the columns.
+
+        U: 2D numpy array of the current left singular vectors.
+
+        s: 1D numpy array of the current singular values.
+
+        total: float sum of squares of all columns seen so far, centred by
+        the running mean.
+
+        chunk_scores: list of tuples (update number, scores) with scores of
+        each chunk expressed in the basis at the time of its update.
+
+        transforms: list of tuples (M, d) of affine maps taking scores from
+        the basis before each update to the basis after it.
+    '''
+
+    def __init__(self, n_components=None):
+        self.n_components = n_components
+        self.n_seen = 0
+        self.mean = None
+        self.U = None
+        self.s = None
+        self.total = 0.
+        self.chunk_scores = []
+        self.transforms = []
+
+    def update(self, columns):
+        r''' Function updates the mean and the factorisation with new columns.
+
+        Args:
+            columns: 2D numpy array with indices [i, j], where i runs through
+            x values and j runs through new measurements.
+        '''
+        columns = np.asarray(columns, dtype=float)
+        if columns.ndim == 1:
+            columns = columns[np.newaxis].T
+
+        n_new = columns.shape[1]
+        mean_new = np.mean(columns, axis=1)
+
+        if self.n_seen == 0:
+            stacked = columns - mean_new[np.newaxis].T
+            mean = mean_new
+            self.total = float(np.sum(stacked ** 2))
+        else:
+            if columns.shape[0] != self.mean.size:
+                raise ValueError('New columns have ' + str(columns.shape[0])
+                                 + ' x values instead of ' 
+                                 + str(self.mean.size) + '.')
+            n_tot = self.n_seen + n_new
+            mean = (self.n_seen * self.mean + n_new * mean_new) / n_tot
+            shift = np.sqrt(self.n_seen * n_new / n_tot) * (mean_new 
+                                                            - self.mean)
+            stacked = np.c_[self.U * self.s, 
+                            columns - mean_new[np.newaxis].T, shift]
+            self.total += float(np.sum(stacked[:,self.s.size:] ** 2))
+
+        U, s, _ = np.linalg.svd(stacked, full_matrices=False)
+        U = U[:,:self.n_components]
+        s = s[:self.n_components]
+
+        if self.n_seen > 0:
+            self.transforms.append((U.T @ self.U, U.T @ (self.mean - mean)))
+
+        self.chunk_scores.append((len(self.transforms), 
+                                  U.T @ (columns - mean[np.newaxis].T)))
+        self.n_seen += n_new
+        self.mean = mean
+        self.U = U
+        self.s = s
+
+    def scores(self):
+        r''' Function returns the scores of all columns seen so far in the
+        current basis. Scores of earlier chunks are carried through the
+        affine maps of later updates, so the part of the columns discarded by
+        the truncation is not recovered.
+        '''
+        R = np.eye(self.U.shape[1])
+        c = np.zeros(self.U.shape[1])
+        scores = [None] * len(self.chunk_scores)
+
+        chunk_i = len(self.chunk_scores) - 1
+        for update in range(len(self.transforms), -1, -1):
+            while chunk_i >= 0 and self.chunk_scores[chunk_i][0] == update:
+                scores[chunk_i] = (R @ self.chunk_scores[chunk_i][1] 
+                                   + c[np.newaxis].T)
+                chunk_i -= 1
+            if update > 0:
+                M, d = self.transforms[update - 1]
+                c = R @ d + c
+                R = R @ M
+
+        return np.concatenate(scores, axis=1)
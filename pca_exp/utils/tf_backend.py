@@ -0,0 +1,81 @@
+# tf_backend.py
+
+''' Code contains the TensorFlow models used by the confusion_machine module
+with backend='tensorflow'. It is only imported when that backend is chosen.
+'''
+
+# libraries
+
+import tensorflow as tf
+
+
+class StackedDense(tf.keras.layers.Layer):
+    r''' Keras layer holding one independent dense layer for each of
+    no_heads networks trained side by side. Its input has shape
+    (batch, no_heads, n_in) or (batch, n_in), in which case the same input is
+    fed to every network, and its output has shape (batch, no_heads, n_out).
+    '''
+
+    def __init__(self, no_heads, units, activation=None, **kwargs):
+        super().__init__(**kwargs)
+        self.no_heads = no_heads
+        self.units = units
+        self.activation = tf.keras.activations.get(activation)
+
+    def build(self, input_shape):
+        self.kernel = self.add_weight(
+            name='kernel', shape=(self.no_heads, input_shape[-1], self.units),
+            initializer='glorot_uniform')
+        self.bias = self.add_weight(name='bias',
+                                    shape=(self.no_heads, self.units),
+                                    initializer='zeros')
+
+    def call(self, inputs):
+        if len(inputs.shape) == 2:
+            out = tf.einsum('bi,hio->bho', inputs, self.kernel)
+        else:
+            out = tf.einsum('bhi,hio->bho', inputs, self.kernel)
+        return self.activation(out + self.bias)
+
+
+def build_model(neuron_vector, activation_vector):
+    r''' Function returns the keras classifier with the layers specified by
+    neuron_vector and activation_vector and two outputs.
+    '''
+    model = tf.keras.models.Sequential()
+    model.add(tf.keras.Input(shape=(neuron_vector[0],)))
+
+    for i in range(1, len(neuron_vector)):
+        model.add(tf.keras.layers.Dense(neuron_vector[i], 
+                                        activation=activation_vector[i-1]))
+
+    model.add(tf.keras.layers.Dense(2, activation=activation_vector[-1]))
+
+    return model
+
+def build_stacked_model(neuron_vector, activation_vector, no_heads):
+    r''' Function returns the keras model of no_heads independent copies of
+    the classifier of build_model, stacked with StackedDense layers. Its
+    output has shape (batch, no_heads, 2).
+    '''
+    inputs = tf.keras.Input(shape=(neuron_vector[0],))
+    x = inputs
+    for i in range(1, len(neuron_vector)):
+        x = StackedDense(no_heads, neuron_vector[i], 
+                         activation=activation_vector[i-1])(x)
+    x = StackedDense(no_heads, 2, activation=activation_vector[-1])(x)
+
+    return tf.keras.Model(inputs, x)
+
+def loss():
+    r''' Function returns the loss used to train the classifiers.
+    '''
+    return tf.keras.losses.SparseCategoricalCrossentropy(from_logits=True)
+
+def early_stopping(patience, min_delta):
+    r''' Function returns the keras callback stopping the training when the
+    accuracy reaches a plateau.
+    '''
+    return tf.keras.callbacks.EarlyStopping(monitor='accuracy', 
+                                            patience=patience, 
+                                            min_delta=min_delta)
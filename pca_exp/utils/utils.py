@@ -6,6 +6,9 @@
 
 import numpy as np
 
+# Size in bytes of the chunks processed at once by out-of-core computations.
+CHUNK_BYTES = 2 ** 26
+
 def find_ind_val(array, value):
     r''' Function finds array index of closest value.
 
@@ -16,3 +19,155 @@ def find_ind_val(array, value):
     '''
     ind = np.abs(array - value).argmin()
     return ind
+
+def filter_plan_from_row_errors(row_err):
+    r''' Function finds the row boundaries of bins that equalise the error in
+    each bin. The first row forms its own bin, and every following bin is
+    closed as soon as the sum of the inverse relative squared errors of its
+    rows exceeds one. The last (incomplete) bin is dropped. Only the sums of
+    squared errors of each row are needed, so that they can be accumulated
+    over chunks of measurements.
+
+    Args:
+        row_err: 1D numpy array of sums of squared errors over measurements.
+
+    Returns:
+        1D numpy array of integers (the bin plan) with the row boundaries of
+        consecutive bins, so that bin n covers rows plan[n]:plan[n+1].
+    '''
+    xd = row_err.shape[0]
+
+    if xd < 2:
+        return np.zeros(1, dtype=int)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w = row_err[0] / row_err
+    # A single weight above one closes its bin immediately, so capping keeps
+    # the boundaries and avoids inf/nan in the cumulative sum.
+    w = np.minimum(np.nan_to_num(w, nan=0., posinf=2.), 2.)
+    w[0] = 0.
+    cum_w = np.cumsum(w)
+
+    plan = [0, 1]
+    start = 1
+    while start < xd:
+        stop = np.searchsorted(cum_w, cum_w[start - 1] + 1, side='right')
+        if stop >= xd - 1:
+            break
+        plan.append(stop + 1)
+        start = stop + 1
+
+    return np.array(plan)
+
+def average_rows(plan, X):
+    r''' Function averages the rows of X in each bin of the bin plan.
+
+    Args:
+        plan: 1D numpy array of integers with the row boundaries of bins.
+
+        X: 2D numpy array with indices [i, j], where i runs through x values
+        and j runs through measurements.
+    '''
+    Len1 = np.diff(plan)
+    if Len1.size == 0:
+        return np.empty((0, X.shape[1]))
+
+    return (np.add.reduceat(X[:plan[-1]], plan[:-1], axis=0) 
+            / Len1[np.newaxis].T)
+
+def centres_to_edges(x_0):
+    r''' Function finds bin edges for a (possibly non-uniform) grid of bin
+    centres. Inner edges lie halfway between neighbouring centres and outer
+    edges lie half of the neighbouring spacing away from the end centres.
+
+    Args:
+        x_0: 1D numpy array of at least two increasing bin centres.
+    '''
+    x_0 = np.asarray(x_0, dtype=float)
+    if x_0.size < 2:
+        raise ValueError('At least two bin centres are needed to find edges.')
+
+    mid = (x_0[1:] + x_0[:-1]) / 2
+    return np.r_[x_0[0] - (x_0[1] - x_0[0]) / 2, mid, 
+                 x_0[-1] + (x_0[-1] - x_0[-2]) / 2]
+
+def find_bin_index(x, edges):
+    r''' Function maps each point of x to a bin defined by edges. Bins are
+    half-open [edges[n], edges[n+1]) and points outside all bins are ignored.
+
+    Args:
+        x: 1D numpy array of source x values.
+
+        edges: 1D numpy array of increasing bin edges.
+
+    Returns:
+        Tuple (order, starts, counts), where order holds the indices of the
+        points inside the bins sorted by bin, starts holds the position in
+        order where each non-empty bin begins and counts holds the number of
+        points in every bin.
+    '''
+    bins = np.searchsorted(edges, x, side='right') - 1
+    inside = np.flatnonzero((bins >= 0) & (bins < edges.size - 1))
+
+    order = inside[np.argsort(bins[inside], kind='stable')]
+    counts = np.bincount(bins[inside], minlength=edges.size - 1)
+    starts = (np.cumsum(counts) - counts)[counts > 0]
+
+    return order, starts, counts
+
+def apply_bin_index(index, y, e):
+    r''' Function averages y values and sums errors in quadrature in each bin
+    of the index returned by find_bin_index. Empty bins are set to nan.
+
+    Args:
+        index: tuple (order, starts, counts) returned by find_bin_index.
+
+        y, e: 2D numpy arrays of y values and errors with indices [i, j],
+        where i runs through x values and j runs through measurements.
+
+    Returns:
+        Tuple (y1, e1) of binned y values and errors.
+    '''
+    order, starts, counts = index
+    filled = counts > 0
+    no = counts[filled][np.newaxis].T
+
+    y1 = np.full((counts.size, y.shape[1]), np.nan)
+    e1 = np.full((counts.size, y.shape[1]), np.nan)
+
+    if starts.size:
+        y1[filled] = np.add.reduceat(y[order], starts, axis=0) / no
+        e1[filled] = np.sqrt(np.add.reduceat(e[order] ** 2, starts, 
+                                             axis=0)) / no
+
+    return y1, e1
+
+def quadrature_rows(plan, E):
+    r''' Function sums the errors of the rows of E in quadrature in each bin
+    of the bin plan and divides them by the number of rows, giving the error
+    of the averages of average_rows.
+
+    Args:
+        plan: 1D numpy array of integers with the row boundaries of bins.
+
+        E: 2D numpy array of errors with indices [i, j], where i runs through
+        x values and j runs through measurements.
+    '''
+    Len1 = np.diff(plan)
+    if Len1.size == 0:
+        return np.empty((0, E.shape[1]))
+
+    return (np.sqrt(np.add.reduceat(E[:plan[-1]] ** 2, plan[:-1], axis=0))
+            / Len1[np.newaxis].T)
+
+def iter_chunks(n, size=None):
+    r''' Function yields slices that split range(n) into consecutive chunks.
+
+    Args:
+        n: integer length of the split axis.
+
+        size: integer length of each chunk. A single chunk is used if None.
+    '''
+    size = n if size is None else max(1, size)
+    for start in range(0, n, size):
+        yield slice(start, min(start + size, n))
@@ -0,0 +1,31 @@
+# conftest.py
+
+''' Configuration of the pytest checks of the package. The older scripts of
+this folder plot their results and need the example data, so they are not
+collected.
+'''
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from pca_exp.generate_samples.kubo_toyabe import generateKT
+
+collect_ignore = ['example_tutorial.py', 'test_data_handler.py',
+                  'test_generateKT.py']
+
+@pytest.fixture
+def kt_batch():
+    r''' Batch of 120 Kubo Toyabe curves on 300 time bins with noise growing
+    in time.
+    '''
+    np.random.seed(0)
+    t = np.linspace(0, 12, 300)
+    er = 0.002 * (np.exp(0.2 * t) + 0.001)
+    batch, sig, _ = generateKT(t, 0.26, 0, (0.1, 0.3), (0.1, 0.3), er, 120)
+    return batch, sig
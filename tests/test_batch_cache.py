@@ -0,0 +1,82 @@
+# test_batch_cache.py
+
+''' Checks of the on-disk cache of parsed batches. '''
+
+import os
+
+import numpy as np
+import pytest
+
+from pca_exp.data_handler import DataHandler
+from pca_exp.utils.batch_cache import BatchCache
+
+
+def write_files(folder, n, rows=20):
+    rng = np.random.default_rng(0)
+    for i in range(n):
+        np.savetxt(os.path.join(folder, 'run' + str(i) + '.dat'),
+                   rng.random((rows, 3)))
+    return [os.path.join(folder, 'run' + str(i) + '.dat') for i in range(n)]
+
+def test_key_changes_with_mtime_and_size(tmp_path):
+    paths = write_files(str(tmp_path), 2)
+    cache = BatchCache(str(tmp_path / 'cache'))
+    key = cache.make_key(paths, delimiter=None)
+
+    assert cache.make_key(paths, delimiter=None) == key
+    assert cache.make_key(paths, delimiter=',') != key
+    assert cache.make_key(paths + ['missing.dat']) is None
+
+    st = os.stat(paths[0])
+    os.utime(paths[0], ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    touched = cache.make_key(paths, delimiter=None)
+    assert touched != key
+
+    with open(paths[1], 'a') as f:
+        f.write('0 0 0\n')
+    assert cache.make_key(paths, delimiter=None) not in (key, touched)
+
+def test_hits_misses_and_lru_eviction(tmp_path):
+    batch = np.ones((10, 4, 3))
+    cache = BatchCache(str(tmp_path), max_bytes=2 * batch.nbytes)
+
+    assert cache.get('a') is None
+    cache.put('a', batch)
+    cache.put('b', 2 * batch)
+    assert cache.get('a') is not None
+    cache.put('c', 3 * batch)
+
+    # 'b' was used least recently, so it is evicted to fit 'c'.
+    assert set(cache.index) == {'a', 'c'}
+    assert not os.path.exists(os.path.join(str(tmp_path), 'b.npy'))
+    assert cache.get('b') is None
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'entries': 2,
+                             'bytes': 2 * batch.nbytes}
+
+def test_index_survives_new_instance(tmp_path):
+    batch = np.arange(24.).reshape(2, 4, 3)
+    BatchCache(str(tmp_path)).put('a', batch)
+
+    cache = BatchCache(str(tmp_path), mmap=True)
+    cached = cache.get('a')
+    np.testing.assert_array_equal(cached, batch)
+    assert isinstance(cached, np.memmap)
+    with pytest.raises(ValueError):
+        cached[0, 0, 0] = 1
+
+    cache.invalidate()
+    assert cache.stats()['entries'] == 0
+    assert os.listdir(str(tmp_path)) == ['index.json']
+
+def test_load_batch_uses_cache(tmp_path):
+    folder = tmp_path / 'data'
+    folder.mkdir()
+    write_files(str(folder), 3)
+    cache = BatchCache(str(tmp_path / 'cache'), mmap=False)
+
+    for _ in range(2):
+        dh = DataHandler(cache=cache)
+        dh.load_batch((0, 2), 'run', '.dat', loc=str(folder) + os.sep)
+
+    assert cache.stats()['hits'] == 1
+    assert dh.batches[0].shape == (20, 3, 3)
@@ -0,0 +1,35 @@
+# test_benchmark.py
+
+''' Checks of the benchmark suite on its smallest size. '''
+
+import copy
+
+import pytest
+
+from pca_exp import benchmark
+
+
+def test_run_save_and_compare(tmp_path):
+    results = benchmark.run_suite(['small'], ['prepare_XYE_PCA',
+                                              'perform_pca'],
+                                  repeat=1, verbose=False)
+    assert [r['case'] for r in results['results']] == ['prepare_XYE_PCA',
+                                                       'perform_pca']
+    for res in results['results']:
+        assert res['time'] > 0 and res['peak_bytes'] > 0
+
+    path = str(tmp_path / 'baseline.json')
+    benchmark.save_results(results, path)
+    baseline = benchmark.load_results(path)
+    assert benchmark.compare(results, baseline)[0]['status'] == 'same'
+
+    slower = copy.deepcopy(results)
+    for res in slower['results']:
+        res['time'] = 2 * res['time'] + 1
+        res['peak_bytes'] *= 2
+    assert [r['status'] for r in benchmark.compare(slower, baseline)] == [
+        'slower, more memory'] * 2
+
+def test_unknown_case():
+    with pytest.raises(ValueError):
+        benchmark.run_suite(cases=['fft'], verbose=False)
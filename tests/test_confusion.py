@@ -0,0 +1,82 @@
+# test_confusion.py
+
+''' Checks of the confusion scan of ConfusionMachine and of its NumPy
+networks. '''
+
+import numpy as np
+import pytest
+
+from pca_exp.confusion_machine import ConfusionMachine, confusion_labels
+from pca_exp.utils.mlp import StackedMLP
+
+
+def scan_data(n=60, seed=0):
+    rng = np.random.default_rng(seed)
+    param = rng.uniform(0, 1, n)
+    pcs = np.vstack([param, param ** 2]) + 0.1 * rng.standard_normal((2, n))
+    return pcs, param
+
+def test_confusion_labels():
+    labels = confusion_labels(np.array([0.1, 0.5, 0.9]), [0.3, 0.6])
+    np.testing.assert_array_equal(labels, [[1, 1], [0, 1], [0, 0]])
+
+def test_mlp_gradients_match_finite_differences():
+    rng = np.random.default_rng(1)
+    x = rng.standard_normal((10, 3))
+    labels = rng.integers(0, 2, (10, 2))
+    mlp = StackedMLP([3, 4], ['tanh', None], no_heads=2, seed=1)
+
+    def loss():
+        logits = mlp.forward(x)[-1]
+        logp = logits - np.log(np.sum(np.exp(logits), axis=2, 
+                                      keepdims=True))
+        return -np.sum(np.take_along_axis(logp, labels.T[:,:,np.newaxis],
+                                          axis=2)) / x.shape[0]
+
+    grads, _ = mlp.gradients(x, labels)
+    W = mlp.weights[0][0]
+    h = 1e-6
+    for idx in [(0, 0, 0), (1, 2, 3)]:
+        W[idx] += h
+        up = loss()
+        W[idx] -= 2 * h
+        down = loss()
+        W[idx] += h
+        assert grads[0][0][idx] == pytest.approx((up - down) / (2 * h),
+                                                 rel=1e-5)
+
+def test_numpy_scan_is_seeded_and_reset():
+    pcs, param = scan_data()
+    scans = []
+    for _ in range(2):
+        conf = ConfusionMachine([2, 4], ['relu', None], seed=3)
+        scans.append(conf.perform_confusion_scan(pcs, param, [0.3, 0.5, 0.7],
+                                                 up_to=2, epochs=20))
+
+    assert scans[0] == scans[1]
+    assert len(scans[0]) == 3
+    assert all(0 <= a <= 1 for a in scans[0])
+    model, _ = conf.stacked_models[3]
+    assert conf.stacked_model(3) is model
+    for (W, b), (W0, b0) in zip(model.weights, model.init_weights):
+        np.testing.assert_array_equal(W, W0)
+
+def test_tensorflow_scan_resets_stacked_model():
+    pytest.importorskip('tensorflow')
+    pcs, param = scan_data()
+    conf = ConfusionMachine([2, 4], ['relu', 'softmax'], 
+                            backend='tensorflow')
+
+    acc = conf.perform_confusion_scan(pcs, param, [0.3, 0.5, 0.7], up_to=2,
+                                      epochs=2)
+    model, weights = conf.stacked_models[3]
+    assert len(acc) == 3
+
+    # The trained weights are replaced by the initial ones on reuse.
+    assert conf.stacked_model(3) is model
+    for w, w0 in zip(model.get_weights(), weights):
+        np.testing.assert_array_equal(w, w0)
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        ConfusionMachine([2], ['softmax'], backend='torch')
@@ -0,0 +1,43 @@
+# test_factory.py
+
+''' Checks of the synthetic datasets of generate_samples. '''
+
+import numpy as np
+
+from pca_exp.generate_samples.factory import (sampling_plan, make_dataset,
+                                              load_dataset)
+
+
+def test_load_dataset_reads_listed_shards(tmp_path):
+    t = np.linspace(0, 10, 20)
+    plan = sampling_plan({'sig': (0.1, 0.5), 'Lam': (0.1, 0.5), 'a0': 0.26,
+                          'ab': 0.0}, 'uniform', 30, seed=0)
+    make_dataset(t, plan, 0.01, str(tmp_path), shard_size=10, seed=0,
+                 workers=1)
+    make_dataset(t, plan, 0.01, str(tmp_path), 'kt_b', shard_size=10,
+                 seed=1, workers=1)
+    small = {p: v[:15] for p, v in plan.items()}
+    make_dataset(t, small, 0.01, str(tmp_path), shard_size=20, seed=0,
+                 workers=1)
+
+    _, _, shards, labels = load_dataset(str(tmp_path))
+    assert len(shards) == 1 and shards[0].shape == (20, 15)
+    np.testing.assert_array_equal(labels['sig'], small['sig'])
+
+def test_make_dataset_independent_of_workers(tmp_path):
+    t = np.linspace(0, 10, 20)
+    plan = sampling_plan({'sig': (0.1, 0.5), 'Lam': (0.1, 0.5), 'a0': 0.26,
+                          'ab': 0.0}, 'lhs', 25, seed=2)
+    # Latin hypercube: one sample in each of the 25 strata of every range.
+    np.testing.assert_array_equal(np.sort(np.floor((plan['sig'] - 0.1)
+                                                   / 0.4 * 25)),
+                                  np.arange(25))
+
+    data = []
+    for w in (1, 2):
+        loc = str(tmp_path / str(w))
+        make_dataset(t, plan, 0.01, loc, shard_size=10, seed=3, workers=w)
+        _, _, shards, labels = load_dataset(loc, mmap_mode=None)
+        data.append(np.concatenate(shards, axis=1))
+        np.testing.assert_array_equal(labels['Lam'], plan['Lam'])
+    np.testing.assert_array_equal(data[0], data[1])
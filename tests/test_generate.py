@@ -0,0 +1,86 @@
+# test_generate.py
+
+''' Checks of the Kubo Toyabe generators. '''
+
+import numpy as np
+import pytest
+
+from pca_exp.generate_samples.kubo_toyabe import (generateKT,
+                                                  generateKT_chunks,
+                                                  kubo_toyabe, SEED_BLOCK)
+
+
+T = np.linspace(0, 10, 50)
+ER = 0.01 * (1 + T)
+
+def collect(chunks):
+    parts = list(chunks)
+    return (np.concatenate([y for _, y, _, _ in parts], axis=1),
+            np.concatenate([s for _, _, s, _ in parts]),
+            np.concatenate([l for _, _, _, l in parts]))
+
+def test_generateKT_ranges():
+    t = np.linspace(0, 10, 50)
+    np.random.seed(0)
+    _, sig, Lam = generateKT(t, 0.26, 0, (0.1, 0.2), (1.0, 0.5), 0.01, 500)
+    assert 0.1 <= sig.min() and sig.max() <= 0.3 and sig.max() > 0.25
+    assert 1.0 <= Lam.min() and Lam.max() <= 1.5
+
+    np.random.seed(0)
+    _, sig_mm, Lam_mm = generateKT(t, 0.26, 0, (0.1, 0.3), (1.0, 1.5), 0.01,
+                                   500, ranges='minmax')
+    np.testing.assert_allclose(sig_mm, sig)
+    np.testing.assert_allclose(Lam_mm, Lam)
+
+def test_chunks_independent_of_chunk_size():
+    n = 2 * SEED_BLOCK + 300
+    runs = [collect(generateKT_chunks(T, 0.26, 0.01, (0.1, 0.3), (0.5, 1.0),
+                                      ER, n, chunk_size=size, seed=7)[2])
+            for size in (n, SEED_BLOCK, 700, 97)]
+    for run in runs[1:]:
+        for a, b in zip(run, runs[0]):
+            np.testing.assert_array_equal(a, b)
+
+    other = collect(generateKT_chunks(T, 0.26, 0.01, (0.1, 0.3), (0.5, 1.0),
+                                      ER, n, seed=8)[2])
+    assert not np.array_equal(other[0], runs[0][0])
+
+def test_chunks_out_memmap_and_float32(tmp_path):
+    n = 250
+    out = np.lib.format.open_memmap(str(tmp_path / 'kt.npy'), mode='w+',
+                                    dtype=np.float32, shape=(T.size, n))
+    t, e, chunks = generateKT_chunks(T, 0.26, 0, (0.1, 0.3), (0.5, 1.0), ER,
+                                     n, chunk_size=60, seed=1,
+                                     dtype=np.float32, out=out)
+    assert t.dtype == e.dtype == np.float32
+    for sl, y, sig, Lam in chunks:
+        assert y.dtype == sig.dtype == np.float32
+        assert np.shares_memory(y, out)
+    out.flush()
+
+    y, _, _ = collect(generateKT_chunks(T, 0.26, 0, (0.1, 0.3), (0.5, 1.0),
+                                        ER, n, seed=1, dtype=np.float32)[2])
+    np.testing.assert_array_equal(np.load(str(tmp_path / 'kt.npy')), y)
+
+@pytest.mark.parametrize('ranges', ['width', 'minmax'])
+def test_chunks_match_generateKT(ranges):
+    sig, Lam = (0.1, 0.3), (0.5, 1.0)
+    np.random.seed(3)
+    batch, sig_0, Lam_0 = generateKT(T, 0.26, 0.01, sig, Lam, 0.0, 400,
+                                     ranges=ranges)
+    _, _, chunks = generateKT_chunks(T, 0.26, 0.01, sig, Lam, 0.0, 400,
+                                     seed=3, ranges=ranges)
+    _, sig_1, Lam_1 = collect(chunks)
+
+    # Both generators draw the parameters from the same ranges.
+    for p0, p1, (lo, b) in ((sig_0, sig_1, sig), (Lam_0, Lam_1, Lam)):
+        hi = lo + b if ranges == 'width' else b
+        for p in (p0, p1):
+            assert lo <= p.min() and p.max() <= hi
+            assert p.max() - p.min() > 0.9 * (hi - lo)
+
+    # Without noise, the curves of the same parameters are equal.
+    y = collect(generateKT_chunks(T, 0.26, 0.01, sig_0, Lam_0, 0.0)[2])[0]
+    np.testing.assert_allclose(y, batch[:,:,1], rtol=1e-12)
+    np.testing.assert_allclose(y, kubo_toyabe(T, sig_0, Lam_0, 0.26, 0.01),
+                               rtol=1e-12)
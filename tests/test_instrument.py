@@ -0,0 +1,59 @@
+# test_instrument.py
+
+''' Checks of the instrumented stages of utils.instrument. '''
+
+import csv
+import io
+
+import pytest
+
+from pca_exp.data_handler import DataHandler
+from pca_exp.pca_machine import PCAMachine
+from pca_exp.utils import instrument
+from pca_exp.utils.instrument import Profiler, stage, quiet
+
+
+@stage('fails')
+def _fails():
+    raise RuntimeError('stage failed')
+
+@stage('outer')
+def _outer():
+    return _inner()
+
+@stage('inner')
+def _inner():
+    return 1
+
+def test_raising_stage_leaves_no_frame():
+    with Profiler(memory=True) as prof:
+        with pytest.raises(RuntimeError):
+            _fails()
+        assert instrument._state['stack'] == []
+        _outer()
+
+    assert [(r.stage, r.depth) for r in prof.records] == [('inner', 1),
+                                                          ('outer', 0)]
+
+def test_profiler_records_pca_quietly(kt_batch, capsys):
+    batch, _ = kt_batch
+    dh = DataHandler()
+    dh.load_batch_from_array(batch)
+    dh.prepare_XYE_PCA()
+    machine = PCAMachine(dh)
+
+    # Without a profiler the stages only call the functions.
+    with quiet():
+        machine.perform_pca(n_components=3)
+    with Profiler(memory=False, quiet=True) as prof:
+        machine.perform_pca(n_components=3)
+    assert capsys.readouterr().out == ''
+
+    rec = [r for r in prof.records if r.stage == 'PCAMachine.perform_pca']
+    assert len(rec) == 1 and rec[0].depth == 0
+    assert rec[0].shapes['components'] == machine.results[1].components.shape
+    assert rec[0].peak_bytes is None
+    assert prof.totals()['PCAMachine.perform_pca']['calls'] == 1
+
+    rows = list(csv.DictReader(io.StringIO(prof.to_csv())))
+    assert [row['stage'] for row in rows] == [r.stage for r in prof.records]
@@ -0,0 +1,67 @@
+# test_live.py
+
+''' Checks of the live mode of LiveSession. '''
+
+import os
+
+import numpy as np
+import pytest
+
+from pca_exp.live import LiveSession
+from pca_exp.utils import loaders
+
+
+def write_runs(loc, batch, runs, rows=None, shift=0.0):
+    for j in runs:
+        run = batch[:rows,j,:].copy()
+        run[:,0] += shift
+        np.savetxt(os.path.join(loc, 'run' + str(j) + '.dat'), run)
+
+def test_poll_reports_mismatched_runs(kt_batch, tmp_path, monkeypatch):
+    batch, _ = kt_batch
+    loc = str(tmp_path)
+    parsed = []
+    parse = loaders.parse_columns
+    monkeypatch.setattr(loaders, 'parse_columns',
+                        lambda path, *args: parsed.append(path)
+                        or parse(path, *args))
+
+    write_runs(loc, batch, range(6))
+    session = LiveSession(loc, 'run', '.dat', n_components=3, settle=0)
+    assert len(session.poll()) == 6
+
+    # A short run ahead of good ones, a run with shifted x values and a file
+    # that cannot be parsed.
+    write_runs(loc, batch, [6], rows=200)
+    write_runs(loc, batch, [7, 8])
+    write_runs(loc, batch, [9], shift=0.01)
+    with open(os.path.join(loc, 'run10.dat'), 'w') as f:
+        f.write('not a number\n')
+    parsed.clear()
+
+    assert session.poll() == ['run7.dat', 'run8.dat']
+    assert len(parsed) == 5
+    assert set(session.errors) == {os.path.join(loc, 'run' + str(j) + '.dat')
+                                   for j in (6, 9, 10)}
+    assert 'Shape (200, 3)' in session.errors[os.path.join(loc, 'run6.dat')]
+    assert session.runs == list(range(6)) + [7, 8]
+
+    assert session.poll() == []
+    assert len(session.errors) == 3
+
+def test_checkpoint_settings_include_parsing(kt_batch, tmp_path):
+    batch, _ = kt_batch
+    loc = str(tmp_path / 'runs')
+    os.makedirs(loc)
+    write_runs(loc, batch, range(4))
+    check = str(tmp_path / 'check')
+
+    session = LiveSession(loc, 'run', '.dat', check, n_components=2,
+                          settle=0)
+    session.poll()
+    restored = LiveSession(loc, 'run', '.dat', check, n_components=2,
+                           settle=0)
+    assert restored.runs == session.runs
+
+    with pytest.raises(ValueError):
+        LiveSession(loc, 'run', '.dat', check, n_components=2, skiprows=1)
@@ -0,0 +1,115 @@
+# test_loaders.py
+
+''' Checks of the parser of the measurement files and the batch loader. '''
+
+import os
+
+import numpy as np
+import pytest
+
+from pca_exp.utils.loaders import (BatchLoadError, PROCESS_MIN_FILES,
+                                   load_files, parse_columns)
+
+
+TABLE = np.arange(60.).reshape(20, 3) / 7
+
+def write(folder, name, text):
+    path = os.path.join(str(folder), name)
+    with open(path, 'w') as f:
+        f.write(text)
+    return path
+
+def table_text(table=TABLE, delimiter=' '):
+    return '\n'.join(delimiter.join(repr(float(v)) for v in row)
+                     for row in table)
+
+def write_tables(folder, n):
+    return [write(folder, 'run' + str(j) + '.dat', table_text(TABLE + j))
+            for j in range(n)]
+
+@pytest.mark.parametrize('text, kwargs', [
+    (table_text(), {}),
+    (table_text(delimiter=',') + '\n', {'delimiter': ','}),
+    ('x y e\nunits\n' + table_text(), {'skiprows': 2}),
+    ('# header\n' + table_text().replace('\n', ' # note\n', 3), {}),
+    ('\n\n' + table_text(delimiter='\t') + '\n\n', {}),
+], ids=['plain', 'delimiter', 'skiprows', 'comments', 'blank lines'])
+def test_parse_columns_matches_loadtxt(tmp_path, text, kwargs):
+    path = write(tmp_path, 'a.dat', text)
+    expected = np.loadtxt(path, ndmin=2, **kwargs)
+
+    np.testing.assert_array_equal(parse_columns(path, **kwargs), expected)
+    np.testing.assert_array_equal(expected, TABLE)
+
+def test_parse_columns_falls_back_to_loadtxt(tmp_path):
+    single = write(tmp_path, 'single.dat', '1 2 3\n')
+    np.testing.assert_array_equal(parse_columns(single), [[1, 2, 3]])
+
+    # The token count is a multiple of the columns, but the rows differ in
+    # length, so the file is passed to np.loadtxt, which rejects it.
+    ragged = write(tmp_path, 'ragged.dat', '1 2 3\n4 5\n6 7 8 9\n')
+    with pytest.raises(ValueError):
+        parse_columns(ragged)
+
+def test_errors_are_collected(tmp_path):
+    paths = write_tables(tmp_path, 4)
+    write(tmp_path, 'run1.dat', '1 2 3\n4 5\n')
+    paths[2] = os.path.join(str(tmp_path), 'missing.dat')
+
+    with pytest.raises(BatchLoadError) as info:
+        load_files(paths, workers=1)
+
+    assert set(info.value.errors) == {paths[1], paths[2]}
+    assert 'Could not load 2 file(s)' in str(info.value)
+    assert 'FileNotFoundError' in info.value.errors[paths[2]]
+
+    batch, errors = load_files(paths, workers=1, skip=True)
+    assert set(errors) == {paths[1], paths[2]}
+    np.testing.assert_array_equal(batch[:,0], TABLE)
+    np.testing.assert_array_equal(batch[:,1], TABLE + 3)
+
+    assert load_files(paths[1:3], skip=True)[0] is None
+
+def test_shape_mismatch(tmp_path):
+    paths = write_tables(tmp_path, 3)
+    write(tmp_path, 'run2.dat', table_text(TABLE[:-1]))
+
+    with pytest.raises(BatchLoadError) as info:
+        load_files(paths, workers=1)
+    assert info.value.errors == {paths[2]: 'Shape (19, 3) differs from '
+                                           + '(20, 3).'}
+
+    with pytest.raises(BatchLoadError) as info:
+        load_files(paths, workers=1, shape=(19, 3))
+    assert set(info.value.errors) == set(paths[:2])
+    assert info.value.errors[paths[0]] == ('Shape (20, 3) differs from '
+                                           + '(19, 3).')
+
+def test_out_and_alloc(tmp_path):
+    paths = write_tables(tmp_path, 3)
+
+    out = np.lib.format.open_memmap(str(tmp_path / 'out.npy'), mode='w+',
+                                    shape=(20, 3, 3))
+    assert load_files(paths, workers=1, out=out) is out
+
+    shapes = []
+    def alloc(shape):
+        shapes.append(shape)
+        return np.zeros(shape, dtype=np.float32)
+    batch = load_files(paths, workers=1, alloc=alloc)
+
+    assert shapes == [(20, 3, 3)]
+    assert batch.dtype == np.float32
+    for j in range(3):
+        np.testing.assert_array_equal(out[:,j], TABLE + j)
+        np.testing.assert_allclose(batch[:,j], TABLE + j, rtol=1e-6)
+
+@pytest.mark.parametrize('executor', ['auto', 'thread', 'process'])
+def test_executors_agree(tmp_path, executor):
+    paths = write_tables(tmp_path, PROCESS_MIN_FILES)
+
+    batch = load_files(paths, workers=2, executor=executor)
+
+    np.testing.assert_array_equal(batch, load_files(paths, workers=1))
+    with pytest.raises(ValueError):
+        load_files(paths, workers=2, executor='fork')
@@ -0,0 +1,86 @@
+# test_models.py
+
+''' Checks of the relaxation models and of their cached tables. '''
+
+import os
+
+import numpy as np
+import pytest
+
+from pca_exp.generate_samples import models
+from pca_exp.generate_samples.kubo_toyabe import kubo_toyabe
+
+
+T = np.linspace(0, 20, 400)
+SIG = 0.5
+
+@pytest.fixture(scope='module', autouse=True)
+def tables(tmp_path_factory):
+    r''' Tables of the models computed once into a temporary folder instead
+    of the user cache.
+    '''
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(models, 'TABLE_DIR', str(tmp_path_factory.mktemp('t')))
+        mp.setattr(models, '_tables', {})
+        yield models.TABLE_DIR
+
+def deviation(model, reference, **params):
+    return np.max(np.abs(models.get_model(model)(T, **params) - reference))
+
+def test_kt_matches_kubo_toyabe():
+    sig = np.array([0.1, 0.3, 0.5])
+    Lam = np.array([0.2, 0.0, 0.1])
+
+    np.testing.assert_allclose(models.KT(T, a0=0.26, ab=0.01, sig=sig,
+                                         Lam=Lam),
+                               kubo_toyabe(T, sig, Lam, 0.26, 0.01),
+                               rtol=1e-12)
+
+def test_dynamic_kt_slow_limit():
+    static = models.static_kt(T[np.newaxis].T, SIG)
+
+    errors = [deviation('dynamic_kt', static, sig=SIG, nu=nu)
+              for nu in (1e-1, 1e-2, 0)]
+
+    assert errors[0] > errors[1] > errors[2]
+    assert errors[2] < 1e-4
+
+def test_dynamic_kt_motional_narrowing():
+    # The table covers nu / sig <= Q_MAX = 20, the Abragam formula above.
+    errors = [deviation('dynamic_kt',
+                        np.exp(-2 * SIG ** 2 * T / nu)[np.newaxis].T,
+                        sig=SIG, nu=nu)
+              for nu in SIG * np.array([5, 10, 19, 40, 100])]
+
+    assert all(np.diff(errors) < 0)
+    assert errors[-1] < 1e-3
+
+def test_lf_kt_limits():
+    static = models.static_kt(T[np.newaxis].T, SIG)
+
+    assert deviation('lf_kt', static, sig=SIG, B=0) < 1e-4
+    assert deviation('lf_kt', static, sig=SIG, B=1e-3) < 1e-4
+    assert deviation('lf_kt', 1, sig=SIG, B=1e4) < 1e-5
+
+def test_tables_are_cached(tables, monkeypatch):
+    models.get_model('dynamic_kt')(T, sig=SIG, nu=1)
+    assert any(name.startswith('dynamic_kt_') for name in os.listdir(tables))
+
+    def fail():
+        raise AssertionError('The table was computed again.')
+
+    monkeypatch.setattr(models, '_dynamic_kt_table', fail)
+    first = models.get_model('dynamic_kt')(T, sig=SIG, nu=1)
+
+    # A new session reads the table from the folder.
+    monkeypatch.setattr(models, '_tables', {})
+    np.testing.assert_array_equal(
+        models.get_model('dynamic_kt')(T, sig=SIG, nu=1), first)
+
+    calls = []
+    def build():
+        calls.append(1)
+        return np.zeros(3)
+    for n in (3, 3, 4):
+        models.load_table('demo', build, n=n)
+    assert len(calls) == 2
@@ -0,0 +1,40 @@
+# test_parallel.py
+
+''' Checks of the process pools of the package. '''
+
+import os
+
+import numpy as np
+
+from pca_exp.utils.scheduler import SpawnPool
+
+
+def test_spawn_pool_sets_blas_threads_of_workers_only():
+    old = os.environ.get('OMP_NUM_THREADS')
+    with SpawnPool(2, blas=3) as pool:
+        futures = [pool.submit(os.getenv, 'OMP_NUM_THREADS')
+                   for _ in range(6)]
+        assert os.environ.get('OMP_NUM_THREADS') == old
+        assert [f.result() for f in futures] == ['3'] * 6
+        assert list(pool.map(os.getenv, ['OMP_NUM_THREADS'] * 3)) == ['3'] * 3
+
+def test_confusion_parallel_independent_of_workers():
+    from pca_exp.confusion_machine import ConfusionMachine
+
+    rng = np.random.default_rng(0)
+    param = rng.uniform(0, 1, 80)
+    pcs = np.vstack([param, param ** 2]) + 0.1 * rng.standard_normal((2, 80))
+    conf = ConfusionMachine([2, 4], ['relu', 'softmax'], seed=3)
+
+    # Callbacks run with the BLAS variables of this process.
+    old = os.environ.get('OMP_NUM_THREADS')
+    seen = []
+    callback = lambda j, acc: seen.append(os.environ.get('OMP_NUM_THREADS'))
+
+    res = [conf.perform_confusion_parallel(pcs, param, [0.3, 0.5, 0.7],
+                                           up_to=2, n_seeds=2, workers=w,
+                                           blas=2, callback=callback,
+                                           epochs=5)
+           for w in (1, 2)]
+    np.testing.assert_array_equal(res[0]['acc'], res[1]['acc'])
+    assert seen == [old] * 6
@@ -0,0 +1,213 @@
+# test_pca.py
+
+''' Checks of the SVD solvers and of the results of PCAMachine. '''
+
+import numpy as np
+import pytest
+
+from pca_exp.data_handler import DataHandler
+from pca_exp.pca_machine import PCAMachine
+from pca_exp.utils.solvers import (svd, weighted_svd, weighted_als,
+                                   tiled_snapshot_pca)
+
+
+@pytest.fixture
+def prepared(kt_batch):
+    batch, _ = kt_batch
+    dh = DataHandler()
+    dh.load_batch_from_array(batch)
+    dh.prepare_XYE_PCA()
+    return dh
+
+def low_rank(n_x, n_y, rank=6, seed=0):
+    r''' Function returns a centred matrix of a given rank with well
+    separated singular values, plus weak noise.
+    '''
+    rng = np.random.default_rng(seed)
+    U = np.linalg.qr(rng.standard_normal((n_x, rank)))[0]
+    V = np.linalg.qr(rng.standard_normal((n_y, rank)))[0]
+    z = (U * 2.0 ** -np.arange(rank)) @ V.T * 10
+    z += 1e-6 * rng.standard_normal((n_x, n_y))
+    return z - z.mean(axis=1, keepdims=True)
+
+@pytest.mark.parametrize('solver', ['gram', 'randomized', 'lanczos'])
+@pytest.mark.parametrize('shape', [(60, 400), (400, 60)])
+def test_solvers_agree_with_economy(solver, shape):
+    z = low_rank(*shape)
+    U0, s0, Vt0 = svd(z, 4, 'economy')
+    U, s, Vt = svd(z, 4, solver, random_state=0)
+
+    np.testing.assert_allclose(s, s0, rtol=1e-8)
+    # Singular vectors are equal up to their sign.
+    np.testing.assert_allclose(np.abs(np.sum(U * U0, axis=0)), 1, atol=1e-8)
+    np.testing.assert_allclose(U * s @ Vt, U0 * s0 @ Vt0, atol=1e-8)
+
+def test_explained_variance_of_truncated_result(prepared):
+    machine = PCAMachine(prepared)
+    machine.perform_pca()
+    machine.perform_pca(n_components=4, solver='randomized',
+                        random_state=0)
+    full, trunc = machine.results
+
+    np.testing.assert_allclose(trunc.explained_variance(),
+                               full.explained_variance()[:4], rtol=1e-6)
+    assert np.sum(full.explained_variance()) == pytest.approx(1)
+    assert np.sum(trunc.explained_variance()) < 0.999
+
+def test_scree_is_share_of_total_variance(prepared, capsys):
+    machine = PCAMachine(prepared)
+    machine.perform_pca(n_components=3)
+    result = machine.results[0]
+    z = prepared.prepared_data[0][0] - result.mean
+
+    share = result.sing ** 2 / np.sum(z ** 2)
+    np.testing.assert_allclose(result.explained_variance(), share,
+                               rtol=1e-10)
+    assert str(int(100 * share[0])) + '% ^' in capsys.readouterr().out
+
+def test_auto_solver_keeps_economy_curves(prepared):
+    n_x, n_y = prepared.prepared_data[0][0].shape
+    machine = PCAMachine(prepared)
+    machine.perform_pca()
+    machine.perform_pca(solver='full')
+    economy, full = machine.results
+
+    assert economy.components.shape == (n_x, min(n_x, n_y))
+    assert full.components.shape == (n_x, n_x)
+    np.testing.assert_allclose(np.abs(full.components[:,:3]),
+                               np.abs(economy.components[:,:3]), atol=1e-8)
+
+def test_incremental_agrees_with_perform_pca(prepared):
+    a = prepared.prepared_data[0][0]
+    machine = PCAMachine(prepared)
+    machine.perform_pca()
+    for sl in (slice(0, 50), slice(50, 51), slice(51, 120)):
+        machine.partial_fit(a[:,sl])
+    machine.finalize()
+    full, inc = machine.results
+
+    k = 5
+    np.testing.assert_allclose(inc.sing[:k], full.sing[:k], rtol=1e-8)
+    np.testing.assert_allclose(inc.mean, full.mean, rtol=1e-12)
+    np.testing.assert_allclose(np.abs(inc.scores[:k]),
+                               np.abs(full.scores[:k]), atol=1e-8)
+    assert inc.total_variance() == pytest.approx(full.total_variance())
+
+def test_turn_pc_into_2D_keeps_result_flat():
+    from pca_exp.data_handler_2D import DataHandler2D
+
+    rng = np.random.default_rng(1)
+    stack = rng.standard_normal((30, 8, 6))
+    dh = DataHandler2D()
+    dh.load_batch_from_array(stack)
+    machine = PCAMachine(dh)
+    machine.perform_pca_2D(n_components=3)
+
+    av, images = machine.turn_pc_into_2D(8)
+    assert av.shape == (8, 6) and images.shape == (8, 6, 3)
+    assert machine.pc_av[0].shape == (48, 1)
+    assert machine.pc_curves[0].shape == (48, 3)
+
+    pixels = stack.reshape(30, 48).T
+    scores = machine.transform(pixels)
+    np.testing.assert_allclose(scores, machine.pc_scores[0], atol=1e-10)
+    assert machine.inverse_transform(scores).shape == (48, 30)
+
+def test_tiled_snapshot_matches_svd():
+    rng = np.random.default_rng(4)
+    stack = rng.standard_normal((25, 9, 7))
+    av, images, s, scores = tiled_snapshot_pca(stack, 4, tile=2)
+
+    a = stack.reshape(25, 63).T
+    z = a - a.mean(axis=1, keepdims=True)
+    U, s0, Vt = svd(z, 4, 'economy')
+    np.testing.assert_allclose(av, a.mean(axis=1).reshape(9, 7), atol=1e-12)
+    np.testing.assert_allclose(s, s0, rtol=1e-8)
+    signs = np.sign(np.sum(images.reshape(63, 4) * U, axis=0))
+    np.testing.assert_allclose(images.reshape(63, 4) * signs, U, atol=1e-8)
+    np.testing.assert_allclose(scores * signs[np.newaxis].T,
+                               s0[np.newaxis].T * Vt, atol=1e-8)
+
+def test_max_results(prepared):
+    with pytest.raises(ValueError):
+        PCAMachine(prepared, max_results=0)
+
+    machine = PCAMachine(prepared, max_results=1)
+    machine.perform_pca(n_components=2)
+    machine.perform_pca(n_components=3)
+    assert machine.results[0] is None
+    assert machine.pc_sing[1].size == 3
+
+def test_transform_round_trip(prepared):
+    machine = PCAMachine(prepared)
+    machine.perform_pca()
+    a = prepared.prepared_data[0][0]
+    result = machine.results[0]
+
+    scores = machine.transform(a, chunk=7)
+    np.testing.assert_allclose(scores, result.scores, atol=1e-10)
+    # A raw batch is binned with the plan of the prepared data.
+    np.testing.assert_allclose(machine.transform(0), scores, atol=1e-10)
+    np.testing.assert_allclose(machine.inverse_transform(scores, chunk=7), a,
+                               atol=1e-10)
+    assert machine.transform(a, n_components=2).shape == (2, a.shape[1])
+
+def test_bootstrap_independent_of_workers(prepared):
+    machine = PCAMachine(prepared)
+    machine.perform_pca(n_components=3)
+
+    for method in ('noise', 'measurements'):
+        res = [machine.bootstrap(n_components=3, n_boot=8, method=method,
+                                 workers=w, seed=5) for w in (1, 2)]
+        for name in ('curves', 'sing', 'scores'):
+            np.testing.assert_array_equal(res[0][name], res[1][name])
+        assert not np.isnan(res[0]['sing']).any()
+
+def test_bootstrap_rejects_other_results(prepared):
+    machine = PCAMachine(prepared)
+    machine.perform_weighted_pca(n_components=3)
+    with pytest.raises(ValueError):
+        machine.bootstrap(n_boot=2, workers=1)
+
+    from pca_exp.data_handler_2D import DataHandler2D
+
+    dh = DataHandler2D()
+    dh.load_batch_from_array(np.random.default_rng(1).standard_normal(
+        (10, 4, 3)))
+    machine = PCAMachine(dh)
+    machine.perform_pca_2D(n_components=2)
+    with pytest.raises(ValueError):
+        machine.bootstrap(n_boot=2, workers=1, method='noise')
+    res = machine.bootstrap(n_components=2, n_boot=2, workers=1,
+                            method='measurements')
+    assert res['curves'].shape == (2, 12, 2)
+
+def test_weighted_pca_with_uniform_errors(prepared):
+    machine = PCAMachine(prepared)
+    n_x = prepared.prepared_data[0][0].shape[0]
+    machine.perform_pca(n_components=4)
+    machine.perform_weighted_pca(n_components=4, errors=np.full(n_x, 0.3))
+    plain, weighted = machine.results
+
+    np.testing.assert_allclose(weighted.sing, plain.sing, rtol=1e-8)
+    np.testing.assert_allclose(weighted.mean, plain.mean, rtol=1e-12)
+    signs = np.sign(np.sum(weighted.components * plain.components, axis=0))
+    np.testing.assert_allclose(weighted.components * signs,
+                               plain.components, atol=1e-8)
+    np.testing.assert_allclose(weighted.scores * signs[np.newaxis].T,
+                               plain.scores, atol=1e-8)
+
+def test_weighted_als_matches_weighted_svd_for_separable_weights():
+    rng = np.random.default_rng(2)
+    z = low_rank(80, 50, rank=4, seed=2) + 0.01 * rng.standard_normal(
+        (80, 50))
+    row_w = rng.uniform(0.5, 2, 80)
+    col_w = rng.uniform(0.5, 2, 50)
+
+    U0, s0, Vt0 = weighted_svd(z, row_w, col_w, 3, 'economy')
+    U, s, Vt, n_iter = weighted_als(z, np.outer(row_w ** 2, col_w ** 2), 3,
+                                    max_iter=500, tol=1e-14)
+
+    assert n_iter < 500
+    np.testing.assert_allclose(s, s0, rtol=1e-6)
+    np.testing.assert_allclose(U * s @ Vt, U0 * s0 @ Vt0, atol=1e-6)
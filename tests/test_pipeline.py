@@ -0,0 +1,83 @@
+# test_pipeline.py
+
+''' Checks of the preprocessing Pipeline against the DataHandler steps. '''
+
+import gc
+import os
+
+import numpy as np
+import pytest
+
+from pca_exp.data_handler import DataHandler
+from pca_exp.pipeline import Pipeline
+
+
+@pytest.fixture
+def two_batches(kt_batch):
+    batch, _ = kt_batch
+    return batch.copy(), batch[::2].copy()
+
+def test_batch_ind_selects_batches(two_batches):
+    base = Pipeline()
+    for batch in two_batches:
+        base = base.load_array(batch)
+    x_0 = np.linspace(0.1, 11.9, 40)
+
+    for ind in (0, [0], 1, [1]):
+        sliced = base.slice(x_vals=(0.5, 10), batch_ind=ind).batches()
+        binned = base.bin(x_0, batch_ind=ind).batches()
+        target = ind if isinstance(ind, int) else ind[0]
+        for b, batch in enumerate(two_batches):
+            dh = DataHandler()
+            dh.load_batch_from_array(batch)
+            if b == target:
+                dh.slice_batch(0, x_vals=(0.5, 10))
+            np.testing.assert_array_equal(sliced[b], dh.batches[0])
+
+            dh = DataHandler()
+            dh.load_batch_from_array(batch)
+            if b == target:
+                dh.bin_data(x_0)
+            np.testing.assert_array_equal(binned[b], dh.batches[0])
+
+def test_store_keeps_inputs_writeable(two_batches):
+    batch = two_batches[0]
+    pipe = Pipeline().load_array(batch).bin(np.linspace(0.1, 11.9, 40))
+    pipe = pipe.prepare()
+
+    prepared = pipe.prepared()
+    assert batch.flags.writeable
+    assert not prepared.flags.writeable
+    assert not pipe.batches()[0].flags.writeable
+    assert np.shares_memory(Pipeline().load_array(batch).batches()[0], batch)
+
+def test_filter_plan_matches_filter_data(two_batches):
+    base = Pipeline()
+    dh = DataHandler()
+    for batch in (two_batches[0], two_batches[0][:,::3]):
+        base = base.load_array(batch)
+        dh.load_batch_from_array(batch)
+
+    plan = dh.filter_data([0, 1], return_plan=True)[-1]
+    np.testing.assert_array_equal(dh.filter_plan([0, 1]), plan)
+    np.testing.assert_array_equal(base.filter().plan(), plan)
+
+def test_mmap_handlers_live_while_stored(two_batches, tmp_path):
+    pipe = Pipeline(storage='mmap', storage_dir=str(tmp_path))
+    pipe = pipe.load_array(two_batches[0]).bin(np.linspace(0.1, 11.9, 40))
+    pipe = pipe.prepare()
+    expected = np.array(pipe.prepared())
+
+    gc.collect()
+    files = [arr.filename for arr in (pipe.batches()[0], pipe.prepared())]
+    assert all(os.path.exists(path) for path in files)
+
+    dh = pipe.data_handler()
+    pipe.store.clear()
+    gc.collect()
+    assert all(os.path.exists(path) for path in files)
+    np.testing.assert_array_equal(dh.prepared_data[0], expected)
+
+    del dh
+    gc.collect()
+    assert os.listdir(str(tmp_path)) == []
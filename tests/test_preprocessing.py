@@ -0,0 +1,111 @@
+# test_preprocessing.py
+
+''' Checks of the preprocessing of DataHandler against the loops of the
+first version of the package.
+'''
+
+import numpy as np
+
+from pca_exp.data_handler import DataHandler
+
+
+def loop_filter(batch):
+    r''' Function re-bins one batch with the loop of the first version of
+    DataHandler.filter_data.
+    '''
+    t, A, E = batch[:,:,0], batch[:,:,1], batch[:,:,2]
+    xd, yd = A.shape
+
+    A1 = A[0,:][np.newaxis]
+    E1 = np.array([np.sqrt(np.sum(E[0,:] ** 2) / yd)])
+    Len1 = np.array([1])
+    t1 = t[0,:][np.newaxis]
+    a = np.sum(E[0,:] ** 2)
+
+    Etemp = np.array([])
+    Atemp = np.empty([0, yd])
+    ttemp = np.empty([0, yd])
+    for ii in range(1, xd):
+        Etemp = np.append(Etemp, np.sum(E[ii,:] ** 2 / a))
+        Atemp = np.append(Atemp, A[ii,:][np.newaxis], axis=0)
+        ttemp = np.append(ttemp, t[ii,:][np.newaxis], axis=0)
+        if np.sum(1 / Etemp) > 1 or ii == xd - 1:
+            A1 = np.append(A1, np.mean(Atemp, axis=0)[np.newaxis], axis=0)
+            E1 = np.append(E1, np.sqrt(np.sum(a * Etemp) / yd) / len(Etemp))
+            t1 = np.append(t1, np.mean(ttemp, axis=0)[np.newaxis], axis=0)
+            Len1 = np.append(Len1, Atemp.shape[0])
+            Etemp = np.array([])
+            Atemp = np.empty([0, yd])
+            ttemp = np.empty([0, yd])
+
+    return A1[:-1], E1[:-1], Len1[:-1], t1[:-1]
+
+def test_filter_data_matches_loop(kt_batch):
+    batch, _ = kt_batch
+    dh = DataHandler()
+    dh.load_batch_from_array(batch)
+
+    for new, old in zip(dh.filter_data(), loop_filter(batch)):
+        assert new.shape == old.shape
+        np.testing.assert_allclose(new, old, rtol=1e-12)
+
+def test_filter_data_chunked_and_plan(kt_batch):
+    batch, _ = kt_batch
+    dh = DataHandler(chunk_size=7)
+    dh.load_batch_from_array(batch)
+
+    *res, plan = dh.filter_data(return_plan=True)
+    for new, old in zip(res, loop_filter(batch)):
+        np.testing.assert_allclose(new, old, rtol=1e-12)
+
+    dh.prepare_XYE_PCA(plan=plan)
+    np.testing.assert_allclose(dh.prepared_data[0][0], res[0], rtol=1e-12)
+    np.testing.assert_array_equal(dh.prepared_plans[0], plan)
+
+def loop_bin(batch, x_0):
+    r''' Function bins one batch with the loop of the first version of
+    DataHandler.bin_data, for uniform bin centres x_0.
+    '''
+    dx = x_0[1] - x_0[0]
+    x_1 = batch[:,0,0]
+    out = np.zeros((len(x_0), batch.shape[1], 3))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for h, x_i in enumerate(x_0):
+            idx = (x_1 >= x_i - dx / 2) * (x_1 < x_i + dx / 2)
+            no = batch[idx,:,1].shape[0]
+            out[h,:,1] = np.sum(batch[idx,:,1], axis=0) / no
+            out[h,:,2] = np.sqrt(np.sum(batch[idx,:,2] ** 2, axis=0)) / no
+    out[:,:,0] = x_0[np.newaxis].T
+    return out
+
+def test_bin_data_matches_loop(kt_batch):
+    batch, _ = kt_batch
+    # Centres between the time bins, so no point lies on a bin edge, and
+    # bins past the data, which stay empty.
+    x_0 = np.linspace(0.0101, 13.0101, 120)
+
+    dh = DataHandler(chunk_size=50)
+    dh.load_batch_from_array(batch)
+    dh.bin_data(x_0)
+
+    np.testing.assert_allclose(dh.batches[0], loop_bin(batch, x_0),
+                               rtol=1e-12, equal_nan=True)
+
+def test_bin_data_non_uniform_edges(kt_batch):
+    batch, _ = kt_batch
+    edges = np.array([0.01, 0.5, 0.6, 2.0, 5.5, 11.9])
+
+    dh = DataHandler()
+    dh.load_batch_from_array(batch.copy())
+    dh.load_batch_from_array(batch[::2].copy())
+    dh.bin_data(None, batch_ind=[0, 1], edges=edges)
+
+    for b, source in zip(dh.batches, (batch, batch[::2])):
+        x = source[:,0,0]
+        for n in range(edges.size - 1):
+            idx = (x >= edges[n]) & (x < edges[n + 1])
+            np.testing.assert_allclose(b[n,:,1], source[idx,:,1].mean(0),
+                                       rtol=1e-12)
+            np.testing.assert_allclose(
+                b[n,:,2], np.sqrt(np.sum(source[idx,:,2] ** 2, 0))
+                / idx.sum(), rtol=1e-12)
@@ -0,0 +1,71 @@
+# test_reporting.py
+
+''' Checks of the figures of pca_exp.reporting, drawn without a display. '''
+
+import os
+import sys
+import subprocess
+
+import numpy as np
+import pytest
+
+from pca_exp import reporting
+from pca_exp.data_handler import DataHandler
+from pca_exp.pca_machine import PCAMachine
+
+
+@pytest.fixture
+def machine(kt_batch):
+    batch, sig = kt_batch
+    dh = DataHandler()
+    dh.load_batch_from_array(batch)
+    dh.prepare_XYE_PCA()
+    machine = PCAMachine(dh)
+    machine.perform_pca(n_components=4)
+    machine.perform_pca(n_components=2)
+    return machine, sig
+
+def test_importing_pca_machine_skips_pyplot():
+    code = ('import sys, pca_exp.pca_machine; '
+            + "print('matplotlib.pyplot' in sys.modules, "
+            + "'pca_exp.reporting' in sys.modules)")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, '-c', code], cwd=root, check=True,
+                         capture_output=True, text=True).stdout
+
+    assert out.split() == ['False', 'False']
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_render_reports_writes_files(machine, tmp_path, workers):
+    machine, sig = machine
+    loc = str(tmp_path / 'figures')
+    # Importing TensorFlow in another test loads pyplot as well.
+    pyplot_loaded = 'matplotlib.pyplot' in sys.modules
+
+    paths = reporting.render_reports(machine, [0, 1], sig, param1_name='sig',
+                                     loc=loc, workers=workers)
+    both = machine.save_reports([1], sig, param2=sig ** 2, loc=loc,
+                                name='two', workers=1)
+
+    assert paths == {res_idx: [os.path.join(loc, 'pca_' + str(res_idx) + '_'
+                                            + str(n) + '.png')
+                               for n in (1, 2)] for res_idx in (0, 1)}
+    assert both == {1: [os.path.join(loc, 'two_1_1.png'),
+                        os.path.join(loc, 'two_1_2.png')]}
+    assert sorted(os.listdir(loc)) == sorted(
+        os.path.basename(p) for ps in list(paths.values()) + [both[1]]
+        for p in ps)
+    for path in both[1] + paths[0]:
+        with open(path, 'rb') as f:
+            assert f.read(8) == b'\x89PNG\r\n\x1a\n'
+    assert ('matplotlib.pyplot' in sys.modules) == pyplot_loaded
+
+def test_scree_is_relative_to_total_variance(machine):
+    machine, sig = machine
+    result = machine.results[1]
+    fig, _ = reporting.pca_figures_1(*reporting.report_args(machine, 1), sig,
+                                     total=result.total_variance())
+
+    scree = fig.axes[1].lines[0].get_ydata()
+    np.testing.assert_allclose(scree, 100 * result.explained_variance())
+    assert scree.sum() < 100
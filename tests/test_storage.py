@@ -0,0 +1,50 @@
+# test_storage.py
+
+''' Checks of the memory-mapped storage of DataHandler. '''
+
+import gc
+import os
+
+import numpy as np
+
+from pca_exp.data_handler import DataHandler
+
+
+def test_mmap_matches_memory(kt_batch, tmp_path):
+    batch, _ = kt_batch
+    handlers = [DataHandler(), DataHandler(storage='mmap',
+                                           storage_dir=str(tmp_path),
+                                           chunk_size=17)]
+    for dh in handlers:
+        dh.load_batch_from_array(batch)
+        dh.bin_data(np.linspace(0.1, 11.9, 150))
+        dh.prepare_XYE_PCA()
+
+    assert isinstance(handlers[1].prepared_data[0], np.memmap)
+    np.testing.assert_allclose(handlers[1].prepared_data[0],
+                               handlers[0].prepared_data[0], rtol=1e-12)
+    handlers[1].close()
+
+def test_mmap_files_are_released(kt_batch, tmp_path):
+    batch, _ = kt_batch
+    dh = DataHandler(storage='mmap', storage_dir=str(tmp_path))
+    dh.load_batch_from_array(batch)
+    for n in (200, 150, 100):
+        dh.bin_data(np.linspace(0.1, 11.9, n))
+    dh.filter_data()
+
+    # The loaded batch and the first two binned batches were replaced; the
+    # last batch and the two arrays returned by filter_data remain.
+    assert len(os.listdir(dh.storage_path)) == 3
+
+    path = dh.storage_path
+    dh.close()
+    assert not os.path.exists(path)
+
+    dh = DataHandler(storage='mmap', storage_dir=str(tmp_path))
+    dh.load_batch_from_array(batch)
+    path = dh.storage_path
+    del dh
+    gc.collect()
+    assert not os.path.exists(path)
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,82 @@
+# test_sweep.py
+
+''' Checks of the sweep runner over preprocessing and PCA settings. '''
+
+import csv
+import json
+
+import numpy as np
+import pytest
+
+from pca_exp.pipeline import Pipeline
+from pca_exp.sweep import (COLUMNS, run_sweep, best_rows, save_table)
+
+
+@pytest.fixture
+def base(kt_batch):
+    batch, _ = kt_batch
+    return Pipeline().load_array(batch)
+
+GRID = {'x_vals': [None, (0.5, 10)],
+        'x_0': [None, np.linspace(0.1, 11.9, 100)],
+        'n_components': [3, 1, 2]}
+
+def test_run_sweep_rows(base):
+    table = run_sweep(base, GRID, workers=1)
+
+    assert len(table) == 4 * 3
+    assert [(r['point'], r['n_components']) for r in table] == [
+        (p, n) for p in range(4) for n in (1, 2, 3)]
+    assert all(r['error'] is None for r in table)
+
+    for p in range(4):
+        rows = table[3 * p:3 * p + 3]
+        explained = [r['explained'] for r in rows]
+        rel_error = [r['rel_error'] for r in rows]
+        assert np.all(np.diff(explained) > 0) and explained[-1] <= 1
+        assert np.all(np.diff(rel_error) < 0)
+        np.testing.assert_allclose(rows[-1]['explained'],
+                                   np.sum(rows[-1]['scree']))
+
+    # Bins outside of the cut-offs are dropped.
+    sliced = table[9]
+    assert sliced['x_vals'] == [0.5, 10] and sliced['n_bins'] == 100
+    assert sliced['n_x'] < 100
+
+    best = best_rows(table)
+    assert [r['n_components'] for r in best] == [1, 2, 3]
+    for r in best:
+        assert r['rel_error'] == min(s['rel_error'] for s in table
+                                     if s['n_components'] == r['n_components'])
+
+def test_failed_point_is_recorded(base):
+    grid = {'x_vals': [(0.5, 10), (20, 30)], 'n_components': [1, 2]}
+    table = run_sweep(base, grid, workers=1)
+
+    assert [r['point'] for r in table] == [0, 0, 1]
+    assert table[2]['error'] is not None and table[2]['explained'] is None
+    assert best_rows(table) == table[:2]
+
+def test_save_table_round_trip(base, tmp_path):
+    table = run_sweep(base, {'x_0': [np.linspace(0.1, 11.9, 60)],
+                             'n_components': [1, 2]}, workers=1)
+    path = str(tmp_path / 'sweep.csv')
+    save_table(table, path)
+
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert list(rows[0]) == list(COLUMNS) and len(rows) == len(table)
+    for row, orig in zip(rows, table):
+        assert int(row['n_components']) == orig['n_components']
+        assert float(row['rel_error']) == pytest.approx(orig['rel_error'])
+        assert json.loads(row['scree']) == pytest.approx(orig['scree'])
+        assert row['error'] == ''
+
+def test_run_sweep_in_processes(base):
+    grid = {'x_vals': [None, (0.5, 10)], 'n_components': [2]}
+    local = run_sweep(base, grid, workers=1)
+    pooled = run_sweep(base, grid, workers=None)
+
+    for a, b in zip(local, pooled):
+        for c in ('explained', 'rel_error', 'chi2'):
+            assert a[c] == pytest.approx(b[c], rel=1e-10)